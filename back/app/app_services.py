@@ -3,17 +3,22 @@ from typing import Annotated
 
 from fastapi import Depends
 
+from app.document_catalog import DocumentCatalog
 from app.generator import Generator
 from app.search_engine import SearchEngine
 from app.settings import DepSettings
+from app.table_refresher import TableRefresher
 from common.db_service import DbService
 from common.embedding_service import EmbeddingService
 from common.minio_service import MinioService
 from common.vector_db import VectorDB
 
+# services are singletons: their factories are cached, and keyword only, as FastAPI calls them with keyword arguments
+# (lru_cache caches positional and keyword calls separately, the app would warm up services other than the served ones)
+
 
 @lru_cache
-def get_minio_service(settings: DepSettings) -> MinioService:
+def get_minio_service(*, settings: DepSettings) -> MinioService:
     return MinioService(settings=settings.minio)
 
 
@@ -21,7 +26,7 @@ DepMinioService = Annotated[MinioService, Depends(get_minio_service)]
 
 
 @lru_cache
-def get_db_service(settings: DepSettings) -> DbService:
+def get_db_service(*, settings: DepSettings) -> DbService:
     return DbService(settings=settings.db)
 
 
@@ -29,13 +34,33 @@ DepDbService = Annotated[DbService, Depends(get_db_service)]
 
 
 @lru_cache
-def get_search_engine(settings: DepSettings, db: DepDbService) -> SearchEngine:
+def get_document_catalog(*, settings: DepSettings, db: DepDbService) -> DocumentCatalog | None:
+    if not settings.document_catalog:
+        return None
+    return DocumentCatalog(db, settings.indexer_version, max_pending_events=settings.document_catalog_max_pending)
+
+
+DepDocumentCatalog = Annotated[DocumentCatalog | None, Depends(get_document_catalog)]
+
+
+@lru_cache
+def get_search_engine(*, settings: DepSettings, db: DepDbService, catalog: DepDocumentCatalog) -> SearchEngine:
     embedding_service = EmbeddingService(settings.embedding, settings.embedding__litellm_api_key)
+    vector_db = VectorDB(
+        settings.lance_db,
+        embedding_service.distance_metric(),
+        settings.indexer_version,
+        settings.embedding.dimensions,
+        settings.stage_versions,
+    )
     return SearchEngine(
         embedding_service=embedding_service,
-        vector_db=VectorDB(settings.lance_db, embedding_service.distance_metric(), settings.indexer_version),
+        vector_db=vector_db,
         db=db,
         indexer_version=settings.indexer_version,
+        catalog=catalog,
+        settings=settings.search,
+        table_refresher=TableRefresher(db, vector_db, settings.indexer_version, settings.vector_db_refresh_debounce),
     )
 
 
@@ -43,7 +68,7 @@ DepSearchEngine = Annotated[SearchEngine, Depends(get_search_engine)]
 
 
 @lru_cache
-def get_generator_service(settings: DepSettings) -> Generator:
+def get_generator_service(*, settings: DepSettings) -> Generator:
     return Generator(settings.generator, settings.generator__litellm_api_key)
 
 
@@ -0,0 +1,150 @@
+import asyncio
+import bisect
+import contextlib
+import logging
+
+from common.db_service import DbDocument, DbEventSubscription, DbIndexedDocumentEvent, DbResyncEvent, DbService
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentCatalog:
+    """In-memory copy of the indexed documents of one indexer version.
+    Loaded once, then kept fresh from the indexed_document change feed (full reload on resync).
+    Events are applied in the order they are dispatched, whatever their seq (a change with a lower seq can commit
+    after a higher one): each event carries the state of its document when it was dispatched.
+    Exposes the same read methods as DbService, so it can replace it on the request path."""
+
+    indexer_version: int
+    seq: int  # position in the change feed the catalog is consistent with (cursor of the listener)
+    _db: DbService
+    _max_pending_events: int
+    _uri_to_doc: dict[str, DbDocument]
+    _parsed_hash_to_uris: dict[str, set[str]]
+    _sorted_uris: list[str] | None  # rebuilt lazily for pagination, None when outdated
+    _subscription: DbEventSubscription | None = None
+    _task: asyncio.Task[None] | None = None
+    _start_lock: asyncio.Lock
+
+    def __init__(self, db: DbService, indexer_version: int, max_pending_events: int) -> None:
+        self._db = db
+        self.indexer_version = indexer_version
+        self._max_pending_events = max_pending_events
+        self.seq = 0
+        self._uri_to_doc = {}
+        self._parsed_hash_to_uris = {}
+        self._sorted_uris = None
+        self._start_lock = asyncio.Lock()
+
+    async def start_if_needed(self) -> None:
+        if self._task:
+            return
+        async with self._start_lock:
+            if self._task:
+                return
+            # subscribe before loading, so that no change happening during the load is missed
+            self._subscription = await self._db.listen_to_indexed_documents_changes(
+                self._max_pending_events,
+                self.indexer_version,
+            )
+            await self._load(self._subscription)
+            self._task = asyncio.create_task(self._follow_changes(self._subscription))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._subscription:
+            await self._db.removed_listener_to_indexed_documents_changes(self._subscription)
+            self._subscription = None
+
+    async def _load(self, subscription: DbEventSubscription) -> None:
+        # events dispatched before the snapshot are older than it, they are discarded. Events dispatched from now on
+        # are applied after the snapshot: they may carry a state it already contains, never an older one that is not
+        # followed by another event.
+        subscription.get_pending()
+        seq = self._db.get_dispatched_document_change_seq()
+        docs = await self._db.get_all_documents(self.indexer_version)
+        self._uri_to_doc = {}
+        self._parsed_hash_to_uris = {}
+        for doc in docs:
+            self._add(doc)
+        self._sorted_uris = None
+        self.seq = seq
+        logger.info(f"Document catalog loaded: {len(docs)} documents at change {seq}")
+
+    async def _follow_changes(self, subscription: DbEventSubscription) -> None:
+        while True:
+            event = await subscription.get()
+            try:
+                if isinstance(event, DbResyncEvent):
+                    logger.warning(f"Document catalog missed {event.dropped_events} changes, reloading")
+                    await self._load(subscription)
+                else:
+                    self.apply(event)
+                if not subscription.has_pending_events():
+                    # all the changes dispatched so far are applied
+                    self.seq = self._db.get_dispatched_document_change_seq()
+            except Exception:
+                logger.exception("Error updating document catalog")
+
+    def apply(self, event: DbIndexedDocumentEvent) -> None:
+        if event.indexer_version != self.indexer_version:
+            return
+        self._remove(event.uri)
+        if event.document:
+            self._add(event.document)
+
+    def _add(self, doc: DbDocument) -> None:
+        if doc.uri not in self._uri_to_doc:
+            self._sorted_uris = None
+        self._uri_to_doc[doc.uri] = doc
+        if doc.indexed_content:
+            self._parsed_hash_to_uris.setdefault(doc.indexed_content.parsed_hash, set()).add(doc.uri)
+
+    def _remove(self, uri: str) -> None:
+        doc = self._uri_to_doc.pop(uri, None)
+        if doc is None:
+            return
+        self._sorted_uris = None
+        if doc.indexed_content:
+            uris = self._parsed_hash_to_uris[doc.indexed_content.parsed_hash]
+            uris.discard(uri)
+            if not uris:
+                del self._parsed_hash_to_uris[doc.indexed_content.parsed_hash]
+
+    def _check_version(self, indexer_version: int) -> None:
+        assert indexer_version == self.indexer_version, f"catalog only contains version {self.indexer_version}"
+
+    async def get_documents_from_indexed_parsed_hashes(
+        self,
+        parsed_hashes: list[str],
+        indexer_version: int,
+    ) -> dict[str, DbDocument]:
+        self._check_version(indexer_version)
+        result: dict[str, DbDocument] = {}
+        for parsed_hash in parsed_hashes:
+            uris = self._parsed_hash_to_uris.get(parsed_hash)
+            if uris:
+                result[parsed_hash] = self._uri_to_doc[min(uris)]
+        return result
+
+    async def get_all_documents(self, indexer_version: int) -> list[DbDocument]:
+        self._check_version(indexer_version)
+        return list(self._uri_to_doc.values())
+
+    async def get_documents(self, uris: list[str], indexer_version: int) -> dict[str, DbDocument]:
+        self._check_version(indexer_version)
+        return {uri: self._uri_to_doc[uri] for uri in uris if uri in self._uri_to_doc}
+
+    async def get_documents_page(self, indexer_version: int, after_uri: str | None, limit: int) -> list[DbDocument]:
+        self._check_version(indexer_version)
+        if self._sorted_uris is None:
+            self._sorted_uris = sorted(self._uri_to_doc)
+        start = bisect.bisect_right(self._sorted_uris, after_uri) if after_uri is not None else 0
+        return [self._uri_to_doc[uri] for uri in self._sorted_uris[start : start + limit]]
+
+    async def get_last_document_change_seq(self) -> int:
+        return self.seq
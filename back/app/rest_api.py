@@ -5,15 +5,17 @@ import urllib.parse
 from collections.abc import AsyncGenerator
 from typing import Annotated, Literal
 
-from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, status
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from app.app_services import DepDbService, DepGenerator, DepMinioService, DepSearchEngine
+from app.app_services import DepDbService, DepDocumentCatalog, DepGenerator, DepMinioService, DepSearchEngine
+from app.document_catalog import DocumentCatalog
 from app.generator import ChatMessage
 from app.rest_api_data import (
     ApiChatMessage,
     ApiDocumentDelete,
+    ApiDocumentEventsSubscriberMetrics,
     ApiDocumentSnippet,
     ApiEventType,
     ApiExplorer,
@@ -23,16 +25,26 @@ from app.rest_api_data import (
     ApiPresignedUrlResponse,
     ApiQuery,
     ApiQueryResponseUpdate,
+    ApiResync,
     ApiSearchResult,
     ApiSearchResultChunk,
 )
 from app.search_engine import SearchResult
 from app.settings import DepSettings
-from common.db_service import DbDocument, DbEventType, DbIndexedDocumentEvent
+from common.db_service import (
+    DbDocument,
+    DbEventType,
+    DbIndexedDocumentEvent,
+    DbResyncEvent,
+    DbService,
+    DbSubscriberStats,
+)
 
 router: APIRouter = APIRouter(prefix="/api/v1")
 logger = logging.getLogger(__name__)
 seemantic_drive_prefix = "seemantic_drive/"
+explorer_default_page_size = 1000
+explorer_max_page_size = 10000
 
 
 def get_file_path(relative_path: str) -> str:
@@ -44,6 +56,14 @@ async def root() -> str:
     return "seemantic API says hello!"
 
 
+@router.get("/ready")
+async def ready(request: Request) -> str:
+    """Readiness: services are warmed up (cf. main.lifespan), unlike the root endpoint which only tells it's alive"""
+    if not getattr(request.app.state, "ready", False):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="warming up")
+    return "ready"
+
+
 # Use minio_service to handle upload using presigned URLs
 @router.post("/documents/presigned_url", status_code=status.HTTP_201_CREATED)
 async def get_presigned_url(
@@ -97,12 +117,85 @@ async def get_document(
     raise HTTPException(status_code=400, detail="Unsupported or missing format")
 
 
-@router.get("/explorer")
-async def get_explorer(db_service: DepDbService, settings: DepSettings) -> ApiExplorer:
-    db_docs = await db_service.get_all_documents(settings.indexer_version)
+def _explorer_etag(indexer_version: int, seq: int) -> str:
+    # the explorer content only changes with the change feed
+    return f'W/"{indexer_version}-{seq}"'
+
+
+async def _explorer_source(db_service: DbService, catalog: DocumentCatalog | None) -> DbService | DocumentCatalog:
+    if catalog is None:
+        return db_service
+    await catalog.start_if_needed()
+    return catalog
+
+
+@router.get("/explorer", response_model=ApiExplorer)
+async def get_explorer(  # noqa: PLR0913
+    db_service: DepDbService,
+    catalog: DepDocumentCatalog,
+    settings: DepSettings,
+    response: Response,
+    after: str | None = None,
+    since: int | None = None,
+    limit: Annotated[int, Query(gt=0, le=explorer_max_page_size)] = explorer_default_page_size,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> ApiExplorer | Response:
+    """Page mode (default): documents ordered by uri, paginated with after=.
+    Delta mode (since=): documents changed or deleted after the given seq."""
+    source = await _explorer_source(db_service, catalog)
+    seq = await source.get_last_document_change_seq()
+    etag = _explorer_etag(settings.indexer_version, seq)
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    if since is None:
+        db_docs = await source.get_documents_page(settings.indexer_version, after, limit)
+        return ApiExplorer(
+            documents=[_to_api_doc(doc) for doc in db_docs],
+            seq=seq,
+            next_after=db_docs[-1].uri if len(db_docs) == limit else None,
+        )
+
+    first_seq = await db_service.get_first_document_change_seq()
+    if since < seq and (first_seq is None or since < first_seq - 1):
+        raise HTTPException(status_code=410, detail=f"Changes since {since} were pruned, reload the explorer")
+    # changes after seq are not returned yet: a change with a seq in between may still commit
+    events, fetched_seqs = await db_service.get_document_changes(since, limit, settings.indexer_version, seq)
+    has_more = len(fetched_seqs) == limit
+    return ApiExplorer(
+        documents=[_to_api_doc(event.document) for event in events if event.document],
+        seq=fetched_seqs[-1] if has_more else max(seq, since),
+        deleted_uris=[event.uri for event in events if not event.document],
+        next_since=fetched_seqs[-1] if has_more else None,
+    )
+
+
+@router.get("/explorer/stream")
+async def stream_explorer(
+    db_service: DepDbService,
+    catalog: DepDocumentCatalog,
+    settings: DepSettings,
+) -> StreamingResponse:
+    """All documents as NDJSON (one ApiDocumentSnippet per line, ordered by uri), so the tree renders progressively"""
+    source = await _explorer_source(db_service, catalog)
+    seq = await source.get_last_document_change_seq()
+
+    async def lines_generator() -> AsyncGenerator[str, None]:
+        after: str | None = None
+        while True:
+            db_docs = await source.get_documents_page(settings.indexer_version, after, explorer_default_page_size)
+            for doc in db_docs:
+                yield _to_api_doc(doc).model_dump_json() + "\n"
+            if len(db_docs) < explorer_default_page_size:
+                return
+            after = db_docs[-1].uri
 
-    api_docs = [_to_api_doc(doc) for doc in db_docs]
-    return ApiExplorer(documents=api_docs)
+    return StreamingResponse(
+        lines_generator(),
+        media_type="application/x-ndjson",
+        headers={"ETag": _explorer_etag(settings.indexer_version, seq), "X-Explorer-Seq": str(seq)},
+    )
 
 
 def _to_api_search_result(search_result: SearchResult) -> ApiSearchResult:
@@ -186,24 +279,48 @@ def _to_api_event_type(db_event_type: DbEventType) -> ApiEventType:
     return "delete" if db_event_type == "delete" else "update"
 
 
-def _to_sse_event(event_type: str, data: BaseModel) -> str:
-    return f"event: {event_type}\ndata: {data.model_dump_json()}\n\n"
+def _to_sse_event(event_type: str, data: BaseModel, event_id: int | None = None) -> str:
+    # id is sent back by the client in the Last-Event-ID header when it reconnects
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"event: {event_type}\ndata: {data.model_dump_json()}\n{id_line}\n"
 
 
 def _to_untyped_sse_event(data: BaseModel) -> str:
     return f"data: {data.model_dump_json()}\n\n"
 
 
+def _to_sse_document_event(message: DbIndexedDocumentEvent | DbResyncEvent) -> str:
+    if isinstance(message, DbResyncEvent):
+        return _to_sse_event("resync", ApiResync(dropped_events=message.dropped_events))
+    api_event = _to_api_doc(message.document) if message.document else ApiDocumentDelete(uri=message.uri)
+    return _to_sse_event(_to_api_event_type(message.event_type), api_event, message.seq)
+
+
+def _to_api_subscriber_metrics(stats: DbSubscriberStats) -> ApiDocumentEventsSubscriberMetrics:
+    return ApiDocumentEventsSubscriberMetrics(**stats.model_dump())
+
+
+@router.get("/document_events/metrics")
+async def get_document_events_metrics(db_service: DepDbService) -> list[ApiDocumentEventsSubscriberMetrics]:
+    return [_to_api_subscriber_metrics(stats) for stats in db_service.get_subscribers_stats()]
+
+
 @router.get("/document_events")
-async def subscribe_to_indexed_documents_changes(
+async def subscribe_to_indexed_documents_changes(  # noqa: PLR0913
     db_service: DepDbService,
+    settings: DepSettings,
     request: Request,
     nb_events: int | None = None,
     keep_alive_interval: float = 20.0,
+    last_event_id: Annotated[int | None, Header()] = None,
 ) -> StreamingResponse:
     async def event_generator() -> AsyncGenerator[str, None]:
-        event_queue: asyncio.Queue[DbIndexedDocumentEvent] = asyncio.Queue()
-        await db_service.listen_to_indexed_documents_changes(event_queue, 1)
+        # on reconnection, the client resumes from the last event it received
+        subscription = await db_service.listen_to_indexed_documents_changes(
+            settings.document_events_max_pending,
+            1,
+            since_seq=last_event_id,
+        )
         events_sent = 0
         try:
             while True:
@@ -215,13 +332,8 @@ async def subscribe_to_indexed_documents_changes(
 
                 # Wait for message with timeout to check for disconnects
                 try:
-                    message = await asyncio.wait_for(event_queue.get(), timeout=keep_alive_interval)
-                    api_event = (
-                        _to_api_doc(message.document)
-                        if message.event_type != "delete"
-                        else ApiDocumentDelete(uri=message.document.uri)
-                    )
-                    yield _to_sse_event(_to_api_event_type(message.event_type), api_event)
+                    message = await asyncio.wait_for(subscription.get(), timeout=keep_alive_interval)
+                    yield _to_sse_document_event(message)
                     events_sent += 1
                 except TimeoutError:
                     # Send keep-alive comment, message starting swith ":" are ignored by the client, this prevents the connection from timing out
@@ -229,7 +341,7 @@ async def subscribe_to_indexed_documents_changes(
                     events_sent += 1
         finally:
             # Clean up on disconnect
-            await db_service.removed_listener_to_indexed_documents_changes(event_queue)
+            await db_service.removed_listener_to_indexed_documents_changes(subscription)
 
     return _to_streaming_response(event_generator())
 
@@ -26,8 +26,33 @@ class ApiDocumentDelete(BaseModel):
     uri: str
 
 
+class ApiResync(BaseModel):
+    # the events buffered for the client were dropped, the client must reload the explorer
+    dropped_events: int
+
+
+class ApiDocumentEventsSubscriberMetrics(BaseModel):
+    subscriber_id: int
+    pending_events: int
+    max_pending_events: int
+    received_events: int
+    dropped_events: int
+    resyncs: int
+    last_delivery_lag_seconds: float
+    max_delivery_lag_seconds: float
+
+
 class ApiExplorer(BaseModel):
+    # in page mode: documents ordered by uri. In delta mode (since=): documents changed since the given seq
     documents: list[ApiDocumentSnippet]
+    # position in the change feed this response is consistent with, to pass as since= to get later changes
+    seq: int
+    # page mode: uri to pass as after= to get the next page, None on the last page
+    next_after: str | None = None
+    # delta mode: documents deleted since the given seq
+    deleted_uris: list[str] = []
+    # delta mode: seq to pass as since= to get the remaining changes, None if there are none
+    next_since: int | None = None
 
 
 class ApiSearchResultChunk(BaseModel):
@@ -78,7 +103,7 @@ class ApiQuery(BaseModel):
     previous_messages: list[ApiQueryReponsePair]
 
 
-ApiEventType = Literal["update", "delete"]
+ApiEventType = Literal["update", "delete", "resync"]
 
 class ApiPresignedUrlRequest(BaseModel):
     uri: str
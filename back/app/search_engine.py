@@ -1,8 +1,11 @@
 import logging
+from typing import Literal
 
 from pydantic import BaseModel
 
+from app.document_catalog import DocumentCatalog
 from app.prompt_builder import PromptBuilder
+from app.table_refresher import TableRefresher
 from common.db_service import DbDocument, DbService
 from common.document import ParsedDocument
 from common.embedding_service import EmbeddingService
@@ -17,6 +20,15 @@ class SearchResult(BaseModel):
     chunks: list[ChunkResult]
 
 
+class SearchSettings(BaseModel, frozen=True):
+    # flat: search all chunks
+    # documents_first: search chunks of the nb_documents documents with the nearest summary vectors only
+    # (requires lance_db.document_vectors in the indexer)
+    mode: Literal["flat", "documents_first"] = "flat"
+    nb_documents: int = 50
+    nb_chunks: int = 10
+
+
 class SearchEngine:
 
     embedding_service: EmbeddingService
@@ -24,25 +36,59 @@ class SearchEngine:
     db: DbService
     indexer_version: int
     prompt_builder: PromptBuilder
+    catalog: DocumentCatalog | None
+    settings: SearchSettings
+    table_refresher: TableRefresher | None
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         embedding_service: EmbeddingService,
         vector_db: VectorDB,
         db: DbService,
         indexer_version: int,
+        catalog: DocumentCatalog | None = None,
+        settings: SearchSettings | None = None,
+        table_refresher: TableRefresher | None = None,
     ) -> None:
         self.embedding_service = embedding_service
         self.vector_db = vector_db
         self.db = db
         self.indexer_version = indexer_version
         self.prompt_builder = PromptBuilder()
+        self.catalog = catalog
+        self.settings = settings or SearchSettings()
+        self.table_refresher = table_refresher
+
+    async def _documents(self) -> DbService | DocumentCatalog:
+        """documents metadata are read from the in-memory catalog if enabled, else from the db"""
+        if self.catalog is None:
+            return self.db
+        await self.catalog.start_if_needed()
+        return self.catalog
+
+    async def _vector_db(self) -> VectorDB:
+        """vector db tables are kept fresh by the table refresher if set"""
+        if self.table_refresher is not None:
+            await self.table_refresher.start_if_needed()
+        return self.vector_db
+
+    async def warm_up(self) -> None:
+        """Load the catalog, open the vector db tables and run a search (without embedding any query)"""
+        await self._documents()
+        vector_db = await self._vector_db()
+        await vector_db.warm_up()
 
     async def search(self, query: str) -> list[SearchResult]:
         embedding = await self.embedding_service.embed_query(query)
-        parsed_doc_results = await self.vector_db.query(embedding.embedding, 10)
+        vector_db = await self._vector_db()
+        parsed_doc_results = await vector_db.query(
+            embedding.embedding,
+            self.settings.nb_chunks,
+            self.settings.nb_documents if self.settings.mode == "documents_first" else None,
+        )
         parsed_hashes = [result.parsed_document.hash for result in parsed_doc_results]
-        hash_to_doc = await self.db.get_documents_from_indexed_parsed_hashes(parsed_hashes, self.indexer_version)
+        documents = await self._documents()
+        hash_to_doc = await documents.get_documents_from_indexed_parsed_hashes(parsed_hashes, self.indexer_version)
         # keep only results from documents in db
         parsed_doc_results = [result for result in parsed_doc_results if result.parsed_document.hash in hash_to_doc]
 
@@ -63,13 +109,15 @@ class SearchEngine:
         return search_results
 
     async def get_document(self, uri: str) -> ParsedDocument | None:
-        db_doc = await self.db.get_documents([uri], self.indexer_version)
+        documents = await self._documents()
+        db_doc = await documents.get_documents([uri], self.indexer_version)
         if uri not in db_doc:
             return None
         db_doc = db_doc[uri]
         if not db_doc.indexed_content:
             return None
-        parsed_doc = await self.vector_db.get_document(db_doc.indexed_content.parsed_hash)
+        vector_db = await self._vector_db()
+        parsed_doc = await vector_db.get_document(db_doc.indexed_content.parsed_hash)
         if not parsed_doc:
             logger.warning(
                 f"Inconsistent state: document {uri} is marked as indexed with parsed hash {db_doc.indexed_content.parsed_hash} but not found in vector db",
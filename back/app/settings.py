@@ -1,3 +1,4 @@
+from datetime import timedelta
 from functools import lru_cache
 from typing import Annotated
 
@@ -5,12 +6,23 @@ from fastapi import Depends
 from pydantic_settings import SettingsConfigDict
 
 from app.generator import GeneratorSettings
+from app.search_engine import SearchSettings
 from common.settings import CommonSettings
 
 
 class Settings(CommonSettings):
     generator: GeneratorSettings
     generator__litellm_api_key: str  # flattened becayse nested settings are not supported if it comes from secrets_dir
+    # max number of document events buffered per SSE client, a client lagging behind gets a resync event
+    document_events_max_pending: int = 1000
+    # keep the indexed documents in memory (kept fresh from the change feed) instead of querying postgres per request
+    document_catalog: bool = False
+    # max number of change events buffered by the document catalog: it must not miss events (it would reload all the
+    # documents), so it is sized for an indexing storm
+    document_catalog_max_pending: int = 100_000
+    # vector db tables are refreshed once documents are indexed, at most once per debounce period
+    vector_db_refresh_debounce: timedelta = timedelta(milliseconds=500)
+    search: SearchSettings = SearchSettings()
 
     # frozen=True makes it hashable so it can be used as an argument of other functions decorated with lru_cache
     model_config = SettingsConfigDict(
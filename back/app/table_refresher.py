@@ -0,0 +1,90 @@
+import asyncio
+import contextlib
+import logging
+from datetime import timedelta
+
+from common.db_service import (
+    DbEventSubscription,
+    DbIndexedDocumentEvent,
+    DbResyncEvent,
+    DbService,
+    TableIndexedDocumentStatusEnum,
+)
+from common.vector_db import VectorDB
+
+logger = logging.getLogger(__name__)
+
+
+class TableRefresher:
+    """Refreshes the vector db tables when documents of the indexer version reach indexing_success, instead of
+    checking the table versions on every query (read_consistency_interval). Notifications of an indexing burst are
+    coalesced: at most one refresh per debounce period."""
+
+    indexer_version: int
+    _db: DbService
+    _vector_db: VectorDB
+    _debounce: timedelta
+    _max_pending_events: int
+    _subscription: DbEventSubscription | None = None
+    _task: asyncio.Task[None] | None = None
+    _start_lock: asyncio.Lock
+
+    def __init__(
+        self,
+        db: DbService,
+        vector_db: VectorDB,
+        indexer_version: int,
+        debounce: timedelta,
+        max_pending_events: int = 1000,
+    ) -> None:
+        self._db = db
+        self._vector_db = vector_db
+        self.indexer_version = indexer_version
+        self._debounce = debounce
+        self._max_pending_events = max_pending_events
+        self._start_lock = asyncio.Lock()
+
+    async def start_if_needed(self) -> None:
+        if self._task:
+            return
+        async with self._start_lock:
+            if self._task:
+                return
+            self._subscription = await self._db.listen_to_indexed_documents_changes(
+                self._max_pending_events,
+                self.indexer_version,
+            )
+            # documents indexed before the subscription are visible: tables are opened or refreshed after it
+            await self._vector_db.refresh()
+            self._task = asyncio.create_task(self._follow_changes(self._subscription))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._subscription:
+            await self._db.removed_listener_to_indexed_documents_changes(self._subscription)
+            self._subscription = None
+
+    def needs_refresh(self, event: DbIndexedDocumentEvent | DbResyncEvent) -> bool:
+        if isinstance(event, DbResyncEvent):
+            return True  # missed events may be indexing successes
+        return (
+            event.indexer_version == self.indexer_version
+            and event.document is not None
+            and event.document.status.status == TableIndexedDocumentStatusEnum.indexing_success
+        )
+
+    async def _follow_changes(self, subscription: DbEventSubscription) -> None:
+        while True:
+            if not self.needs_refresh(await subscription.get()):
+                continue
+            await asyncio.sleep(self._debounce.total_seconds())
+            # the refresh also covers the successes notified meanwhile
+            subscription.get_pending()
+            try:
+                await self._vector_db.refresh()
+            except Exception:
+                logger.exception("Error refreshing vector db tables")
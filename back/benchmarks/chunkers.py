@@ -0,0 +1,102 @@
+"""Compare chunkers on tests/parsing_dataset: number of chunks, and retrieval recall if --recall is given.
+
+Recall is measured with sentences of the documents used as queries: a query is retrieved if one of the top-k
+chunks (cosine similarity of embeddings) overlaps the sentence. It needs the embedding settings of the indexer.
+
+Usage (from back/): python -m benchmarks.chunkers [--recall] [--k 5] [--chunk-size 256] [--chunk-overlap 32]
+"""
+
+import argparse
+import asyncio
+import pathlib
+import re
+from io import BytesIO
+from typing import Final, cast
+
+import numpy as np
+
+from common.document import Chunk, ParsableFileType, ParsedDocument, is_parsable
+from common.embedding_service import EmbeddingService
+from indexer.chunker import Chunker, TokenChunker, count_tokens
+
+dataset_path: Final[pathlib.Path] = pathlib.Path(__file__).parent.parent / "tests" / "parsing_dataset"
+sentence_pattern: Final[re.Pattern[str]] = re.compile(r"[^.!?\n]{40,300}[.!?]")
+queries_per_document: Final[int] = 50
+
+
+def load_dataset() -> list[tuple[str, ParsedDocument]]:
+    """md and txt files are read as is, other parsable files are parsed (requires docling)"""
+    documents: list[tuple[str, ParsedDocument]] = []
+    for path in sorted(dataset_path.glob("*/*")):
+        filetype = path.suffix[1:]
+        if filetype in ("md", "txt"):
+            content = path.read_text(encoding="utf-8")
+            documents.append((path.name, ParsedDocument(hash=path.name, markdown_content=content)))
+        elif is_parsable(filetype):
+            try:
+                from indexer.parser import Parser  # loads docling models
+            except ImportError:
+                print(f"docling not installed, {path.name} skipped")  # noqa: T201
+                continue
+            parsed = Parser().parse(path.name, cast("ParsableFileType", filetype), BytesIO(path.read_bytes()))
+            documents.append((path.name, parsed))
+    return documents
+
+
+def sample_queries(doc: ParsedDocument) -> list[tuple[str, int, int]]:
+    """(sentence, start, end) evenly sampled in the document"""
+    sentences = [(m.group().strip(), m.start(), m.end()) for m in sentence_pattern.finditer(doc.markdown_content)]
+    step = max(1, len(sentences) // queries_per_document)
+    return sentences[::step][:queries_per_document]
+
+
+async def recall(embedder: EmbeddingService, doc: ParsedDocument, chunks: list[Chunk], k: int) -> float:
+    embedded = await embedder.embed_document(doc, chunks)
+    chunk_vectors = np.array([e.embedding.embedding for e in embedded])
+    chunk_vectors /= np.linalg.norm(chunk_vectors, axis=1, keepdims=True)
+    queries = sample_queries(doc)
+    nb_retrieved = 0
+    for sentence, start, end in queries:
+        query_vector = np.array((await embedder.embed_query(sentence)).embedding)
+        top_k = np.argsort(-(chunk_vectors @ query_vector))[:k]
+        if any(chunks[i].start_index_in_doc < end and chunks[i].end_index_in_doc > start for i in top_k):
+            nb_retrieved += 1
+    return nb_retrieved / len(queries) if queries else 0.0
+
+
+async def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--recall", action="store_true", help="measure retrieval recall (calls embedding api)")
+    arg_parser.add_argument("--k", type=int, default=5)
+    arg_parser.add_argument("--chunk-size", type=int, default=256)
+    arg_parser.add_argument("--chunk-overlap", type=int, default=32)
+    args = arg_parser.parse_args()
+
+    chunkers: dict[str, Chunker | TokenChunker] = {
+        "characters": Chunker(),
+        f"tokens({args.chunk_size}, {args.chunk_overlap})": TokenChunker(args.chunk_size, args.chunk_overlap),
+    }
+    embedder: EmbeddingService | None = None
+    if args.recall:
+        from indexer.settings import get_settings  # requires the indexer env
+
+        settings = get_settings()
+        embedder = EmbeddingService(settings.embedding, settings.embedding__litellm_api_key)
+
+    print(  # noqa: T201
+        f"{'document':<40} {'chunker':<20} {'chunks':>8} {'chunks/kB':>10} {'tokens/chunk':>13} {'recall':>8}",
+    )
+    for name, doc in load_dataset():
+        for chunker_name, chunker in chunkers.items():
+            chunks = chunker.chunk(doc)
+            nb_tokens = sum(count_tokens(doc[chunk]) for chunk in chunks)
+            chunks_per_kb = len(chunks) / max(1, len(doc.markdown_content) / 1000)
+            doc_recall = f"{await recall(embedder, doc, chunks, args.k):.2f}" if embedder else "-"
+            print(  # noqa: T201
+                f"{name:<40} {chunker_name:<20} {len(chunks):>8} {chunks_per_kb:>10.1f} "
+                f"{nb_tokens / max(1, len(chunks)):>13.1f} {doc_recall:>8}",
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""Flat chunk search vs documents first search (chunks of the M nearest documents only), on local Lance tables of
+synthetic embeddings.
+
+Documents are random topics, their chunks are normalized points around the topic. Queries are near a random chunk.
+Recall@k is measured against exact float32 search of all chunks.
+
+Usage (from back/): python -m benchmarks.document_search [--nb-documents 2000] [--chunks-per-document 20] [--k 10]
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import lancedb
+import numpy as np
+import pyarrow as pa
+
+from common.minio_service import MinioSettings
+from common.vector_db import (
+    LanceDbSettings,
+    document_vector,
+    embedding_dim,
+    get_chunk_table_schema,
+    get_doc_vector_table_schema,
+    in_parsed_hashes,
+    row_doc_vector,
+    row_start_index_in_doc,
+    search_chunk_table,
+    search_doc_vector_table,
+    to_chunk_table,
+)
+
+
+async def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--nb-documents", type=int, default=2000)
+    arg_parser.add_argument("--chunks-per-document", type=int, default=20)
+    arg_parser.add_argument("--nb-queries", type=int, default=100)
+    arg_parser.add_argument("--k", type=int, default=10)
+    arg_parser.add_argument("--query-noise", type=float, default=0.1, help="std of the noise added to query chunks")
+    arg_parser.add_argument("--nb-documents-to-search", type=int, nargs="+", default=[10, 50, 200])
+    args = arg_parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    nb_chunks = args.nb_documents * args.chunks_per_document
+    topics = rng.standard_normal((args.nb_documents, embedding_dim))
+    vectors = np.repeat(topics, args.chunks_per_document, axis=0) + 1.2 * rng.standard_normal(
+        (nb_chunks, embedding_dim),
+    )
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    parsed_hashes = [f"doc{i // args.chunks_per_document}" for i in range(nb_chunks)]
+    queries = vectors[rng.integers(0, nb_chunks, args.nb_queries)] + args.query_noise * rng.standard_normal(
+        (args.nb_queries, embedding_dim),
+    )
+    exact_top_k = [set(np.argsort(-(vectors @ query))[: args.k].tolist()) for query in queries]
+
+    minio = MinioSettings(endpoint="", access_key="", secret_key="", use_tls=False, bucket="")  # unused, local tables
+    settings = LanceDbSettings(minio=minio, read_consistency_interval=0, document_vectors=True)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = await lancedb.connect_async(tmp_dir)
+        chunk_schema = get_chunk_table_schema(embedding_dim, settings)
+        chunk_table = await db.create_table(
+            "chunks",
+            to_chunk_table(vectors, parsed_hashes, list(range(nb_chunks)), [0] * nb_chunks, chunk_schema, settings),
+        )
+        doc_schema = get_doc_vector_table_schema(embedding_dim)
+        doc_vectors = [
+            document_vector(vectors[i : i + args.chunks_per_document])
+            for i in range(0, nb_chunks, args.chunks_per_document)
+        ]
+        doc_vector_table = await db.create_table(
+            "doc_vectors",
+            pa.Table.from_arrays(
+                [
+                    pa.array([f"doc{i}" for i in range(args.nb_documents)]),
+                    pa.array([list(v) for v in doc_vectors], type=doc_schema.field(row_doc_vector).type),
+                ],
+                schema=doc_schema,
+            ),
+        )
+
+        print(f"{'search':<22} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")  # noqa: T201
+        for nb_documents_to_search in [None, *args.nb_documents_to_search]:
+            recalls: list[float] = []
+            latencies: list[float] = []
+            for query, expected in zip(queries, exact_top_k, strict=True):
+                start = time.perf_counter()
+                where = None
+                if nb_documents_to_search is not None:
+                    documents = await search_doc_vector_table(
+                        doc_vector_table,
+                        query.tolist(),
+                        nb_documents_to_search,
+                        "cosine",
+                    )
+                    where = in_parsed_hashes(documents)
+                result = await search_chunk_table(chunk_table, query.tolist(), args.k, "cosine", settings, where)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(expected & set(result[row_start_index_in_doc].to_pylist())) / args.k)
+            name = f"documents first M={nb_documents_to_search}" if nb_documents_to_search else "flat"
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(  # noqa: T201
+                f"{name:<22} {statistics.mean(recalls):>9.3f} {statistics.median(latencies):>8.1f} {p95:>8.1f}",
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Recall / latency report of the chunk candidate searches (quantization, matryoshka), on local Lance tables of
+synthetic embeddings.
+
+Embeddings are normalized points around random cluster centers (chunks of the same documents are close).
+Recall@k is measured against exact float32 search. Synthetic embeddings spread information evenly across
+dimensions, so the recall of matryoshka truncation is a lower bound of what real matryoshka embeddings get.
+
+Usage (from back/): python -m benchmarks.quantization [--nb-chunks 20000] [--nb-queries 100] [--k 10]
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import lancedb
+import numpy as np
+import numpy.typing as npt
+from lancedb.index import HnswSq
+
+from common.minio_service import MinioSettings
+from common.vector_db import (
+    LanceDbSettings,
+    Quantization,
+    embedding_dim,
+    get_chunk_table_schema,
+    row_candidate_vector,
+    row_start_index_in_doc,
+    search_chunk_table,
+    to_chunk_table,
+)
+
+configurations: dict[str, tuple[Quantization, int | None]] = {
+    "float16": ("none", None),
+    "int8": ("int8", None),
+    "binary": ("binary", None),
+    "matryoshka 256": ("none", 256),
+    "matryoshka 128": ("none", 128),
+}
+
+
+def candidate_bytes(quantization: Quantization, candidate_dimensions: int | None) -> int:
+    """bytes per chunk read by the candidate search"""
+    dimensions = candidate_dimensions or embedding_dim
+    if quantization == "binary":
+        return dimensions // 8
+    return dimensions if quantization == "int8" else dimensions * 2
+
+
+def synthetic_embeddings(nb: int, nb_clusters: int, rng: np.random.Generator) -> npt.NDArray[np.float32]:
+    centers = rng.standard_normal((nb_clusters, embedding_dim))
+    vectors = centers[rng.integers(0, nb_clusters, nb)] + 0.8 * rng.standard_normal((nb, embedding_dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+async def create_table(
+    db: lancedb.AsyncConnection,
+    name: str,
+    vectors: npt.NDArray[np.float32],
+    settings: LanceDbSettings,
+) -> lancedb.AsyncTable:
+    nb = len(vectors)
+    schema = get_chunk_table_schema(embedding_dim, settings)
+    table = await db.create_table(
+        name,
+        to_chunk_table(vectors, ["hash"] * nb, list(range(nb)), list(range(1, nb + 1)), schema, settings),
+    )
+    if settings.quantization == "int8":
+        column = row_candidate_vector if settings.candidate_dimensions else lancedb.common.VECTOR_COLUMN_NAME
+        await table.create_index(column, config=HnswSq(distance_type="cosine"))
+    return table
+
+
+async def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--nb-chunks", type=int, default=20_000)
+    arg_parser.add_argument("--nb-queries", type=int, default=100)
+    arg_parser.add_argument("--k", type=int, default=10)
+    arg_parser.add_argument("--rescoring-factor", type=int, default=4)
+    args = arg_parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_embeddings(args.nb_chunks, nb_clusters=args.nb_chunks // 50, rng=rng)
+    queries = vectors[rng.integers(0, len(vectors), args.nb_queries)] + 0.05 * rng.standard_normal(
+        (args.nb_queries, embedding_dim),
+    )
+    exact_top_k = [set(np.argsort(-(vectors @ query))[: args.k].tolist()) for query in queries]
+    minio = MinioSettings(endpoint="", access_key="", secret_key="", use_tls=False, bucket="")  # unused, local tables
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = await lancedb.connect_async(tmp_dir)
+        print(f"{'candidate search':<16} {'bytes/chunk':>11} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")  # noqa: T201
+        for i_configuration, (name, (quantization, candidate_dimensions)) in enumerate(configurations.items()):
+            settings = LanceDbSettings(
+                minio=minio,
+                read_consistency_interval=0,
+                quantization=quantization,
+                candidate_dimensions=candidate_dimensions,
+                rescoring_factor=args.rescoring_factor,
+            )
+            table = await create_table(db, f"chunks_{i_configuration}", vectors, settings)
+            recalls: list[float] = []
+            latencies: list[float] = []
+            for query, expected in zip(queries, exact_top_k, strict=True):
+                start = time.perf_counter()
+                result = await search_chunk_table(table, query.tolist(), args.k, "cosine", settings)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(expected & set(result[row_start_index_in_doc].to_pylist())) / args.k)
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(  # noqa: T201
+                f"{name:<16} {candidate_bytes(quantization, candidate_dimensions):>11} "
+                f"{statistics.mean(recalls):>9.3f} {statistics.median(latencies):>8.1f} {p95:>8.1f}",
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,22 +1,48 @@
 import asyncio
+import contextlib
 import datetime as dt
 import enum
-import json
 import logging
-from datetime import datetime
-from typing import Literal, cast
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Iterable
+from datetime import datetime, timedelta
+from typing import Any, Final, Literal, cast
 from uuid import UUID
 
 import asyncpg  # type: ignore[reportMissingTypesStubs]
 from pydantic import BaseModel
-from sqlalchemy import TIMESTAMP, Enum, ForeignKey, MetaData, delete, select, update
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import (
+    TIMESTAMP,
+    BigInteger,
+    Column,
+    CursorResult,
+    Enum,
+    ForeignKey,
+    ForeignKeyConstraint,
+    MetaData,
+    Table,
+    Text,
+    and_,
+    delete,
+    exists,
+    func,
+    literal,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column
 from uuid_utils.compat import (
     uuid7,
 )  # cf. https://pypi.org/project/uuid-utils/ compat so that instances are real UUIDs form std lib (else pydantic complains)
 
+from common.notification_relay import NotificationRelay, NotificationRelaySettings, NotificationRelayUnavailableError
+
+# SQL statements of the ORM and of the asyncpg fast path are logged at INFO level, cf. DbSettings.sql_log_level
+sqlalchemy_logging = logging.getLogger("sqlalchemy.engine")
+sql_logging = logging.getLogger(f"{__name__}.sql")
 logging = logging.getLogger(__name__)
 
 
@@ -26,6 +52,11 @@ class DbSettings(BaseModel, frozen=True):
     host: str
     port: int
     database: str
+    sql_log_level: str = "WARNING"  # INFO to log SQL statements
+    pool_max_size: int = 10  # connections of the asyncpg pool of the fast path
+    # if set, the processes of a host (e.g. uvicorn workers) share one LISTEN connection to the change feed
+    notification_relay: NotificationRelaySettings | None = None
+    listen_start_timeout: float = 30.0  # seconds the first subscriber to the change feed waits for the LISTEN
 
 
 Base = declarative_base(metadata=MetaData(schema="seemantic_schema"))
@@ -39,13 +70,49 @@ class TableIndexedDocumentStatusEnum(enum.Enum):
     indexing_error = "indexing_error"
 
 
+class TableIndexerVersion(Base):
+    """Indexer versions, whose indexed contents and documents are stored in dedicated partitions"""
+
+    __tablename__ = "indexer_version"
+
+    indexer_version: Mapped[int] = mapped_column(primary_key=True)
+    lance_tables: Mapped[list[str]] = mapped_column(ARRAY(Text), nullable=False)
+    last_served: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    retirement_datetime: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+
+
 class TableIndexedContent(Base):
+    """Partitioned by indexer version"""
+
     __tablename__ = "indexed_content"
 
     id: Mapped[UUID] = mapped_column(primary_key=True)
     raw_hash: Mapped[str] = mapped_column(nullable=False)
     parsed_hash: Mapped[str] = mapped_column(nullable=False)
-    indexer_version: Mapped[int] = mapped_column(nullable=False)
+    indexer_version: Mapped[int] = mapped_column(primary_key=True)
+    creation_datetime: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+
+class TableParsedContent(Base):
+    """Parsed content of a raw content, shared by the indexer versions with the same parser version"""
+
+    __tablename__ = "parsed_content"
+
+    id: Mapped[UUID] = mapped_column(primary_key=True)
+    raw_hash: Mapped[str] = mapped_column(nullable=False)
+    parser_version: Mapped[int] = mapped_column(nullable=False)
+    parsed_hash: Mapped[str] = mapped_column(nullable=False)
+
+
+class TableSourceObjectContent(Base):
+    """Raw hash of a source object by (etag, size), to resolve already downloaded contents without downloading them"""
+
+    __tablename__ = "source_object_content"
+
+    id: Mapped[UUID] = mapped_column(primary_key=True)
+    etag: Mapped[str] = mapped_column(nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    raw_hash: Mapped[str] = mapped_column(nullable=False)
 
 
 class TableDocument(Base):
@@ -60,9 +127,15 @@ class TableDocument(Base):
 
 class TableIndexedDocument(Base):
     """Document as view by an indexer.
-    Different indexer whill have different IndexedDocument"""
+    Different indexer whill have different IndexedDocument. Partitioned by indexer version"""
 
     __tablename__ = "indexed_document"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["indexed_content_id", "indexer_version"],
+            ["indexed_content.id", "indexed_content.indexer_version"],
+        ),
+    )
 
     id: Mapped[UUID] = mapped_column(primary_key=True)
     uri: Mapped[str] = mapped_column(nullable=False)
@@ -70,8 +143,8 @@ class TableIndexedDocument(Base):
 
     # version
     indexed_source_version: Mapped[str | None] = mapped_column(nullable=True)
-    indexed_content_id: Mapped[UUID | None] = mapped_column(ForeignKey("indexed_content.id"), nullable=True)
-    indexer_version: Mapped[int] = mapped_column(nullable=False)
+    indexed_content_id: Mapped[UUID | None] = mapped_column(nullable=True)
+    indexer_version: Mapped[int] = mapped_column(primary_key=True)
     last_indexing: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True),
         nullable=True,
@@ -89,9 +162,29 @@ class TableIndexedDocument(Base):
     last_status_change: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
     error_status_message: Mapped[str] = mapped_column(nullable=True)
 
+    # indexing queue: pending documents are claimed by an indexer worker, which holds a lease on them while indexing
+    source_version_to_index: Mapped[str | None] = mapped_column(nullable=True)
+    indexing_due: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)  # claim order
+    lease_owner: Mapped[str | None] = mapped_column(nullable=True)
+    lease_expiration: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    indexing_attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+
     creation_datetime: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
 
 
+class TableIndexedDocumentChange(Base):
+    """Change feed of indexed_document, filled by trigger. The notification only carries the seq of the change"""
+
+    __tablename__ = "indexed_document_change"
+
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    indexed_document_id: Mapped[UUID] = mapped_column(nullable=False)
+    indexer_version: Mapped[int] = mapped_column(nullable=False)
+    uri: Mapped[str] = mapped_column(nullable=False)
+    operation: Mapped[str] = mapped_column(nullable=False)
+    change_datetime: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+
 class DbIndexedContent(BaseModel):
     raw_hash: str
     parsed_hash: str
@@ -110,14 +203,197 @@ class DbDocument(BaseModel):
     status: DbDocumentStatus
     last_indexing: datetime | None
     indexed_content: DbIndexedContent | None
+    source_version_to_index: str | None = None  # source version requested when the document was enqueued
+
+
+class DbIndexerVersion(BaseModel):
+    indexer_version: int
+    lance_tables: list[str]
+    last_served: datetime | None
+    retirement_datetime: datetime | None
+
+
+class IndexerVersionInUseError(Exception):
+    pass
+
+
+class IndexerVersionNotRegisteredError(Exception):
+    pass
+
+
+class DbBulkLoadedDocument(BaseModel):
+    """Document indexed by the bulk import"""
+
+    uri: str
+    source_version: str
+    size: int | None
+    raw_hash: str
+    parsed_hash: str
+
+
+# bulk import: documents are COPYed in this temporary table, then inserted in the tables with INSERT ... SELECT
+_bulk_loaded_document = Table(
+    "bulk_loaded_document",
+    MetaData(),
+    Column("uri", Text),
+    Column("source_version", Text),
+    Column("size", BigInteger),
+    Column("raw_hash", Text),
+    Column("parsed_hash", Text),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+class DbIndexingRequest(BaseModel):
+    """Request to (re)index a document at a given source version"""
+
+    uri: str
+    source_version: str | None
+    indexing_delay: timedelta = timedelta(0)  # documents are claimed by due time (enqueue time + delay)
 
 
 DbEventType = Literal["insert", "update", "delete"]
 
 
 class DbIndexedDocumentEvent(BaseModel):
+    seq: int  # position in the change feed, can be used to resume listening
     event_type: DbEventType
-    document: DbDocument
+    uri: str
+    indexer_version: int
+    document: DbDocument | None  # current state of the document, None if it was deleted
+
+
+class DbResyncEvent(BaseModel):
+    """Replaces the backlog of a subscriber that could not keep up: its pending events were dropped,
+    the subscriber must reload a snapshot of the documents"""
+
+    dropped_events: int
+
+
+class DbSubscriberStats(BaseModel):
+    subscriber_id: int
+    pending_events: int  # current lag, in number of events
+    max_pending_events: int
+    received_events: int
+    dropped_events: int
+    resyncs: int
+    last_delivery_lag_seconds: float  # time the last delivered event waited in the buffer
+    max_delivery_lag_seconds: float
+
+
+class DbEventSubscription:
+    """Bounded buffer of events for one subscriber.
+    On overflow, the whole backlog is dropped and replaced by a single DbResyncEvent,
+    so a stalled subscriber never holds more than max_pending_events in memory."""
+
+    subscriber_id: int
+    received_events: int = 0
+    dropped_events: int = 0
+    resyncs: int = 0
+    max_pending_events: int = 0
+    last_delivery_lag_seconds: float = 0.0
+    max_delivery_lag_seconds: float = 0.0
+    _queue: asyncio.Queue[tuple[float, DbIndexedDocumentEvent | DbResyncEvent]]
+
+    def __init__(self, subscriber_id: int, max_pending_events: int) -> None:
+        # at least one slot for an event and one for the resync event replacing the backlog
+        assert max_pending_events >= 2  # noqa: PLR2004
+        self.subscriber_id = subscriber_id
+        self._queue = asyncio.Queue(maxsize=max_pending_events)
+
+    def push(self, event: DbIndexedDocumentEvent) -> None:
+        """Called from the notification callback, never blocks"""
+        self.received_events += 1
+        if self._queue.full():
+            logging.warning(f"Subscriber {self.subscriber_id} is too slow, its events are dropped")
+            self.push_resync(nb_missed_events=1)  # the incoming event is dropped too
+            return
+        self._queue.put_nowait((time.monotonic(), event))
+        self.max_pending_events = max(self.max_pending_events, self._queue.qsize())
+
+    def push_resync(self, nb_missed_events: int) -> None:
+        """Drop the backlog and ask the subscriber to reload a snapshot"""
+        nb_dropped = self._queue.qsize() + nb_missed_events
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self.dropped_events += nb_dropped
+        self.resyncs += 1
+        self._queue.put_nowait((time.monotonic(), DbResyncEvent(dropped_events=nb_dropped)))
+
+    async def get(self) -> DbIndexedDocumentEvent | DbResyncEvent:
+        enqueued_at, event = await self._queue.get()
+        self._record_delivery(enqueued_at)
+        return event
+
+    def get_pending(self) -> list[DbIndexedDocumentEvent | DbResyncEvent]:
+        """Events already buffered, without waiting"""
+        events: list[DbIndexedDocumentEvent | DbResyncEvent] = []
+        while not self._queue.empty():
+            enqueued_at, event = self._queue.get_nowait()
+            self._record_delivery(enqueued_at)
+            events.append(event)
+        return events
+
+    def has_pending_events(self) -> bool:
+        return not self._queue.empty()
+
+    def _record_delivery(self, enqueued_at: float) -> None:
+        self.last_delivery_lag_seconds = time.monotonic() - enqueued_at
+        self.max_delivery_lag_seconds = max(self.max_delivery_lag_seconds, self.last_delivery_lag_seconds)
+
+    def stats(self) -> DbSubscriberStats:
+        return DbSubscriberStats(
+            subscriber_id=self.subscriber_id,
+            pending_events=self._queue.qsize(),
+            max_pending_events=self.max_pending_events,
+            received_events=self.received_events,
+            dropped_events=self.dropped_events,
+            resyncs=self.resyncs,
+            last_delivery_lag_seconds=self.last_delivery_lag_seconds,
+            max_delivery_lag_seconds=self.max_delivery_lag_seconds,
+        )
+
+
+class DbChangeCursor:
+    """Position in the indexed_document change feed.
+    seq values are allocated before commit, so a change with a lower seq can become visible after a higher one:
+    last_seq only moves past a missing seq once it shows up, or once its transaction is known to be rolled back
+    (skip_to the last seq of DbService.get_last_document_change_seq)."""
+
+    last_seq: int  # all changes up to last_seq were processed
+    _seen_after_gap: set[int]
+
+    def __init__(self, last_seq: int) -> None:
+        self.last_seq = last_seq
+        self._seen_after_gap = set()
+
+    @property
+    def has_gap(self) -> bool:
+        return bool(self._seen_after_gap)
+
+    @property
+    def dispatched_seq(self) -> int:
+        """Highest seq processed: changes up to it were processed, except the missing seqs of the gap if any"""
+        return max(self._seen_after_gap, default=self.last_seq)
+
+    def is_new(self, seq: int) -> bool:
+        return seq > self.last_seq and seq not in self._seen_after_gap
+
+    def _advance_contiguous(self) -> None:
+        while self.last_seq + 1 in self._seen_after_gap:
+            self.last_seq += 1
+            self._seen_after_gap.remove(self.last_seq)
+
+    def skip_to(self, seq: int) -> None:
+        """Consider all changes up to seq as processed"""
+        self.last_seq = max(self.last_seq, seq)
+        self._seen_after_gap = {seen for seen in self._seen_after_gap if seen > self.last_seq}
+        self._advance_contiguous()
+
+    def advance(self, seqs: Iterable[int]) -> None:
+        self._seen_after_gap.update(seq for seq in seqs if seq > self.last_seq)
+        self._advance_contiguous()
 
 
 def to_doc(row_indexed_doc: TableIndexedDocument) -> DbDocument:
@@ -142,6 +418,36 @@ def to_doc(row_indexed_doc: TableIndexedDocument) -> DbDocument:
             last_status_change=row_indexed_doc.last_status_change,
             error_status_message=row_indexed_doc.error_status_message,
         ),
+        source_version_to_index=row_indexed_doc.source_version_to_index,
+    )
+
+
+# columns of indexed_document returned by fast path statements, cf. record_to_doc
+_document_columns: Final[str] = (
+    "id, uri, indexed_source_version, indexed_content_id, last_indexing, raw_hash_if_indexed, parsed_hash_if_indexed, "
+    "status, last_status_change, error_status_message, source_version_to_index"
+)
+
+
+def record_to_doc(record: asyncpg.Record) -> DbDocument:
+    """Same as to_doc, for the indexed_document rows returned by asyncpg"""
+    indexed_content = (
+        DbIndexedContent(raw_hash=record["raw_hash_if_indexed"], parsed_hash=record["parsed_hash_if_indexed"])
+        if record["indexed_content_id"]
+        else None
+    )
+    return DbDocument(
+        uri=record["uri"],
+        indexed_document_id=record["id"],
+        indexed_source_version=record["indexed_source_version"],
+        last_indexing=record["last_indexing"],
+        indexed_content=indexed_content,
+        status=DbDocumentStatus(
+            status=TableIndexedDocumentStatusEnum(record["status"]),
+            last_status_change=record["last_status_change"],
+            error_status_message=record["error_status_message"],
+        ),
+        source_version_to_index=record["source_version_to_index"],
     )
 
 
@@ -150,8 +456,20 @@ class DbService:
     indexer_version: int
     url: str
     session_factory: async_sessionmaker[AsyncSession]
-    subscribed_clients: set[asyncio.Queue[DbIndexedDocumentEvent]]
+    subscribed_clients: set[DbEventSubscription]
     active_connection: asyncpg.Connection | None = None
+    _nb_subscriptions: int = 0
+    _listening_task: asyncio.Task[None] | None = None
+    _change_cursor: DbChangeCursor
+    _changes_batch_size: Final[int] = 1000
+    _insert_batch_size: Final[int] = 1000
+    # fast path of the per-document transitions of the indexer: one statement per transition, without ORM nor explicit
+    # transaction, on a pool whose connections cache prepared statements
+    _pool: asyncpg.Pool | None = None
+    _pool_lock: asyncio.Lock
+    _pool_max_size: int
+    _notification_relay: NotificationRelay | None = None
+    _listen_start_timeout: float
 
     def __init__(self, settings: DbSettings) -> None:
         self.url = f"postgresql+asyncpg://{settings.username}:{settings.password}@{settings.host}:{settings.port}/{settings.database}"
@@ -159,9 +477,122 @@ class DbService:
             f"postgresql://{settings.username}:{settings.password}@{settings.host}:{settings.port}/{settings.database}"
         )
 
-        engine = create_async_engine(self.url, echo=True)  # add connect_args={"timeout": 10} in production ?
+        sqlalchemy_logging.setLevel(settings.sql_log_level)
+        sql_logging.setLevel(settings.sql_log_level)
+        engine = create_async_engine(self.url)  # add connect_args={"timeout": 10} in production ?
         self.session_factory = async_sessionmaker(engine, class_=AsyncSession)
         self.subscribed_clients = set()
+        self._pool_lock = asyncio.Lock()
+        self._pool_max_size = settings.pool_max_size
+        self._listen_start_timeout = settings.listen_start_timeout
+        if settings.notification_relay is not None:
+            self._notification_relay = NotificationRelay(settings.notification_relay, "table_changes")
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(self.raw_url, min_size=1, max_size=self._pool_max_size)
+        return self._pool
+
+    async def warm_up(self) -> None:
+        """Open the connections of the ORM engine and of the fast path pool, so that the first requests do not pay
+        for it"""
+        async with self.session_factory() as session:
+            await session.execute(text("SELECT 1"))
+        await (await self._get_pool()).execute("SELECT 1")
+
+    async def _fetch(self, statement: str, *args: Any) -> list[asyncpg.Record]:  # noqa: ANN401
+        sql_logging.info(statement)
+        return await (await self._get_pool()).fetch(statement, *args)
+
+    async def register_indexer_version(self, indexer_version: int, lance_tables: list[str]) -> None:
+        """Create the partitions of the indexer version if needed, before any of its rows is written"""
+        async with self.session_factory() as session, session.begin():
+            await session.execute(
+                text("SELECT seemantic_schema.register_indexer_version(:indexer_version, :lance_tables)"),
+                {"indexer_version": indexer_version, "lance_tables": lance_tables},
+            )
+            await session.commit()
+
+    async def mark_indexer_version_served(self, indexer_version: int) -> None:
+        async with self.session_factory() as session, session.begin():
+            await session.execute(
+                update(TableIndexerVersion)
+                .where(TableIndexerVersion.indexer_version == indexer_version)
+                .values(last_served=func.now()),
+            )
+            await session.commit()
+
+    async def get_indexer_versions(self) -> list[DbIndexerVersion]:
+        async with self.session_factory() as session:
+            result = await session.execute(select(TableIndexerVersion).order_by(TableIndexerVersion.indexer_version))
+            return [
+                DbIndexerVersion(
+                    indexer_version=row.indexer_version,
+                    lance_tables=row.lance_tables,
+                    last_served=row.last_served,
+                    retirement_datetime=row.retirement_datetime,
+                )
+                for row in result.scalars().all()
+            ]
+
+    async def retire_indexer_version(
+        self,
+        indexer_version: int,
+        min_idle: timedelta,
+        current_version: int,
+        *,
+        force: bool = False,
+    ) -> list[str]:
+        """Drop the partitions of the indexer version, if it was not served for min_idle and no indexer holds a lease
+        on its documents. Returns its lance tables that no other active version uses, to be deleted afterwards.
+        Unless forced, a version never served (e.g. still being indexed) or newer than the current version is kept."""
+        async with self.session_factory() as session, session.begin():
+            # the registry row is locked: apps cannot mark the version as served meanwhile
+            version = await session.scalar(
+                select(TableIndexerVersion)
+                .where(TableIndexerVersion.indexer_version == indexer_version)
+                .with_for_update(),
+            )
+            if version is None:
+                error = f"indexer version {indexer_version} is not registered"
+                raise IndexerVersionNotRegisteredError(error)
+            if not force and version.retirement_datetime is None:
+                if indexer_version > current_version:
+                    error = f"indexer version {indexer_version} is newer than the current version {current_version}"
+                    raise IndexerVersionInUseError(error)
+                if version.last_served is None:
+                    error = f"indexer version {indexer_version} was never served"
+                    raise IndexerVersionInUseError(error)
+            now = datetime.now(tz=dt.UTC)
+            served = version.last_served is not None and version.last_served > now - min_idle
+            # a retired version can be retired again, to complete an interrupted deletion of its lance tables
+            if served and version.retirement_datetime is None:
+                error = f"indexer version {indexer_version} was served at {version.last_served}"
+                raise IndexerVersionInUseError(error)
+            nb_leased = await session.scalar(
+                select(func.count())
+                .select_from(TableIndexedDocument)
+                .where(TableIndexedDocument.indexer_version == indexer_version)
+                .where(TableIndexedDocument.lease_expiration > now),
+            )
+            if nb_leased:
+                error = f"an indexer of version {indexer_version} is indexing {nb_leased} documents"
+                raise IndexerVersionInUseError(error)
+
+            other_versions_tables = set(
+                await session.scalars(
+                    select(func.unnest(TableIndexerVersion.lance_tables))
+                    .where(TableIndexerVersion.indexer_version != indexer_version)
+                    .where(TableIndexerVersion.retirement_datetime.is_(None)),
+                ),
+            )
+            await session.execute(
+                text("SELECT seemantic_schema.drop_indexer_version_partitions(:indexer_version)"),
+                {"indexer_version": indexer_version},
+            )
+            await session.commit()
+            return [table for table in version.lance_tables if table not in other_versions_tables]
 
     async def delete_documents(self, uris: list[str]) -> None:
         async with self.session_factory() as session, session.begin():
@@ -169,12 +600,18 @@ class DbService:
             await session.execute(delete(TableDocument).where(TableDocument.uri.in_(uris)))
             await session.commit()
 
-    async def create_indexed_documents(self, uris: list[str], indexer_version: int) -> dict[str, UUID]:
+    async def create_indexed_documents(
+        self,
+        requests: list[DbIndexingRequest],
+        indexer_version: int,
+    ) -> dict[str, UUID]:
+        """Create pending indexed documents, documents already created (by another indexer) are left untouched"""
         now = datetime.now(tz=dt.UTC)
 
         uri_to_id: dict[str, UUID] = {}
         async with self.session_factory() as session, session.begin():
-            for uri in uris:
+            for request in requests:
+                uri = request.uri
                 smt = insert(TableDocument).values(id=uuid7(), uri=uri, creation_datetime=now)
                 # if uri already exists, this is a no op and the id is returned
                 smt = smt.on_conflict_do_update(
@@ -184,46 +621,302 @@ class DbService:
                 id = await session.execute(smt)
                 uri_to_id[uri] = id.scalar_one()
 
-            uri_to_indexed_documents = {
-                uri: TableIndexedDocument(
-                    id=uuid7(),  # Generate a unique UUID for each document
-                    uri=uri,
-                    document_id=uri_to_id[uri],
-                    indexed_source_version=None,
-                    indexed_content_id=None,
-                    last_indexing=None,
-                    status=TableIndexedDocumentStatusEnum.pending,
-                    last_status_change=now,
-                    error_status_message=None,
-                    indexer_version=indexer_version,
-                    creation_datetime=now,
+            rows = [
+                {
+                    "id": uuid7(),  # Generate a unique UUID for each document
+                    "uri": request.uri,
+                    "document_id": uri_to_id[request.uri],
+                    "indexed_source_version": None,
+                    "indexed_content_id": None,
+                    "last_indexing": None,
+                    "status": TableIndexedDocumentStatusEnum.pending,
+                    "last_status_change": now,
+                    "error_status_message": None,
+                    "source_version_to_index": request.source_version,
+                    "indexing_due": now + request.indexing_delay,
+                    "indexing_attempts": 0,
+                    "indexer_version": indexer_version,
+                    "creation_datetime": now,
+                }
+                for request in requests
+            ]
+            # batched to stay under the max number of parameters of a statement
+            for i_batch in range(0, len(rows), self._insert_batch_size):
+                await session.execute(
+                    insert(TableIndexedDocument)
+                    .values(rows[i_batch : i_batch + self._insert_batch_size])
+                    .on_conflict_do_nothing(
+                        index_elements=[TableIndexedDocument.document_id, TableIndexedDocument.indexer_version],
+                    ),
                 )
-                for uri in uris
-            }
+            result = await session.execute(
+                select(TableIndexedDocument.uri, TableIndexedDocument.id)
+                .where(TableIndexedDocument.document_id.in_(uri_to_id.values()))
+                .where(TableIndexedDocument.indexer_version == indexer_version),
+            )
+            uri_to_indexed_id = dict(result.tuples().all())
+            await session.commit()
 
-            session.add_all(uri_to_indexed_documents.values())
-            result = {uri: indexed_doc.id for uri, indexed_doc in uri_to_indexed_documents.items()}
+        return uri_to_indexed_id
+
+    async def bulk_load_indexed_documents(
+        self,
+        documents: list[DbBulkLoadedDocument],
+        indexer_version: int,
+        parser_version: int | None = None,
+    ) -> None:
+        """Bulk import: insert indexed documents (indexing_success) and their contents in one transaction, with COPY.
+        Rows already loaded are skipped, existing indexed documents are overwritten."""
+        loaded = _bulk_loaded_document.c
+        async with self.session_factory() as session, session.begin():
+            connection = await session.connection()
+            await connection.run_sync(_bulk_loaded_document.create)
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(  # type: ignore[reportOptionalMemberAccess]
+                _bulk_loaded_document.name,
+                records=[(d.uri, d.source_version, d.size, d.raw_hash, d.parsed_hash) for d in documents],
+                columns=[column.name for column in _bulk_loaded_document.columns],
+            )
+
+            await session.execute(
+                insert(TableIndexedContent)
+                .from_select(
+                    ["id", "raw_hash", "parsed_hash", "indexer_version"],
+                    select(
+                        func.gen_random_uuid(),
+                        loaded.raw_hash,
+                        loaded.parsed_hash,
+                        literal(indexer_version),
+                    ).distinct(loaded.raw_hash),
+                )
+                .on_conflict_do_nothing(
+                    index_elements=[TableIndexedContent.raw_hash, TableIndexedContent.indexer_version],
+                ),
+            )
+            if parser_version is not None:
+                await session.execute(
+                    insert(TableParsedContent)
+                    .from_select(
+                        ["id", "raw_hash", "parsed_hash", "parser_version"],
+                        select(
+                            func.gen_random_uuid(),
+                            loaded.raw_hash,
+                            loaded.parsed_hash,
+                            literal(parser_version),
+                        ).distinct(loaded.raw_hash),
+                    )
+                    .on_conflict_do_nothing(
+                        index_elements=[TableParsedContent.raw_hash, TableParsedContent.parser_version],
+                    ),
+                )
+            await session.execute(
+                insert(TableSourceObjectContent)
+                .from_select(
+                    ["id", "etag", "size", "raw_hash"],
+                    select(func.gen_random_uuid(), loaded.source_version, loaded.size, loaded.raw_hash)
+                    .where(loaded.size.is_not(None))
+                    .distinct(loaded.source_version, loaded.size),
+                )
+                .on_conflict_do_nothing(
+                    index_elements=[TableSourceObjectContent.etag, TableSourceObjectContent.size],
+                ),
+            )
+            await session.execute(
+                insert(TableDocument)
+                .from_select(["id", "uri"], select(func.gen_random_uuid(), loaded.uri))
+                .on_conflict_do_nothing(index_elements=[TableDocument.uri]),
+            )
+
+            stmt = insert(TableIndexedDocument).from_select(
+                [
+                    "id",
+                    "document_id",
+                    "uri",
+                    "indexer_version",
+                    "indexed_source_version",
+                    "indexed_content_id",
+                    "last_indexing",
+                    "status",
+                    "last_status_change",
+                ],
+                select(
+                    func.gen_random_uuid(),
+                    TableDocument.id,
+                    loaded.uri,
+                    literal(indexer_version),
+                    loaded.source_version,
+                    TableIndexedContent.id,
+                    func.now(),
+                    literal(TableIndexedDocumentStatusEnum.indexing_success, TableIndexedDocument.status.type),
+                    func.now(),
+                )
+                .join(TableDocument, TableDocument.uri == loaded.uri)
+                .join(
+                    TableIndexedContent,
+                    and_(
+                        TableIndexedContent.raw_hash == loaded.raw_hash,
+                        TableIndexedContent.indexer_version == indexer_version,
+                    ),
+                ),
+            )
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[TableIndexedDocument.document_id, TableIndexedDocument.indexer_version],
+                    set_={
+                        TableIndexedDocument.indexed_source_version: stmt.excluded.indexed_source_version,
+                        TableIndexedDocument.indexed_content_id: stmt.excluded.indexed_content_id,
+                        TableIndexedDocument.last_indexing: stmt.excluded.last_indexing,
+                        TableIndexedDocument.status: stmt.excluded.status,
+                        TableIndexedDocument.last_status_change: stmt.excluded.last_status_change,
+                        TableIndexedDocument.error_status_message: None,
+                        TableIndexedDocument.source_version_to_index: None,
+                        TableIndexedDocument.lease_owner: None,
+                        TableIndexedDocument.lease_expiration: None,
+                    },
+                ),
+            )
             await session.commit()
 
-        return result
+    async def stream_indexed_documents(
+        self,
+        indexer_version: int,
+        batch_size: int,
+    ) -> AsyncGenerator[list[DbBulkLoadedDocument], None]:
+        """Successfully indexed documents of a version, as of the start of the query (snapshot export)"""
+        async with self.session_factory() as session, session.begin():
+            result = await session.stream(
+                select(
+                    TableIndexedDocument.uri,
+                    TableIndexedDocument.indexed_source_version,
+                    TableIndexedDocument.raw_hash_if_indexed,
+                    TableIndexedDocument.parsed_hash_if_indexed,
+                )
+                .where(TableIndexedDocument.indexer_version == indexer_version)
+                .where(TableIndexedDocument.status == TableIndexedDocumentStatusEnum.indexing_success),
+            )
+            async for rows in result.partitions(batch_size):
+                yield [
+                    DbBulkLoadedDocument(
+                        uri=uri,
+                        source_version=cast("str", source_version),
+                        size=None,
+                        raw_hash=cast("str", raw_hash),
+                        parsed_hash=cast("str", parsed_hash),
+                    )
+                    for uri, source_version, raw_hash, parsed_hash in rows
+                ]
 
-    async def update_indexed_documents_status(
+    async def enqueue_indexed_documents(
         self,
-        ids: list[UUID],
-        status: TableIndexedDocumentStatusEnum,
-        error_status_message: str | None,
+        id_to_request: dict[UUID, DbIndexingRequest],
+        indexer_version: int,
     ) -> None:
+        """Set documents back to pending so that an indexer worker claims them.
+        An ongoing indexing of these documents loses its lease, so its result is discarded."""
         now = datetime.now(tz=dt.UTC)
+        async with self.session_factory() as session, session.begin():
+            # ORM bulk update by primary key (executemany), which includes the indexer version (partitioning)
+            await session.execute(
+                update(TableIndexedDocument),
+                [
+                    {
+                        "id": id,
+                        "indexer_version": indexer_version,
+                        "status": TableIndexedDocumentStatusEnum.pending,
+                        "last_status_change": now,
+                        "error_status_message": None,
+                        "source_version_to_index": request.source_version,
+                        "indexing_due": now + request.indexing_delay,
+                        "lease_owner": None,
+                        "lease_expiration": None,
+                        "indexing_attempts": 0,
+                    }
+                    for id, request in id_to_request.items()
+                ],
+            )
+            await session.commit()
 
+    async def claim_documents_to_index(
+        self,
+        indexer_version: int,
+        lease_owner: str,
+        lease_duration: timedelta,
+        limit: int,
+        max_attempts: int,
+    ) -> list[DbDocument]:
+        """Claim pending documents (or documents whose lease expired, the worker indexing them died) for indexing.
+        Rows locked by other workers claiming concurrently are skipped. Fast path."""
+        records = await self._fetch(
+            f"""UPDATE seemantic_schema.indexed_document SET
+                status = 'indexing', last_status_change = now(), error_status_message = NULL,
+                lease_owner = $2, lease_expiration = now() + $3::interval, indexing_attempts = indexing_attempts + 1
+            WHERE indexer_version = $1 AND id IN (
+                SELECT id FROM seemantic_schema.indexed_document
+                WHERE indexer_version = $1 AND (
+                    status = 'pending'
+                    OR (status = 'indexing' AND lease_expiration < now() AND indexing_attempts < $5)
+                )
+                ORDER BY indexing_due LIMIT $4 FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {_document_columns}""",  # noqa: S608
+            indexer_version,
+            lease_owner,
+            lease_duration,
+            limit,
+            max_attempts,
+        )
+        return [record_to_doc(record) for record in records]
+
+    async def renew_leases(self, ids: list[UUID], lease_owner: str, lease_duration: timedelta) -> None:
+        """Heartbeat of a worker: extend the lease of the documents it is indexing"""
         async with self.session_factory() as session, session.begin():
-            # see. https://docs.sqlalchemy.org/en/20/tutorial/data_update.html#update-from
             await session.execute(
                 update(TableIndexedDocument)
                 .where(TableIndexedDocument.id.in_(ids))
-                .values(status=status, last_status_change=now, error_status_message=error_status_message),
+                .where(TableIndexedDocument.lease_owner == lease_owner)
+                .values(lease_expiration=func.now() + lease_duration),
+            )
+            await session.commit()
+
+    async def fail_abandoned_documents(self, indexer_version: int, max_attempts: int) -> None:
+        """Documents whose indexing crashed max_attempts workers are not retried anymore"""
+        now = datetime.now(tz=dt.UTC)
+        async with self.session_factory() as session, session.begin():
+            await session.execute(
+                update(TableIndexedDocument)
+                .where(TableIndexedDocument.indexer_version == indexer_version)
+                .where(TableIndexedDocument.status == TableIndexedDocumentStatusEnum.indexing)
+                .where(TableIndexedDocument.lease_expiration < func.now())
+                .where(TableIndexedDocument.indexing_attempts >= max_attempts)
+                .values(
+                    status=TableIndexedDocumentStatusEnum.indexing_error,
+                    last_status_change=now,
+                    error_status_message=f"Indexing aborted after {max_attempts} attempts",
+                    lease_owner=None,
+                    lease_expiration=None,
+                ),
             )
             await session.commit()
 
+    async def mark_indexing_error(
+        self,
+        indexed_document_id: UUID,
+        indexer_version: int,
+        error_status_message: str,
+        lease_owner: str,
+    ) -> None:
+        """Set the document in error and release the lease, if it is still leased by this worker. Fast path."""
+        await self._fetch(
+            """UPDATE seemantic_schema.indexed_document SET
+                status = 'indexing_error', last_status_change = now(), error_status_message = $3,
+                lease_owner = NULL, lease_expiration = NULL
+            WHERE id = $1 AND indexer_version = $2 AND lease_owner = $4""",
+            indexed_document_id,
+            indexer_version,
+            error_status_message,
+            lease_owner,
+        )
+
     async def get_indexed_content_if_exists(
         self,
         raw_hash: str,
@@ -245,50 +938,158 @@ class DbService:
                 else None
             )
 
-    async def upsert_indexed_content(self, indexed_content: DbIndexedContent, indexer_version: int) -> UUID:
-        # create an indexed_content or update it if one with the same raw_hash already exists
+    async def touch_indexed_content(self, raw_hash: str, indexer_version: int) -> tuple[UUID, DbIndexedContent] | None:
+        """Same as get_indexed_content_if_exists, for an indexing reusing the indexed content: its creation datetime
+        is reset so that the garbage collector does not prune it before the document references it"""
+        records = await self._fetch(
+            """UPDATE seemantic_schema.indexed_content SET creation_datetime = now()
+            WHERE raw_hash = $1 AND indexer_version = $2
+            RETURNING id, parsed_hash""",
+            raw_hash,
+            indexer_version,
+        )
+        if not records:
+            return None
+        return records[0]["id"], DbIndexedContent(raw_hash=raw_hash, parsed_hash=records[0]["parsed_hash"])
+
+    async def upsert_indexed_content(self, raw_hash: str, parsed_hash: str, indexer_version: int) -> UUID:
+        """Insert (or touch, cf. touch_indexed_content) the indexed content and return its id, holding the lock of the
+        parsed hash shared: once it returns, the garbage collector cannot delete the parsed doc from the vector db
+        (cf. lock_unreferenced_parsed_hashes) until the indexed content is pruned"""
+        records = await self._fetch(
+            """WITH parsed_hash_lock AS (
+                SELECT pg_advisory_xact_lock_shared(hashtext('seemantic_schema.parsed_hash'), hashtext($3))
+            )
+            INSERT INTO seemantic_schema.indexed_content(id, raw_hash, parsed_hash, indexer_version)
+            SELECT $1, $2, $3, $4 FROM parsed_hash_lock
+            ON CONFLICT (raw_hash, indexer_version)
+            DO UPDATE SET parsed_hash = EXCLUDED.parsed_hash, creation_datetime = now()
+            RETURNING id""",
+            uuid7(),
+            raw_hash,
+            parsed_hash,
+            indexer_version,
+        )
+        return records[0]["id"]
+
+    @contextlib.asynccontextmanager
+    async def lock_unreferenced_parsed_hashes(self, parsed_hashes: list[str]) -> AsyncIterator[list[str]]:
+        """Lock the parsed hashes of the list and yield the ones referenced by no indexed content of any indexer
+        version: until exit, upsert_indexed_content waits for them, so that they can be deleted from the vector db
+        without an indexing reusing them meanwhile"""
         async with self.session_factory() as session, session.begin():
-            stmt = insert(TableIndexedContent).values(
-                id=uuid7(),
-                raw_hash=indexed_content.raw_hash,
-                parsed_hash=indexed_content.parsed_hash,
-                indexer_version=indexer_version,
+            # sorted, so that garbage collectors of several indexers do not deadlock
+            await session.execute(
+                text(
+                    """SELECT pg_advisory_xact_lock(hashtext('seemantic_schema.parsed_hash'), hashtext(parsed_hash))
+                    FROM unnest(CAST(:parsed_hashes AS TEXT[])) AS parsed_hash ORDER BY parsed_hash""",
+                ),
+                {"parsed_hashes": sorted(parsed_hashes)},
             )
+            result = await session.execute(
+                select(TableIndexedContent.parsed_hash)
+                .where(TableIndexedContent.parsed_hash.in_(parsed_hashes))
+                .distinct(),
+            )
+            referenced = set(result.scalars().all())
+            yield [parsed_hash for parsed_hash in parsed_hashes if parsed_hash not in referenced]
 
+    async def copy_indexed_contents(self, from_indexer_version: int, to_indexer_version: int) -> int:
+        """Copy the raw hash -> parsed hash of an indexer version to another one (with the same parser), so that
+        contents already indexed by the former are not parsed again. Returns the number of contents copied."""
+        async with self.session_factory() as session, session.begin():
+            stmt = (
+                insert(TableIndexedContent)
+                .from_select(
+                    [
+                        TableIndexedContent.id,
+                        TableIndexedContent.raw_hash,
+                        TableIndexedContent.parsed_hash,
+                        TableIndexedContent.indexer_version,
+                    ],
+                    select(
+                        func.gen_random_uuid(),
+                        TableIndexedContent.raw_hash,
+                        TableIndexedContent.parsed_hash,
+                        literal(to_indexer_version),
+                    ).where(TableIndexedContent.indexer_version == from_indexer_version),
+                )
+                .on_conflict_do_nothing(
+                    index_elements=[TableIndexedContent.raw_hash, TableIndexedContent.indexer_version],
+                )
+            )
+            result = await session.execute(stmt)
+            await session.commit()
+            return cast("CursorResult[Any]", result).rowcount
+
+    async def get_raw_hash_if_known(self, etag: str, size: int) -> str | None:
+        async with self.session_factory() as session, session.begin():
+            result = await session.execute(
+                select(TableSourceObjectContent.raw_hash)
+                .where(TableSourceObjectContent.etag == etag)
+                .where(TableSourceObjectContent.size == size),
+            )
+            return result.scalar_one_or_none()
+
+    async def upsert_source_object_content(self, etag: str, size: int, raw_hash: str) -> None:
+        async with self.session_factory() as session, session.begin():
+            stmt = insert(TableSourceObjectContent).values(id=uuid7(), etag=etag, size=size, raw_hash=raw_hash)
             stmt = stmt.on_conflict_do_update(
-                index_elements=[TableIndexedContent.raw_hash, TableIndexedContent.indexer_version],
-                set_={
-                    TableIndexedContent.parsed_hash: indexed_content.parsed_hash,
-                },
-            ).returning(TableIndexedContent.id)
+                index_elements=[TableSourceObjectContent.etag, TableSourceObjectContent.size],
+                set_={TableSourceObjectContent.raw_hash: raw_hash},
+            )
+            await session.execute(stmt)
+            await session.commit()
 
-            result = await session.execute(stmt)
-            uuid = result.scalar_one()
+    async def get_parsed_hash_if_exists(self, raw_hash: str, parser_version: int) -> str | None:
+        async with self.session_factory() as session, session.begin():
+            result = await session.execute(
+                select(TableParsedContent.parsed_hash)
+                .where(TableParsedContent.raw_hash == raw_hash)
+                .where(TableParsedContent.parser_version == parser_version),
+            )
+            return result.scalar_one_or_none()
+
+    async def upsert_parsed_content(self, raw_hash: str, parsed_hash: str, parser_version: int) -> None:
+        async with self.session_factory() as session, session.begin():
+            stmt = insert(TableParsedContent).values(
+                id=uuid7(),
+                raw_hash=raw_hash,
+                parsed_hash=parsed_hash,
+                parser_version=parser_version,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[TableParsedContent.raw_hash, TableParsedContent.parser_version],
+                set_={TableParsedContent.parsed_hash: parsed_hash},
+            )
+            await session.execute(stmt)
             await session.commit()
-            return uuid
 
-    async def update_indexed_document_indexed_content_id(
+    async def mark_indexing_success(
         self,
         indexed_document_id: UUID,
+        indexer_version: int,
         indexed_source_version: str | None,
         indexed_content_id: UUID,
-    ) -> None:
-        now = datetime.now(tz=dt.UTC)
-        async with self.session_factory() as session, session.begin():
-            await session.execute(
-                update(TableIndexedDocument)
-                .where(TableIndexedDocument.id == indexed_document_id)
-                .values(
-                    status=TableIndexedDocumentStatusEnum.indexing_success,
-                    last_status_change=now,
-                    last_indexing=now,
-                    error_status_message=None,
-                    indexed_source_version=indexed_source_version,
-                    indexed_content_id=indexed_content_id,
-                ),
-            )
-
-            await session.commit()
+        lease_owner: str,
+    ) -> bool:
+        """Mark the document as indexed with the indexed content (cf. upsert_indexed_content) and release the lease,
+        in one round trip. Returns False if the worker lost its lease (document re-enqueued meanwhile), in which case
+        the document is not updated. Fast path."""
+        records = await self._fetch(
+            """UPDATE seemantic_schema.indexed_document SET
+                status = 'indexing_success', last_status_change = now(), last_indexing = now(),
+                error_status_message = NULL, lease_owner = NULL, lease_expiration = NULL,
+                indexed_source_version = $3, indexed_content_id = $4
+            WHERE id = $1 AND indexer_version = $2 AND lease_owner = $5
+            RETURNING id""",
+            indexed_document_id,
+            indexer_version,
+            indexed_source_version,
+            indexed_content_id,
+            lease_owner,
+        )
+        return len(records) > 0
 
     async def get_documents_from_indexed_parsed_hashes(
         self,
@@ -320,6 +1121,15 @@ class DbService:
 
             return plain_objs
 
+    async def get_documents_page(self, indexer_version: int, after_uri: str | None, limit: int) -> list[DbDocument]:
+        """Documents ordered by uri, starting after after_uri (keyset pagination)"""
+        async with self.session_factory() as session:
+            stmt = select(TableIndexedDocument).where(TableIndexedDocument.indexer_version == indexer_version)
+            if after_uri is not None:
+                stmt = stmt.where(TableIndexedDocument.uri > after_uri)
+            result = await session.execute(stmt.order_by(TableIndexedDocument.uri).limit(limit))
+            return [to_doc(row) for row in result.scalars().all()]
+
     async def get_documents(self, uris: list[str], indexer_version: int) -> dict[str, DbDocument]:
         async with self.session_factory() as session:
             result = await session.execute(
@@ -333,58 +1143,287 @@ class DbService:
 
             return plain_objs
 
-    async def listen_to_indexed_documents_changes(
+    async def get_last_document_change_seq(self) -> int:
+        """Last seq of the change feed such that all changes up to it are visible, a client resuming from it misses
+        no change. seq values are allocated before commit (cf. DbChangeCursor): a missing seq may belong to a
+        transaction still in progress, however long. Below the last change whose xid horizon is settled (no running
+        transaction is older), missing seqs were rolled back; above it, the last seq is the one before the first
+        missing seq. Fast path, one statement (one snapshot)."""
+        records = await self._fetch(
+            """WITH settled AS (
+                SELECT coalesce(max(seq), 0) AS seq FROM (
+                    SELECT seq FROM seemantic_schema.indexed_document_change
+                    WHERE xid_horizon <= pg_snapshot_xmin(pg_current_snapshot())
+                    ORDER BY seq DESC LIMIT 1
+                ) last_settled
+            )
+            SELECT settled.seq AS settled_seq, change.seq
+            FROM settled LEFT JOIN seemantic_schema.indexed_document_change change ON change.seq > settled.seq
+            ORDER BY change.seq""",
+        )
+        last_seq: int = records[0]["settled_seq"]
+        for record in records:
+            if record["seq"] != last_seq + 1:
+                break  # first gap (or no change after the settled one)
+            last_seq = record["seq"]
+        return last_seq
+
+    async def get_first_document_change_seq(self) -> int | None:
+        """Oldest change still in the feed (older ones are pruned), None if the feed is empty"""
+        async with self.session_factory() as session:
+            result = await session.execute(select(func.min(TableIndexedDocumentChange.seq)))
+            return result.scalar_one_or_none()
+
+    async def get_document_changes(
         self,
-        queue: asyncio.Queue[DbIndexedDocumentEvent],
-        _indexer_version: int,
-    ) -> None:
-        # Define callback function to process notifications
-        def on_notification(_conn: asyncpg.Connection, _pid: int, _channel: str, payload: str) -> None:
-            # deserialize payload
-            json_payload = json.loads(payload)
-            event_type = json_payload["operation"].lower()
-            db_indexed_doc_json = json_payload["data"]
-            doc = DbDocument(
-                uri=db_indexed_doc_json["uri"],
-                indexed_document_id=db_indexed_doc_json["id"],
-                indexed_source_version=db_indexed_doc_json["indexed_source_version"],
-                last_indexing=db_indexed_doc_json["last_indexing"],
-                status=DbDocumentStatus(
-                    status=db_indexed_doc_json["status"],
-                    last_status_change=db_indexed_doc_json["last_status_change"],
-                    error_status_message=db_indexed_doc_json["error_status_message"],
-                ),
-                indexed_content=(
-                    DbIndexedContent(
-                        raw_hash=db_indexed_doc_json["raw_hash_if_indexed"],
-                        parsed_hash=db_indexed_doc_json["parsed_hash_if_indexed"],
-                    )
-                    if db_indexed_doc_json["indexed_content_id"]
-                    else None
+        since_seq: int,
+        limit: int = 1000,
+        indexer_version: int | None = None,
+        until_seq: int | None = None,
+    ) -> tuple[list[DbIndexedDocumentEvent], list[int]]:
+        """Changes with a seq greater than since_seq (and up to until_seq), with the current state of the changed
+        documents. Several changes of the same document are coalesced into the last one.
+        Also returns the seqs of all fetched changes, coalesced ones included, to advance cursors."""
+        async with self.session_factory() as session:
+            stmt = select(TableIndexedDocumentChange).where(TableIndexedDocumentChange.seq > since_seq)
+            if until_seq is not None:
+                stmt = stmt.where(TableIndexedDocumentChange.seq <= until_seq)
+            if indexer_version is not None:
+                stmt = stmt.where(TableIndexedDocumentChange.indexer_version == indexer_version)
+            result = await session.execute(stmt.order_by(TableIndexedDocumentChange.seq).limit(limit))
+            changes = result.scalars().all()
+            if not changes:
+                return [], []
+            ids = {change.indexed_document_id for change in changes}
+            result = await session.execute(select(TableIndexedDocument).where(TableIndexedDocument.id.in_(ids)))
+            id_to_doc = {row.id: to_doc(row) for row in result.scalars().all()}
+
+        last_change_by_id = {change.indexed_document_id: change for change in changes}
+        events: list[DbIndexedDocumentEvent] = []
+        # all seqs are returned (so that the caller can advance its cursor) but only the last change of a document
+        # carries its state
+        for change in changes:
+            doc = id_to_doc.get(change.indexed_document_id)
+            if last_change_by_id[change.indexed_document_id] is not change:
+                continue
+            event_type = cast("DbEventType", change.operation.lower()) if doc else "delete"
+            events.append(
+                DbIndexedDocumentEvent(
+                    seq=change.seq,
+                    event_type=event_type,
+                    uri=change.uri,
+                    indexer_version=change.indexer_version,
+                    document=doc,
                 ),
             )
-            doc_event = DbIndexedDocumentEvent(event_type=event_type, document=doc)
-            for client_queue in self.subscribed_clients:
-                if not client_queue.full():
-                    client_queue.put_nowait(doc_event)
+        return events, [change.seq for change in changes]
 
-        self.subscribed_clients.add(queue)
-        if not self.active_connection:
-            logging.info("First listener to indexed_documents_changes events, Start connection")
-            connection: asyncpg.Connection = await asyncpg.connect(self.raw_url)  # type: ignore[reportUnknownVariableType]
+    async def prune_document_changes(self, older_than: timedelta) -> None:
+        limit = datetime.now(tz=dt.UTC) - older_than
+        async with self.session_factory() as session, session.begin():
+            await session.execute(
+                delete(TableIndexedDocumentChange).where(TableIndexedDocumentChange.change_datetime < limit),
+            )
+            await session.commit()
+
+    async def prune_unreferenced_indexed_contents(self, older_than: timedelta, batch_size: int) -> int:
+        """Delete by batch the indexed contents referenced by no indexed document, created (or touched by an indexing)
+        before older_than (kept meanwhile for in-flight indexings and reverted documents). Returns the number of
+        indexed contents deleted."""
+        limit = datetime.now(tz=dt.UTC) - older_than
+        nb_deleted = 0
+        while True:
+            async with self.session_factory() as session, session.begin():
+                to_delete = (
+                    select(TableIndexedContent.id)
+                    .where(TableIndexedContent.creation_datetime < limit)
+                    .where(~exists().where(TableIndexedDocument.indexed_content_id == TableIndexedContent.id))
+                    .limit(batch_size)
+                )
+                # creation datetime checked again on the deleted rows: indexed contents touched meanwhile are kept
+                result = await session.execute(
+                    delete(TableIndexedContent)
+                    .where(TableIndexedContent.id.in_(to_delete))
+                    .where(TableIndexedContent.creation_datetime < limit),
+                )
+                await session.commit()
+            nb_batch_deleted = cast("CursorResult[Any]", result).rowcount
+            nb_deleted += nb_batch_deleted
+            if nb_batch_deleted < batch_size:
+                return nb_deleted
+
+    async def get_referenced_parsed_hashes(self, parsed_hashes: list[str]) -> set[str]:
+        """Parsed hashes of the list referenced by an indexed content of any indexer version (vector db tables can be
+        shared by indexer versions). Indexed documents reference their parsed hash through their indexed content."""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(TableIndexedContent.parsed_hash)
+                .where(TableIndexedContent.parsed_hash.in_(parsed_hashes))
+                .distinct(),
+            )
+            return set(result.scalars().all())
+
+    async def _dispatch_document_changes(self, cursor: DbChangeCursor) -> None:
+        """Fetch changes after the cursor and push them to subscribers"""
+        while True:
+            # before fetching: the changes up to it are all fetched, missing ones were rolled back
+            last_seq = await self.get_last_document_change_seq() if cursor.has_gap else None
+            events, fetched_seqs = await self.get_document_changes(cursor.last_seq, self._changes_batch_size)
+            for event in events:
+                if cursor.is_new(event.seq):
+                    for subscription in self.subscribed_clients:
+                        subscription.push(event)
+            cursor.advance(fetched_seqs)
+            complete = len(fetched_seqs) < self._changes_batch_size
+            if last_seq is not None and (complete or fetched_seqs[-1] >= last_seq) and last_seq > cursor.last_seq:
+                logging.info(f"Change seqs {cursor.last_seq + 1} to {last_seq} missing, rolled back")
+                cursor.skip_to(last_seq)
+            if complete or cursor.has_gap:
+                return
+
+    async def _resync_if_changes_pruned(self, cursor: DbChangeCursor) -> None:
+        """After a long disconnection, changes after the cursor may have been pruned: subscribers must resync"""
+        first_seq = await self.get_first_document_change_seq()
+        if first_seq is not None and first_seq > cursor.last_seq + 1:
+            logging.warning(f"Changes {cursor.last_seq + 1} to {first_seq - 1} were pruned, resync subscribers")
+            for subscription in self.subscribed_clients:
+                subscription.push_resync(nb_missed_events=first_seq - cursor.last_seq - 1)
+            cursor.skip_to(first_seq - 1)
+
+    @contextlib.asynccontextmanager
+    async def _change_notifications(self, on_notification: Callable[[str], None]) -> AsyncIterator[Callable[[], bool]]:
+        """LISTEN to change notifications, yields a function telling whether they are still received.
+        With a notification relay, only the leader process of the host listens, the others follow it."""
+        relay = self._notification_relay
+        if relay is not None and not relay.acquire_leadership():
+            async with relay.follow(on_notification) as is_following:
+                yield is_following
+            return
+
+        def on_listened_notification(_conn: asyncpg.Connection, _pid: int, _channel: str, payload: str) -> None:
+            on_notification(payload)
+            if relay is not None:
+                relay.forward(payload)
+
+        def on_termination(_conn: asyncpg.Connection) -> None:
+            on_notification("")
+
+        connection: asyncpg.Connection | None = None
+        try:
+            connection = await asyncpg.connect(self.raw_url)  # type: ignore[reportUnknownVariableType]
             self.active_connection = connection
-            await connection.add_listener("table_changes", on_notification)  # type: ignore[reportUnknownMemberType]
+            await connection.add_listener("table_changes", on_listened_notification)  # type: ignore[reportUnknownMemberType]
+            connection.add_termination_listener(on_termination)  # type: ignore[reportUnknownMemberType]
             await connection.execute("LISTEN table_changes")  # type: ignore[reportUnknownMemberType]
-
-    async def removed_listener_to_indexed_documents_changes(self, queue: asyncio.Queue[DbIndexedDocumentEvent]) -> None:
-        self.subscribed_clients.remove(queue)
-        if not self.subscribed_clients:
-            connection: asyncpg.Connection | None = self.active_connection
-            if connection is not None:
+            if relay is not None:
+                await relay.serve()
+            yield lambda: not connection.is_closed()  # type: ignore[reportUnknownMemberType, reportOptionalMemberAccess]
+        finally:
+            self.active_connection = None
+            if relay is not None:
+                await relay.stop_serving()
+            if connection is not None and not connection.is_closed():  # type: ignore[reportUnknownMemberType]
+                await connection.close()  # type: ignore[reportUnknownMemberType], # this cleans all listeners
+
+    async def _listen_document_changes(self, started: asyncio.Event) -> None:
+        """Background task: LISTEN to change notifications and dispatch the changes.
+        After a connection loss, it reconnects and resumes from its cursor, so no change is missed."""
+        cursor = self._change_cursor
+        changes_available = asyncio.Event()
+
+        def on_notification(_payload: str) -> None:
+            # payload is {"seq", "id", "operation"}, changes are fetched in batch from the change feed
+            changes_available.set()
+
+        try:
+            while self.subscribed_clients:
                 try:
-                    logging.info("Last listener to indexed_documents_changes events removed, Closing connection")
-                    await connection.close()  # type: ignore[reportUnknownMemberType], # this cleans all listeners
-                except asyncio.CancelledError:
-                    pass
-                finally:
-                    self.active_connection = None
+                    async with self._change_notifications(on_notification) as is_listening:
+                        if started.is_set():
+                            await self._resync_if_changes_pruned(cursor)
+                        started.set()
+                        while is_listening():
+                            changes_available.clear()
+                            # catch up first: changes committed while we were not listening
+                            await self._dispatch_document_changes(cursor)
+                            timeout = 1.0 if cursor.has_gap else 30.0
+                            with contextlib.suppress(TimeoutError):
+                                await asyncio.wait_for(changes_available.wait(), timeout=timeout)
+                    logging.warning("Connection listening to indexed_documents_changes lost, reconnecting")
+                except NotificationRelayUnavailableError:
+                    # the leader is binding its socket, or it stopped and one of its followers takes over
+                    await asyncio.sleep(0.5)
+                except (OSError, asyncpg.PostgresError) as e:
+                    logging.warning(f"Error listening to indexed_documents_changes: {e}, reconnecting in 5 seconds...")
+                    await asyncio.sleep(5)
+                except Exception:
+                    # e.g. errors fetching the changes: the listener must survive them, or subscribers get no event
+                    logging.exception("Error dispatching indexed_documents_changes, reconnecting in 5 seconds...")
+                    await asyncio.sleep(5)
+        finally:
+            if self._notification_relay is not None:
+                self._notification_relay.release_leadership()  # a follower takes over
+
+    async def listen_to_indexed_documents_changes(
+        self,
+        max_pending_events: int,
+        _indexer_version: int,
+        since_seq: int | None = None,
+    ) -> DbEventSubscription:
+        """Subscribe to changes of indexed documents.
+        If since_seq is given, changes after since_seq that were already dispatched are replayed first."""
+        self._nb_subscriptions += 1
+        subscription = DbEventSubscription(self._nb_subscriptions, max_pending_events)
+
+        if self._listening_task is None:
+            logging.info("First listener to indexed_documents_changes events, Start connection")
+            self._change_cursor = DbChangeCursor(await self.get_last_document_change_seq())
+            self.subscribed_clients.add(subscription)
+            started = asyncio.Event()
+            self._listening_task = asyncio.create_task(self._listen_document_changes(started))
+            self._listening_task.add_done_callback(self._on_listening_task_done)
+            try:
+                await asyncio.wait_for(started.wait(), timeout=self._listen_start_timeout)
+            except TimeoutError as e:
+                await self.removed_listener_to_indexed_documents_changes(subscription)
+                raise TimeoutError(
+                    f"Not listening to indexed_documents_changes after {self._listen_start_timeout} seconds",
+                ) from e
+        else:
+            self.subscribed_clients.add(subscription)
+
+        # replay only what was already dispatched (changes after a gap included), the rest will be dispatched to
+        # every subscriber
+        cursor = self._change_cursor
+        while since_seq is not None and since_seq < cursor.dispatched_seq:
+            events, fetched_seqs = await self.get_document_changes(since_seq, self._changes_batch_size)
+            for event in events:
+                if not cursor.is_new(event.seq):
+                    subscription.push(event)
+            since_seq = fetched_seqs[-1] if fetched_seqs else None
+        return subscription
+
+    def get_dispatched_document_change_seq(self) -> int:
+        """All changes up to this seq were dispatched to the subscribers (cursor of the listener, that is started by
+        the first subscription)"""
+        return self._change_cursor.last_seq
+
+    def _on_listening_task_done(self, task: asyncio.Task[None]) -> None:
+        # a listener that stopped must not prevent the next subscriber from starting a new one
+        if self._listening_task is task:
+            self._listening_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Listener of indexed_documents_changes stopped", exc_info=task.exception())
+
+    def get_subscribers_stats(self) -> list[DbSubscriberStats]:
+        return [subscription.stats() for subscription in self.subscribed_clients]
+
+    async def removed_listener_to_indexed_documents_changes(self, subscription: DbEventSubscription) -> None:
+        self.subscribed_clients.remove(subscription)
+        if not self.subscribed_clients and self._listening_task is not None:
+            logging.info("Last listener to indexed_documents_changes events removed, Closing connection")
+            task = self._listening_task
+            self._listening_task = None
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
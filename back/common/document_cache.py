@@ -0,0 +1,79 @@
+import logging
+import os
+import pathlib
+import uuid
+
+from pydantic import BaseModel
+
+logging = logging.getLogger(__name__)
+
+
+class DocumentCacheSettings(BaseModel, frozen=True):
+    # shared by the processes of a host, in memory if on a tmpfs (the default /dev/shm is shared memory)
+    path: pathlib.Path = pathlib.Path("/dev/shm/seemantic_parsed_docs")  # noqa: S108
+    max_size_mb: float = 1024  # least recently used documents are evicted to stay below this size
+
+
+class DocumentCache:
+    """Markdown content of parsed documents, shared by the processes of a host: one file per parsed hash, the
+    directory being the cross-process index. Parsed documents are immutable (content addressed), entries are never
+    invalidated, they are only evicted (least recently read first) once the cache is full."""
+
+    path: pathlib.Path
+    max_size: int  # in bytes
+    _size_estimate: int  # size of the cache as of the last scan, plus what this process wrote since
+
+    def __init__(self, settings: DocumentCacheSettings) -> None:
+        self.path = settings.path
+        self.max_size = int(settings.max_size_mb * 2**20)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._size_estimate = self._scan_size()
+
+    def _entry_path(self, parsed_hash: str) -> pathlib.Path:
+        return self.path / f"{parsed_hash}.md"
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self.path.glob("*.md"))
+
+    def get(self, parsed_hashes: list[str]) -> dict[str, str]:
+        """Cached contents of the parsed hashes, missing ones are absent"""
+        contents: dict[str, str] = {}
+        for parsed_hash in parsed_hashes:
+            entry_path = self._entry_path(parsed_hash)
+            try:
+                contents[parsed_hash] = entry_path.read_text(encoding="utf-8")
+                os.utime(entry_path)  # marks it as recently used
+            except FileNotFoundError:
+                pass  # not cached, or evicted by another process
+        return contents
+
+    def put(self, contents: dict[str, str]) -> None:
+        for parsed_hash, content in contents.items():
+            # written in a temporary file renamed once complete, readers never see a partial entry
+            data = content.encode()
+            tmp_path = self.path / f".{parsed_hash}.{uuid.uuid4().hex}.tmp"
+            tmp_path.write_bytes(data)
+            tmp_path.replace(self._entry_path(parsed_hash))
+            self._size_estimate += len(data)
+        if self._size_estimate > self.max_size:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the cache is 80% full (other processes may evict too)"""
+        entries: list[tuple[float, int, pathlib.Path]] = []
+        for entry_path in self.path.glob("*.md"):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        nb_evicted = 0
+        for _, entry_size, entry_path in sorted(entries):
+            if size <= self.max_size * 0.8:
+                break
+            entry_path.unlink(missing_ok=True)
+            size -= entry_size
+            nb_evicted += 1
+        self._size_estimate = size
+        logging.info(f"{nb_evicted} parsed docs evicted from document cache")
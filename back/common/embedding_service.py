@@ -1,3 +1,4 @@
+import asyncio
 from typing import Any, Final, Literal
 
 from litellm import aembedding  # type: ignore[reportUnknownVariableType]
@@ -14,6 +15,7 @@ class EmbeddingSettings(BaseModel, frozen=True):
     litellm_model: str
     litellm_query_kwargs: SettingsDict
     litellm_document_kwargs: SettingsDict
+    dimensions: int = 1024  # jina-embeddings-v3 supports matryoshka truncation (cf. lance_db.candidate_dimensions)
 
 
 class EmbeddingService:
@@ -40,7 +42,7 @@ class EmbeddingService:
         response_litellm = await aembedding(
             model="jina_ai/jina-embeddings-v3",
             input=content,
-            dimensions=1024,
+            dimensions=self.settings.dimensions,
             api_key=self.litellm_api_key,
             # kwargs
             **(self._document_kwargs if task == "document" else self._query_kwargs),
@@ -84,6 +86,43 @@ class EmbeddingService:
 
         return results
 
+    async def embed_documents(
+        self,
+        documents: list[tuple[ParsedDocument, list[Chunk]]],
+        max_concurrent_requests: int = 8,
+    ) -> list[list[EmbeddedChunk]]:
+        """
+        embed the chunks of several documents (bulk import): a request groups the passages of several documents,
+        and requests are sent concurrently. Nb: passages are embedded independently of each other (no late chunking).
+        """
+        groups: list[list[tuple[int, Chunk, str]]] = []  # passages of a request: (document index, chunk, content)
+        current_group: list[tuple[int, Chunk, str]] = []
+        current_group_size = 0
+        for document_index, (document, chunks) in enumerate(documents):
+            for chunk in chunks:
+                content = document[chunk]
+                if current_group and current_group_size + len(content) > self._max_chars:
+                    groups.append(current_group)
+                    current_group = []
+                    current_group_size = 0
+                current_group.append((document_index, chunk, content))
+                current_group_size += len(content)
+        if current_group:
+            groups.append(current_group)
+
+        semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+        async def embed_group(group: list[tuple[int, Chunk, str]]) -> list[Embedding]:
+            async with semaphore:
+                return await self._embed("document", [content for _, _, content in group])
+
+        results: list[list[EmbeddedChunk]] = [[] for _ in documents]
+        groups_embeddings = await asyncio.gather(*(embed_group(group) for group in groups))
+        for group, embeddings in zip(groups, groups_embeddings, strict=True):
+            for (document_index, chunk, _), embedding in zip(group, embeddings, strict=True):
+                results[document_index].append(EmbeddedChunk(chunk=chunk, embedding=embedding))
+        return results
+
     async def embed_query(self, query: str) -> Embedding:
 
         embeddings = await self._embed("query", [query])
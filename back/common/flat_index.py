@@ -0,0 +1,329 @@
+# pyright: strict, reportMissingTypeStubs=false, reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false
+import asyncio
+import fcntl
+import logging
+import os
+import pathlib
+import shutil
+from collections.abc import AsyncIterable, AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Final
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel
+
+logging = logging.getLogger(__name__)
+
+_meta_file_name: Final[str] = "meta.json"
+_hashes_file_name: Final[str] = "parsed_hashes.txt"
+# row arrays, appended in this order, meta.json being written last
+_row_files: Final[dict[str, type[np.generic]]] = {
+    "vectors.f16": np.float16,
+    "norms.f32": np.float32,
+    "document_ids.i32": np.int32,
+    "starts.i64": np.int64,
+    "ends.i64": np.int64,
+}
+
+
+class FlatIndexSettings(BaseModel, frozen=True):
+    path: pathlib.Path  # local directory of the snapshots (one per chunk table), memory mapped
+    block_size: int = 8192  # rows per block, vectors of a block are converted to float32 at once
+    nb_threads: int | None = None  # blocks searched in parallel, default: number of cpus
+    # the snapshot is rebuilt once this fraction of its rows belong to deleted documents
+    max_deleted_fraction: float = 0.5
+
+
+class FlatIndexMeta(BaseModel):
+    dimensions: int
+    nb_rows: int
+    nb_documents: int
+    deleted_documents: list[int]
+
+
+class FlatIndexRows:
+    """Chunks appended to the snapshot"""
+
+    vectors: npt.NDArray[np.float16]
+    parsed_hashes: list[str]
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+
+    def __init__(
+        self,
+        vectors: npt.NDArray[np.floating],
+        parsed_hashes: list[str],
+        starts: npt.NDArray[np.int64],
+        ends: npt.NDArray[np.int64],
+    ) -> None:
+        self.vectors = vectors.astype(np.float16)
+        self.parsed_hashes = parsed_hashes
+        self.starts = starts
+        self.ends = ends
+
+
+class FlatIndexResult:
+    """Nearest chunks, by increasing distance"""
+
+    parsed_hashes: list[str]
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+    distances: npt.NDArray[np.float32]
+
+    def __init__(
+        self,
+        parsed_hashes: list[str],
+        starts: npt.NDArray[np.int64],
+        ends: npt.NDArray[np.int64],
+        distances: npt.NDArray[np.float32],
+    ) -> None:
+        self.parsed_hashes = parsed_hashes
+        self.starts = starts
+        self.ends = ends
+        self.distances = distances
+
+
+type FetchRows = Callable[[set[str]], AsyncIterable[FlatIndexRows]]
+
+
+def block_distances(
+    vectors: npt.NDArray[np.float16],
+    norms: npt.NDArray[np.float32],
+    query: npt.NDArray[np.float32],
+    distance_metric: str,
+) -> npt.NDArray[np.float32]:
+    """Same distances as vector_distances (lance distances), with the norms of the vectors precomputed"""
+    dot = vectors.astype(np.float32) @ query
+    if distance_metric == "L2":
+        return norms**2 - 2 * dot + np.dot(query, query)
+    if distance_metric == "dot":
+        return 1 - dot
+    return 1 - dot / (norms * np.linalg.norm(query) + 1e-12)
+
+
+def top_k(distances: npt.NDArray[np.float32], k: int) -> npt.NDArray[np.intp]:
+    """Indices of the k smallest distances, unordered"""
+    if len(distances) <= k:
+        return np.arange(len(distances))
+    return np.argpartition(distances, k)[:k]
+
+
+def _map_rows[T: np.generic](path: pathlib.Path, dtype: type[T], shape: tuple[int, ...]) -> npt.NDArray[T]:
+    if shape[0] == 0:
+        return np.empty(shape, dtype=dtype)  # empty files cannot be mapped
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class _Snapshot:
+    """Immutable view of the rows of a snapshot: a sync swaps it for a new one, searches in progress keep theirs
+    (files are only appended, the mapped prefix stays valid)"""
+
+    meta: FlatIndexMeta
+    vectors: npt.NDArray[np.float16]
+    norms: npt.NDArray[np.float32]
+    document_ids: npt.NDArray[np.int32]
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+    parsed_hashes: list[str]  # by document id
+    document_ids_by_hash: dict[str, int]  # documents not deleted
+    deleted_rows: npt.NDArray[np.bool_] | None  # None if no document is deleted
+
+    def __init__(self, path: pathlib.Path, meta: FlatIndexMeta) -> None:
+        self.meta = meta
+        self.vectors = _map_rows(path / "vectors.f16", np.float16, (meta.nb_rows, meta.dimensions))
+        self.norms = _map_rows(path / "norms.f32", np.float32, (meta.nb_rows,))
+        self.document_ids = _map_rows(path / "document_ids.i32", np.int32, (meta.nb_rows,))
+        self.starts = _map_rows(path / "starts.i64", np.int64, (meta.nb_rows,))
+        self.ends = _map_rows(path / "ends.i64", np.int64, (meta.nb_rows,))
+
+        hashes_path = path / _hashes_file_name
+        lines = hashes_path.read_text(encoding="utf-8").splitlines() if hashes_path.exists() else []
+        self.parsed_hashes = lines[: meta.nb_documents]
+        deleted = set(meta.deleted_documents)
+        self.document_ids_by_hash = {
+            parsed_hash: document_id
+            for document_id, parsed_hash in enumerate(self.parsed_hashes)
+            if document_id not in deleted
+        }
+        self.deleted_rows = np.isin(self.document_ids, meta.deleted_documents) if deleted else None
+
+
+class FlatIndex:
+    """Exact nearest chunks search over a memory-mapped snapshot of the vectors of a chunk table, with parallel
+    arrays for the parsed hash (document id) and offsets of each chunk. Up to a few million chunks, scanning the
+    float16 matrix in RAM is faster than an ANN search on the object store, and it is exact (compact vectors and
+    quantized indices are not used).
+    The snapshot is kept in sync incrementally: chunks of new parsed docs are appended, rows of deleted parsed docs
+    are masked, and the snapshot is rebuilt once too many rows are masked. Syncs are serialized by a file lock, so
+    the directory can be shared by the processes of a host."""
+
+    path: pathlib.Path
+    distance_metric: str
+    _settings: FlatIndexSettings
+    _dimensions: int
+    _snapshot: _Snapshot
+    _executor: ThreadPoolExecutor
+
+    def __init__(self, settings: FlatIndexSettings, table_name: str, dimensions: int, distance_metric: str) -> None:
+        self._settings = settings
+        self.path = settings.path / table_name
+        self._dimensions = dimensions
+        self.distance_metric = distance_metric
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.nb_threads or os.cpu_count(),
+            thread_name_prefix="flat-index",
+        )
+        self._snapshot = _Snapshot(self.path, self._empty_meta())
+
+    def _empty_meta(self) -> FlatIndexMeta:
+        return FlatIndexMeta(dimensions=self._dimensions, nb_rows=0, nb_documents=0, deleted_documents=[])
+
+    def _read_meta(self) -> FlatIndexMeta:
+        meta_path = self.path / _meta_file_name
+        if not meta_path.exists():
+            return self._empty_meta()
+        meta = FlatIndexMeta.model_validate_json(meta_path.read_text(encoding="utf-8"))
+        if meta.dimensions != self._dimensions:
+            logging.warning(f"Flat index {self.path} has {meta.dimensions} dimensions, it is rebuilt")
+            self._reset()
+            return self._empty_meta()
+        return meta
+
+    def _write_meta(self, meta: FlatIndexMeta) -> None:
+        tmp_path = self.path / f"{_meta_file_name}.tmp"
+        tmp_path.write_text(meta.model_dump_json(), encoding="utf-8")
+        tmp_path.replace(self.path / _meta_file_name)
+
+    def _reset(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path.mkdir(parents=True)
+
+    def _truncate(self, meta: FlatIndexMeta) -> None:
+        """Drop what an interrupted sync appended after the rows of meta"""
+        for file_name, dtype in _row_files.items():
+            file_path = self.path / file_name
+            row_size = np.dtype(dtype).itemsize * (meta.dimensions if file_name == "vectors.f16" else 1)
+            if file_path.exists() and file_path.stat().st_size > meta.nb_rows * row_size:
+                with file_path.open("r+b") as file:
+                    file.truncate(meta.nb_rows * row_size)
+        hashes_path = self.path / _hashes_file_name
+        if hashes_path.exists():
+            lines = hashes_path.read_text(encoding="utf-8").splitlines()
+            if len(lines) != meta.nb_documents:
+                hashes_path.write_text("".join(f"{line}\n" for line in lines[: meta.nb_documents]), encoding="utf-8")
+
+    def _append(self, meta: FlatIndexMeta, rows: FlatIndexRows, document_ids: dict[str, int]) -> FlatIndexMeta:
+        """Append the rows (of parsed docs not in the snapshot) and return the meta including them. document_ids:
+        ids of the parsed docs appended by this sync, a parsed doc may span several appends."""
+        new_hashes = [
+            parsed_hash for parsed_hash in dict.fromkeys(rows.parsed_hashes) if parsed_hash not in document_ids
+        ]
+        for i, parsed_hash in enumerate(new_hashes):
+            document_ids[parsed_hash] = meta.nb_documents + i
+        arrays: dict[str, npt.NDArray[np.generic]] = {
+            "vectors.f16": rows.vectors,
+            "norms.f32": np.linalg.norm(rows.vectors.astype(np.float32), axis=1),
+            "document_ids.i32": np.array([document_ids[parsed_hash] for parsed_hash in rows.parsed_hashes]),
+            "starts.i64": rows.starts,
+            "ends.i64": rows.ends,
+        }
+        for file_name, dtype in _row_files.items():
+            with (self.path / file_name).open("ab") as file:
+                file.write(np.ascontiguousarray(arrays[file_name], dtype=dtype).tobytes())
+        with (self.path / _hashes_file_name).open("a", encoding="utf-8") as file:
+            file.write("".join(f"{parsed_hash}\n" for parsed_hash in new_hashes))
+        return meta.model_copy(
+            update={
+                "nb_rows": meta.nb_rows + len(rows.parsed_hashes),
+                "nb_documents": meta.nb_documents + len(new_hashes),
+            },
+        )
+
+    @asynccontextmanager
+    async def _lock(self) -> AsyncIterator[None]:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with (self.path.parent / f"{self.path.name}.lock").open("w") as lock_file:
+            await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+            yield
+
+    async def sync(self, stored_hashes: set[str], fetch_rows: FetchRows) -> None:
+        """Make the snapshot contain the chunks of the stored parsed hashes: fetch_rows yields the chunks of the given
+        parsed hashes, which are appended"""
+        async with self._lock():
+            meta = self._read_meta()  # rows may have been appended by another process
+            self._truncate(meta)
+            snapshot = _Snapshot(self.path, meta)
+            deleted_rows = int(snapshot.deleted_rows.sum()) if snapshot.deleted_rows is not None else 0
+            if deleted_rows > meta.nb_rows * self._settings.max_deleted_fraction:
+                logging.info(f"Rebuilding flat index {self.path}: {deleted_rows}/{meta.nb_rows} rows deleted")
+                self._reset()
+                meta = self._empty_meta()
+                snapshot = _Snapshot(self.path, meta)
+
+            removed_hashes = set(snapshot.document_ids_by_hash) - stored_hashes
+            new_hashes = stored_hashes - set(snapshot.document_ids_by_hash)
+            if removed_hashes:
+                deleted_documents = [snapshot.document_ids_by_hash[parsed_hash] for parsed_hash in removed_hashes]
+                meta = meta.model_copy(update={"deleted_documents": meta.deleted_documents + deleted_documents})
+            if new_hashes:
+                document_ids: dict[str, int] = {}
+                async for rows in fetch_rows(new_hashes):
+                    meta = await asyncio.to_thread(self._append, meta, rows, document_ids)
+            if removed_hashes or new_hashes:
+                self._write_meta(meta)
+                logging.info(
+                    f"Flat index {self.path}: {len(new_hashes)} parsed docs added, {len(removed_hashes)} removed",
+                )
+            self._snapshot = _Snapshot(self.path, meta)
+
+    def parsed_hashes(self) -> set[str]:
+        return set(self._snapshot.document_ids_by_hash)
+
+    def _search(self, query: npt.NDArray[np.float32], limit: int, parsed_hashes: list[str] | None) -> FlatIndexResult:
+        snapshot = self._snapshot
+        rows: npt.NDArray[np.intp] | None = None  # searched rows, all (but deleted ones) if None
+        if parsed_hashes is not None:
+            document_ids = [
+                snapshot.document_ids_by_hash[h] for h in parsed_hashes if h in snapshot.document_ids_by_hash
+            ]
+            rows = np.flatnonzero(np.isin(snapshot.document_ids, document_ids))
+        nb_rows = len(rows) if rows is not None else snapshot.meta.nb_rows
+        block_size = self._settings.block_size
+
+        def search_block(start: int) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.float32]]:
+            if rows is None:
+                block_rows = np.arange(start, min(start + block_size, nb_rows))
+                distances = block_distances(
+                    snapshot.vectors[start : start + block_size],
+                    snapshot.norms[start : start + block_size],
+                    query,
+                    self.distance_metric,
+                )
+                if snapshot.deleted_rows is not None:
+                    distances[snapshot.deleted_rows[start : start + block_size]] = np.inf
+            else:
+                block_rows = rows[start : start + block_size]
+                vectors, norms = snapshot.vectors[block_rows], snapshot.norms[block_rows]
+                distances = block_distances(vectors, norms, query, self.distance_metric)
+            best = top_k(distances, limit)
+            return block_rows[best], distances[best]
+
+        # blocks are searched in parallel: numpy releases the GIL in conversions and matrix products
+        blocks = list(self._executor.map(search_block, range(0, nb_rows, block_size)))
+        candidate_rows = np.concatenate([block[0] for block in blocks]) if blocks else np.empty(0, np.intp)
+        candidate_distances = np.concatenate([block[1] for block in blocks]) if blocks else np.empty(0, np.float32)
+        order = np.argsort(candidate_distances, kind="stable")[:limit]
+        order = order[np.isfinite(candidate_distances[order])]  # deleted rows
+        best_rows = candidate_rows[order]
+        return FlatIndexResult(
+            parsed_hashes=[snapshot.parsed_hashes[document_id] for document_id in snapshot.document_ids[best_rows]],
+            starts=np.asarray(snapshot.starts[best_rows]),
+            ends=np.asarray(snapshot.ends[best_rows]),
+            distances=candidate_distances[order].astype(np.float32),
+        )
+
+    async def search(self, query: list[float], limit: int, parsed_hashes: list[str] | None = None) -> FlatIndexResult:
+        """Nearest chunks (of the given parsed docs only, if given)"""
+        return await asyncio.to_thread(self._search, np.array(query, dtype=np.float32), limit, parsed_hashes)
@@ -0,0 +1,223 @@
+import asyncio
+import fcntl
+import json
+import logging
+import pathlib
+import shutil
+from typing import Final, TextIO
+
+from minio import Minio
+from pydantic import BaseModel
+
+from common.minio_service import MinioSettings
+
+logging = logging.getLogger(__name__)
+
+lance_prefix: Final[str] = "lancedb"
+_index_file_name: Final[str] = ".cache_index.json"  # etag and size of the mirrored files, in the table directory
+
+
+class LanceCacheSettings(BaseModel, frozen=True):
+    path: pathlib.Path  # local disk (NVMe) directory of the mirrored tables
+    max_size_gb: float = 50  # tables are evicted (least recently used first) to stay below this size
+
+
+class CachedFile(BaseModel, frozen=True):
+    etag: str
+    size: int
+
+
+def _is_manifest(key: str) -> bool:
+    return key.startswith("_versions/") or key.endswith(".manifest")
+
+
+def files_to_download(remote_files: dict[str, CachedFile], local_files: dict[str, CachedFile]) -> list[str]:
+    """Keys of the remote files missing or different locally. Version manifests come last: a version is visible
+    locally only once all the fragment and index files it references are."""
+    missing = [key for key, file in remote_files.items() if local_files.get(key) != file]
+    return sorted(missing, key=_is_manifest)
+
+
+def tables_to_evict(
+    table_sizes: dict[str, tuple[int, float]],
+    kept_tables: set[str],
+    needed: int,
+    max_size: int,
+) -> list[str]:
+    """Least recently used tables to evict so that needed bytes fit in max_size. table_sizes: name -> (size in bytes,
+    last access time) of the mirrored tables, kept_tables (being mirrored, or found in use) are never evicted."""
+    total_size = sum(size for size, _ in table_sizes.values())
+    to_evict: list[str] = []
+    for table_name, (size, _) in sorted(table_sizes.items(), key=lambda item: item[1][1]):
+        if total_size + needed <= max_size:
+            break
+        if table_name not in kept_tables:
+            to_evict.append(table_name)
+            total_size -= size
+    return to_evict
+
+
+def _try_lock(lock_path: pathlib.Path, operation: int) -> TextIO | None:
+    """Open and lock the lock file without blocking, None if a conflicting lock is held (by any process, or by another
+    open of the file in this process)"""
+    lock_file = lock_path.open("w")
+    try:
+        fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+class LanceDiskCache:
+    """Read-through cache of lance tables stored in minio: each table is mirrored in a local directory, from which it
+    is opened, so that queries read local files instead of making object store round trips.
+    Dataset files (fragments, deletion files, indices, version manifests) are immutable: a sync lists the remote
+    files and downloads the new ones only (validated by etag), manifests last so that a new version is visible once
+    complete. Files removed remotely (compaction, cleanup of old versions) are removed locally.
+    The cache is bounded: least recently synced tables are evicted, and a table that does not fit is not mirrored.
+    Mirrors are read only, tables are written in minio. The directory can be shared by the processes of a host, syncs
+    of a table are serialized by a file lock, and the processes reading a mirror hold a shared lock on its readers
+    file: a mirror is only deleted (evicted, grown too big) by a process holding both exclusively."""
+
+    path: pathlib.Path
+    max_size: int  # in bytes
+    _minio_client: Minio
+    _bucket_name: str
+    _reader_locks: dict[str, TextIO]  # table name -> readers file locked shared, for the mirrors read by this process
+
+    def __init__(self, settings: LanceCacheSettings, minio: MinioSettings) -> None:
+        self.path = settings.path
+        self.max_size = int(settings.max_size_gb * 2**30)
+        self._minio_client = Minio(
+            minio.endpoint,
+            access_key=minio.access_key,
+            secret_key=minio.secret_key,
+            secure=minio.use_tls,
+        )
+        self._bucket_name = minio.bucket
+        self._reader_locks = {}
+
+    def _table_path(self, table_name: str) -> pathlib.Path:
+        return self.path / f"{table_name}.lance"
+
+    def _sync_lock_path(self, table_name: str) -> pathlib.Path:
+        return self.path / f"{table_name}.lock"
+
+    def _readers_lock_path(self, table_name: str) -> pathlib.Path:
+        return self.path / f"{table_name}.readers"
+
+    def _start_reading(self, table_name: str) -> None:
+        if table_name not in self._reader_locks:
+            reader_lock = self._readers_lock_path(table_name).open("w")
+            # called with the sync lock held: no deletion of the mirror in progress, it does not wait
+            fcntl.flock(reader_lock, fcntl.LOCK_SH)
+            self._reader_locks[table_name] = reader_lock
+
+    def _stop_reading(self, table_name: str) -> None:
+        reader_lock = self._reader_locks.pop(table_name, None)
+        if reader_lock is not None:
+            reader_lock.close()
+
+    def _delete_if_unread(self, table_name: str) -> bool:
+        """Delete the mirror of the table unless a process reads it, the sync lock of the table being held"""
+        readers_lock = _try_lock(self._readers_lock_path(table_name), fcntl.LOCK_EX)
+        if readers_lock is None:
+            return False
+        with readers_lock:
+            shutil.rmtree(self._table_path(table_name), ignore_errors=True)
+        return True
+
+    def _evict(self, table_name: str) -> bool:
+        """Delete the mirror of the table unless a process syncs or reads it. Returns whether it was deleted."""
+        sync_lock = _try_lock(self._sync_lock_path(table_name), fcntl.LOCK_EX)
+        if sync_lock is None:
+            return False
+        with sync_lock:
+            return self._delete_if_unread(table_name)
+
+    def _read_index(self, table_name: str) -> dict[str, CachedFile]:
+        index_path = self._table_path(table_name) / _index_file_name
+        if not index_path.exists():
+            return {}
+        return {key: CachedFile(**file) for key, file in json.loads(index_path.read_text(encoding="utf-8")).items()}
+
+    def _write_index(self, table_name: str, files: dict[str, CachedFile]) -> None:
+        index_path = self._table_path(table_name) / _index_file_name
+        tmp_path = index_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({key: file.model_dump() for key, file in files.items()}), encoding="utf-8")
+        tmp_path.replace(index_path)
+
+    def _mirrored_tables(self) -> dict[str, tuple[int, float]]:
+        """name -> (size, last access time) of the mirrored tables"""
+        tables: dict[str, tuple[int, float]] = {}
+        if not self.path.exists():
+            return tables
+        for table_path in self.path.glob("*.lance"):
+            index_path = table_path / _index_file_name
+            if index_path.exists():
+                files = self._read_index(table_path.stem)
+                tables[table_path.stem] = (sum(file.size for file in files.values()), index_path.stat().st_mtime)
+        return tables
+
+    def _list_remote_files(self, table_name: str) -> dict[str, CachedFile]:
+        prefix = f"{lance_prefix}/{table_name}.lance/"
+        return {
+            str(obj.object_name).removeprefix(prefix): CachedFile(etag=str(obj.etag), size=int(obj.size or 0))
+            for obj in self._minio_client.list_objects(self._bucket_name, prefix=prefix, recursive=True)
+        }
+
+    def _sync(self, table_name: str) -> bool:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._sync_lock_path(table_name).open("w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return self._sync_locked(table_name)
+
+    def _sync_locked(self, table_name: str) -> bool:
+        remote_files = self._list_remote_files(table_name)
+        if not remote_files:
+            self._stop_reading(table_name)
+            return False  # table not created yet (or deleted)
+        table_path = self._table_path(table_name)
+        if sum(file.size for file in remote_files.values()) > self.max_size:
+            logging.warning(f"{table_name} does not fit in lance cache, it is read from minio")
+            # deleted by the last process reading it
+            self._stop_reading(table_name)
+            self._delete_if_unread(table_name)
+            return False
+
+        local_files = self._read_index(table_name)
+        to_download = files_to_download(remote_files, local_files)
+        needed = sum(remote_files[key].size for key in to_download)
+        # tables synced or read by a process are skipped, more recently used ones are evicted instead
+        tried_tables = {table_name}
+        while to_evict := tables_to_evict(self._mirrored_tables(), tried_tables, needed, self.max_size):
+            for table_to_evict in to_evict:
+                tried_tables.add(table_to_evict)
+                if self._evict(table_to_evict):
+                    logging.info(f"{table_to_evict} evicted from lance cache")
+
+        table_path.mkdir(parents=True, exist_ok=True)
+        for key in to_download:
+            # fget_object downloads in a temporary file renamed once complete
+            self._minio_client.fget_object(
+                self._bucket_name,
+                f"{lance_prefix}/{table_name}.lance/{key}",
+                str(table_path / key),
+            )
+            local_files[key] = remote_files[key]
+            if _is_manifest(key):
+                self._write_index(table_name, local_files)
+        for key in set(local_files) - set(remote_files):
+            (table_path / key).unlink(missing_ok=True)
+            del local_files[key]
+        self._write_index(table_name, local_files)  # also marks the table as recently used
+        if to_download:
+            logging.info(f"{len(to_download)} files ({needed / 2**20:.1f} MB) of {table_name} mirrored")
+        self._start_reading(table_name)
+        return True
+
+    async def sync(self, table_name: str) -> bool:
+        """Mirror the new files of the table. Returns False if the table is not mirrored (it does not exist yet or
+        does not fit in the cache), it must then be read from minio."""
+        return await asyncio.to_thread(self._sync, table_name)
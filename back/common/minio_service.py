@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import threading
 from collections.abc import AsyncGenerator, Generator
 from datetime import timedelta
 from io import BytesIO
@@ -24,6 +25,7 @@ class MinioSettings(BaseModel, frozen=True):
 class MinioObject(BaseModel, frozen=True):
     key: str
     etag: str
+    size: int | None = None  # in bytes
 
 
 class MinioObjectContent(BaseModel, frozen=True, arbitrary_types_allowed=True):
@@ -65,34 +67,54 @@ class MinioService:
                 "s3:ObjectCreated:",
             ):  # deal with :Put, :Copy, :Post, :CompleteMultipartUpload
                 etag: str = str(record["s3"]["object"]["eTag"])
-                yield PutMinioEvent(object=MinioObject(key=key, etag=etag))
+                size: int | None = record["s3"]["object"].get("size")
+                yield PutMinioEvent(object=MinioObject(key=key, etag=etag, size=size))
             elif event_name == "s3:ObjectRemoved:Delete":
                 yield DeleteMinioEvent(key=key)
 
     async def async_listen_notifications(self, prefix: str) -> AsyncGenerator[PutMinioEvent | DeleteMinioEvent, None]:
+        """Notifications are received by a dedicated thread (the minio client is blocking), and handed over to the
+        event loop"""
         loop = asyncio.get_running_loop()
-        while True:
+        queue: asyncio.Queue[PutMinioEvent | DeleteMinioEvent] = asyncio.Queue()
+        stop = threading.Event()
+        listener = threading.Thread(
+            target=self._listen_notifications,
+            args=(prefix, loop, queue, stop),
+            name="minio-notifications",
+            daemon=True,  # may be blocked waiting for a notification when stopped
+        )
+        listener.start()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            stop.set()
+
+    def _listen_notifications(
+        self,
+        prefix: str,
+        loop: asyncio.AbstractEventLoop,
+        queue: asyncio.Queue[PutMinioEvent | DeleteMinioEvent],
+        stop: threading.Event,
+    ) -> None:
+        while not stop.is_set():
             try:
                 with self._minio_client.listen_bucket_notification(
                     bucket_name=self._bucket_name,
                     prefix=prefix,
                     events=("s3:ObjectCreated:*", "s3:ObjectRemoved:*"),
                 ) as events:
-                    while True:
-                        try:
-                            event = await loop.run_in_executor(None, next, events)
-                        except StopIteration:
-                            break
-                        my_events = self._get_event(event)
-                        for my_event in my_events:
-                            yield my_event
-            except asyncio.CancelledError:
-                break
-            except StopIteration:
-                break
+                    for event in events:
+                        if stop.is_set():
+                            return
+                        for my_event in self._get_event(event):
+                            loop.call_soon_threadsafe(queue.put_nowait, my_event)
             except Exception as e:  # noqa: BLE001
+                if loop.is_closed():
+                    return
                 logging.warning(f"Error: {e}, Reconnecting in 5 seconds...")
-                await asyncio.sleep(5)  # Wait before reconnecting
+                stop.wait(5)  # Wait before reconnecting
 
     def create_or_update_document(self, key: str, file: BytesIO) -> None:
         self._minio_client.put_object(
@@ -113,20 +135,31 @@ class MinioService:
             # header contains double quotes around the etag
             etag = str(file.headers.get("ETag")).strip('"')
             file_stream = BytesIO(file.read())
+            size = len(file_stream.getbuffer())
         except S3Error as e:
             if e.code == "NoSuchKey":
                 return None
             raise
         else:
-            return MinioObjectContent(object=MinioObject(key=object_name, etag=etag), content=file_stream)
+            return MinioObjectContent(object=MinioObject(key=object_name, etag=etag, size=size), content=file_stream)
         finally:
             if file:
                 file.close()
                 file.release_conn()
 
+    def stat_document(self, object_name: str) -> MinioObject | None:
+        """Object metadata, without downloading its content"""
+        try:
+            stat = self._minio_client.stat_object(self._bucket_name, object_name=object_name)
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return None
+            raise
+        return MinioObject(key=object_name, etag=str(stat.etag), size=stat.size)
+
     def get_all_documents(self, prefix: str) -> list[MinioObject]:
         return [
-            MinioObject(key=str(obj.object_name), etag=str(obj.etag))
+            MinioObject(key=str(obj.object_name), etag=str(obj.etag), size=obj.size)
             for obj in self._minio_client.list_objects(
                 self._bucket_name,
                 recursive=True,
@@ -0,0 +1,112 @@
+import asyncio
+import contextlib
+import fcntl
+import logging
+import pathlib
+from collections.abc import AsyncIterator, Callable
+from typing import TextIO
+
+from pydantic import BaseModel
+
+logging = logging.getLogger(__name__)
+
+
+class NotificationRelaySettings(BaseModel, frozen=True):
+    path: pathlib.Path  # local directory of the lock file and unix socket, shared by the processes of a host
+
+
+class NotificationRelayUnavailableError(OSError):
+    """No leader to follow: it has not bound its socket yet, or it just stopped"""
+
+
+class NotificationRelay:
+    """Shares one LISTEN connection between the processes of a host (e.g. uvicorn workers): the process holding the
+    lock file is the leader, it listens to the channel and forwards the notifications to the other processes (the
+    followers) through a unix socket. When the leader stops, its followers are disconnected and one of them takes
+    over. Notifications are only wake-ups (the payload is forwarded as is), each process fetches the changes."""
+
+    lock_path: pathlib.Path
+    socket_path: pathlib.Path
+    _lock_file: TextIO | None = None
+    _server: asyncio.Server | None = None
+    _followers: set[asyncio.StreamWriter]
+
+    def __init__(self, settings: NotificationRelaySettings, channel: str) -> None:
+        self.lock_path = settings.path / f"{channel}.lock"
+        self.socket_path = settings.path / f"{channel}.sock"
+        self._followers = set()
+
+    def acquire_leadership(self) -> bool:
+        """True if this process is (or just became) the leader"""
+        if self._lock_file is not None:
+            return True
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = self.lock_path.open("w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        logging.info(f"Leader of the notification relay {self.socket_path}")
+        self._lock_file = lock_file
+        return True
+
+    def release_leadership(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def serve(self) -> None:
+        """Leader: accept followers, once listening to the channel"""
+        self.socket_path.unlink(missing_ok=True)  # left by a previous leader
+        self._server = await asyncio.start_unix_server(self._on_follower, path=str(self.socket_path))
+
+    async def _on_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._followers.add(writer)
+        try:
+            await reader.read()  # followers send nothing, returns when they disconnect
+        finally:
+            self._followers.discard(writer)
+            writer.close()
+
+    def forward(self, payload: str) -> None:
+        """Leader: send a notification to the followers, never blocks"""
+        for writer in list(self._followers):
+            if writer.is_closing():
+                self._followers.discard(writer)
+            else:
+                writer.write(f"{payload}\n".encode())
+
+    async def stop_serving(self) -> None:
+        """Leader: disconnect the followers (e.g. the LISTEN connection was lost), they connect again"""
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._followers):
+            writer.close()
+        self._followers.clear()
+        await self._server.wait_closed()
+        self._server = None
+
+    @contextlib.asynccontextmanager
+    async def follow(self, on_notification: Callable[[str], None]) -> AsyncIterator[Callable[[], bool]]:
+        """Follower: call on_notification for each notification forwarded by the leader. Yields a function telling
+        whether the leader is still connected. Raises NotificationRelayUnavailableError if there is no leader to
+        connect to."""
+        try:
+            reader, writer = await asyncio.open_unix_connection(str(self.socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise NotificationRelayUnavailableError(f"No notification relay leader on {self.socket_path}") from e
+        task = asyncio.create_task(self._read_notifications(reader, on_notification))
+        try:
+            yield lambda: not task.done()
+        finally:
+            task.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _read_notifications(reader: asyncio.StreamReader, on_notification: Callable[[str], None]) -> None:
+        while line := await reader.readline():
+            on_notification(line.decode().rstrip("\n"))
+        logging.warning("Disconnected from the notification relay leader")
+        on_notification("")  # wakes up the listener, which sees that the leader is gone
@@ -3,7 +3,7 @@ from pydantic_settings import BaseSettings
 from common.db_service import DbSettings
 from common.embedding_service import EmbeddingSettings
 from common.minio_service import MinioSettings
-from common.vector_db import LanceDbSettings
+from common.vector_db import LanceDbSettings, StageVersions
 
 
 class CommonSettings(BaseSettings):
@@ -12,5 +12,7 @@ class CommonSettings(BaseSettings):
     db: DbSettings
     log_level: str
     indexer_version: int
+    # if set, artifacts of unchanged stages are reused across indexer versions, else everything is redone
+    stage_versions: StageVersions | None = None
     embedding: EmbeddingSettings
     embedding__litellm_api_key: str  # flattened becayse nested settings are not supported if it comes from secrets_dir
@@ -1,16 +1,30 @@
 # pyright: strict, reportMissingTypeStubs=false, reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false
+import asyncio
+import itertools
+import logging
+from collections.abc import AsyncGenerator, AsyncIterable, Callable
 from datetime import timedelta
-from typing import cast
+from typing import Final, Literal, Self, cast
 
 import lancedb
+import numpy as np
+import numpy.typing as npt
 import pyarrow as pa
+import pyarrow.compute as pc
 from lancedb import AsyncConnection
-from pydantic import BaseModel
+from lancedb.index import HnswSq, IndexConfig
+from lancedb.query import AsyncVectorQuery
+from pydantic import BaseModel, model_validator
 
 from common.document import Chunk, EmbeddedChunk, ParsedDocument
+from common.document_cache import DocumentCache, DocumentCacheSettings
 from common.embedding_service import DistanceMetric
+from common.flat_index import FlatIndex, FlatIndexRows, FlatIndexSettings
+from common.lance_cache import LanceCacheSettings, LanceDiskCache, lance_prefix
 from common.minio_service import MinioSettings
 
+logging = logging.getLogger(__name__)
+
 
 class ChunkResult(BaseModel):
     chunk: Chunk
@@ -27,6 +41,10 @@ row_str_content = "str_content"
 
 row_start_index_in_doc = "start_index_in_doc"
 row_end_index_in_doc = "end_index_in_doc"
+row_binary_vector = "binary_vector"
+row_candidate_vector = "candidate_vector"
+row_doc_vector = "doc_vector"
+row_distance = "_distance"
 
 parsed_doc_table_schema = pa.schema(
     [
@@ -35,20 +53,376 @@ parsed_doc_table_schema = pa.schema(
     ],
 )
 
-embedding_dim = 1024
-chunk_table_schema = pa.schema(
-    [
-        (lancedb.common.VECTOR_COLUMN_NAME, pa.list_(pa.float16(), embedding_dim)),
-        (row_parsed_content_hash, pa.string()),
-        (row_start_index_in_doc, pa.int64()),
-        (row_end_index_in_doc, pa.int64()),
-    ],
-)
+embedding_dim = 1024  # default dimensions of the embeddings
+# chunks of more new parsed docs are appended to the flat index by streaming the whole chunk table
+flat_index_max_hashes_per_query: Final[int] = 1000
+
+# schema metadata of the chunk table: fingerprint of the settings producing its rows (cf. chunks_fingerprint)
+fingerprint_metadata_key: Final[bytes] = b"seemantic_fingerprint"
+
+type CopyProgressCallback = Callable[[str, int, int], None]  # table name, nb rows read, nb rows in the source table
+
+type TableRole = Literal["parsed_doc", "doc_vector", "chunk"]
+
+type Quantization = Literal["none", "int8", "binary"]
 
 
 class LanceDbSettings(BaseModel, frozen=True):
-    minio: MinioSettings
-    read_consistency_interval: float
+    minio: MinioSettings | None = None  # tables stored in the lancedb prefix of the bucket
+    local_path: str | None = None  # single node deployments: tables stored in this local directory instead of minio
+    # readers only (API): tables stored in minio are mirrored on local disk and read from there, cf. LanceDiskCache
+    cache: LanceCacheSettings | None = None
+    # readers only (API): chunks are searched exactly in a memory-mapped snapshot of the chunk vectors (with float16
+    # vectors, quantization and candidate dimensions are not used), cf. FlatIndex
+    flat_index: FlatIndexSettings | None = None
+    # parsed docs contents are cached on local disk or shared memory, shared by the processes of a host
+    document_cache: DocumentCacheSettings | None = None
+    # None: tables are not checked for new versions on reads (no manifest request on the query path), they are
+    # refreshed explicitly with VectorDB.refresh, which the API does on indexing success notifications
+    read_consistency_interval: float | None = None
+    # candidates are searched on compact vectors, then rescored with float16 vectors (part of the embedder version):
+    # - int8: scalar quantized vector index (IVF_HNSW_SQ), created once the table has min_rows_for_vector_index rows,
+    #   rebuilt by optimize (indexer garbage collector) once vector_index_rebuild_threshold of the chunks are not in it
+    # - binary: additional sign bit column, searched exhaustively
+    quantization: Quantization = "none"
+    # matryoshka embeddings: additional column with the first candidate_dimensions of the vector, renormalized
+    candidate_dimensions: int | None = None
+    rescoring_factor: int = 4  # nb of candidates rescored / nb of chunks retrieved
+    min_rows_for_vector_index: int = 100_000
+    vector_index_rebuild_threshold: float = 0.1  # unindexed chunks / indexed chunks
+    # store a summary vector per document (normalized mean of its chunk vectors), to search documents before chunks
+    document_vectors: bool = False
+
+    @model_validator(mode="after")
+    def check_storage(self) -> Self:
+        if (self.minio is None) == (self.local_path is None):
+            error = "exactly one of minio and local_path must be set"
+            raise ValueError(error)
+        if self.cache is not None and self.minio is None:
+            error = "cache requires tables stored in minio"
+            raise ValueError(error)
+        return self
+
+    @model_validator(mode="after")
+    def check_candidate_search(self) -> Self:
+        if self.quantization == "binary" and self.candidate_dimensions is not None:
+            error = "binary quantization and candidate_dimensions cannot be used together"
+            raise ValueError(error)
+        return self
+
+
+class StageVersions(BaseModel, frozen=True):
+    """Versions of the indexing stages. Lance tables are named after the versions of the stages producing them, so
+    a new indexer version reuses the artifacts of the stages that did not change (parsed markdown is also cached by
+    raw hash and parser version in db)"""
+
+    parser: int
+    chunker: int
+    embedder: int  # embedding model and settings, and lance_db chunk settings (quantization, candidate dimensions...)
+
+
+def get_doc_vector_table_schema(dimensions: int) -> pa.Schema:
+    return pa.schema(
+        [
+            (row_parsed_content_hash, pa.string()),
+            (row_doc_vector, pa.list_(pa.float16(), dimensions)),
+        ],
+    )
+
+
+def document_vector(vectors: npt.NDArray[np.floating]) -> npt.NDArray[np.float16] | None:
+    """Summary vector of a document: normalized mean of its chunk vectors"""
+    if len(vectors) == 0:
+        return None
+    mean = vectors.astype(np.float32).mean(axis=0)
+    return (mean / (np.linalg.norm(mean) + 1e-12)).astype(np.float16)
+
+
+def get_chunk_table_schema(dimensions: int, settings: LanceDbSettings) -> pa.Schema:
+    schema = pa.schema(
+        [
+            (lancedb.common.VECTOR_COLUMN_NAME, pa.list_(pa.float16(), dimensions)),
+            (row_parsed_content_hash, pa.string()),
+            (row_start_index_in_doc, pa.int64()),
+            (row_end_index_in_doc, pa.int64()),
+        ],
+    )
+    if settings.quantization == "binary":
+        # one bit per dimension (sign of the embedding), searched with hamming distance
+        schema = schema.append(pa.field(row_binary_vector, pa.list_(pa.uint8(), dimensions // 8)))
+    if settings.candidate_dimensions is not None:
+        schema = schema.append(pa.field(row_candidate_vector, pa.list_(pa.float16(), settings.candidate_dimensions)))
+    return schema
+
+
+def to_chunk_table(  # noqa: PLR0913
+    vectors: npt.NDArray[np.floating],
+    parsed_content_hashes: list[str],
+    start_indexes: list[int],
+    end_indexes: list[int],
+    schema: pa.Schema,
+    settings: LanceDbSettings,
+) -> pa.Table:
+    """Arrow table of chunks, with the compact vectors required by the settings"""
+    arrays = [
+        pa.array(list(vectors.astype(np.float16)), type=schema.field(lancedb.common.VECTOR_COLUMN_NAME).type),
+        pa.array(parsed_content_hashes, type=pa.string()),
+        pa.array(start_indexes, type=pa.int64()),
+        pa.array(end_indexes, type=pa.int64()),
+    ]
+    if settings.quantization == "binary":
+        arrays.append(pa.array(list(binary_quantize(vectors)), type=schema.field(row_binary_vector).type))
+    if settings.candidate_dimensions is not None:
+        candidate_vectors = truncate(vectors, settings.candidate_dimensions)
+        arrays.append(
+            pa.array(list(candidate_vectors.astype(np.float16)), type=schema.field(row_candidate_vector).type),
+        )
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def binary_quantize(vectors: npt.NDArray[np.floating]) -> npt.NDArray[np.uint8]:
+    return np.packbits(vectors > 0, axis=-1)
+
+
+def truncate(vectors: npt.NDArray[np.floating], dimensions: int) -> npt.NDArray[np.float32]:
+    """Matryoshka truncation: first dimensions of the vectors, renormalized"""
+    truncated = vectors[..., :dimensions].astype(np.float32)
+    return truncated / (np.linalg.norm(truncated, axis=-1, keepdims=True) + 1e-12)
+
+
+async def copy_missing_documents(
+    source_table: lancedb.AsyncTable,
+    target_table: lancedb.AsyncTable,
+    batch_size: int,
+    on_progress: CopyProgressCallback,
+) -> int:
+    """Stream the rows of source_table whose parsed hash is not in target_table, and append them to it.
+    Tables must have the same columns. Returns the number of rows copied."""
+    source_counts = await count_rows_by_parsed_hash(source_table)
+    reader = await source_table.query().to_batches(max_batch_length=batch_size)
+    return await append_missing_documents(
+        reader,
+        source_name=source_table.name,
+        source_counts=source_counts,
+        target_table=target_table,
+        on_progress=on_progress,
+    )
+
+
+def _add_counts(counts: dict[str, int], parsed_hashes: pa.Array | pa.ChunkedArray) -> None:
+    value_counts = pc.value_counts(parsed_hashes)
+    for parsed_hash, count in zip(
+        value_counts.field("values").to_pylist(),
+        value_counts.field("counts").to_pylist(),
+        strict=True,
+    ):
+        counts[parsed_hash] = counts.get(parsed_hash, 0) + count
+
+
+async def count_rows_by_parsed_hash(table: lancedb.AsyncTable) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    _add_counts(counts, (await table.query().select([row_parsed_content_hash]).to_arrow())[row_parsed_content_hash])
+    return counts
+
+
+async def count_batch_rows_by_parsed_hash(batches: AsyncIterable[pa.RecordBatch]) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    async for batch in batches:
+        _add_counts(counts, batch.column(row_parsed_content_hash))
+    return counts
+
+
+async def append_missing_documents(
+    batches: AsyncIterable[pa.RecordBatch],
+    source_name: str,
+    source_counts: dict[str, int],
+    target_table: lancedb.AsyncTable,
+    on_progress: CopyProgressCallback,
+) -> int:
+    """Append the rows of the batches whose parsed hash is not in target_table. Returns the number of rows appended.
+    source_counts are the numbers of rows of each parsed hash in the batches: a parsed doc with fewer rows in the
+    target (interrupted copy) is deleted and copied again, so a copy can be resumed whatever the order of the rows.
+    Rows of a parsed doc that are contiguous in the batches (written by a single merge_insert) are appended together,
+    so that the target has no partial documents in the common case."""
+    target_counts = await count_rows_by_parsed_hash(target_table)
+    partial_hashes = [
+        parsed_hash
+        for parsed_hash, count in target_counts.items()
+        if parsed_hash in source_counts and count != source_counts[parsed_hash]
+    ]
+    if partial_hashes:
+        logging.info(f"{len(partial_hashes)} partially copied parsed docs in {target_table.name}, copied again")
+        for batch in itertools.batched(partial_hashes, 1000):
+            await target_table.delete(in_parsed_hashes(list(batch)))
+    target_hashes = pa.array(list(set(target_counts) - set(partial_hashes)), type=pa.string())
+    target_schema = await target_table.schema()
+    nb_source_rows = sum(source_counts.values())
+    nb_read = 0
+    nb_copied = 0
+    pending: pa.Table | None = None  # rows of the last parsed doc read, which may continue in the next batch
+    async for batch in batches:
+        nb_read += batch.num_rows
+        rows = pa.Table.from_batches([batch]).select(target_schema.names)
+        rows = rows.filter(pc.invert(pc.is_in(rows[row_parsed_content_hash], value_set=target_hashes)))
+        if pending is not None:
+            rows = pa.concat_tables([pending, rows])
+        if rows.num_rows == 0:
+            pending = None
+        else:
+            last_hash = rows[row_parsed_content_hash][-1]
+            is_last_doc = pc.equal(rows[row_parsed_content_hash], last_hash)
+            pending = rows.filter(is_last_doc)
+            complete_rows = rows.filter(pc.invert(is_last_doc))
+            if complete_rows.num_rows > 0:
+                await target_table.add(complete_rows.cast(target_schema))
+                nb_copied += complete_rows.num_rows
+        on_progress(source_name, nb_read, nb_source_rows)
+    if pending is not None:
+        await target_table.add(pending.cast(target_schema))
+        nb_copied += pending.num_rows
+    return nb_copied
+
+
+def vector_distances(
+    vectors: npt.NDArray[np.floating],
+    query: npt.NDArray[np.floating],
+    distance_metric: str,
+) -> npt.NDArray[np.float32]:
+    """Same distances as lance, in float32"""
+    vectors = vectors.astype(np.float32)
+    query = query.astype(np.float32)
+    if distance_metric == "L2":
+        return np.sum((vectors - query) ** 2, axis=1)
+    dot = vectors @ query
+    if distance_metric == "dot":
+        return 1 - dot
+    return 1 - dot / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-12)
+
+
+def rescore(candidates: pa.Table, vector: list[float], limit: int, distance_metric: str) -> pa.Table:
+    """Best candidates according to their full vectors"""
+    if candidates.num_rows == 0:
+        return candidates
+    candidate_vectors = np.stack(candidates[lancedb.common.VECTOR_COLUMN_NAME].to_numpy(zero_copy_only=False))
+    distances = vector_distances(candidate_vectors, np.array(vector), distance_metric)
+    best = np.argsort(distances)[:limit]
+    rescored = candidates.drop_columns([row_distance]).take(pa.array(best))
+    return rescored.append_column(row_distance, pa.array(distances[best]))
+
+
+async def search_doc_vector_table(
+    doc_vector_table: lancedb.AsyncTable,
+    vector: list[float],
+    limit: int,
+    distance_metric: str,
+) -> list[str]:
+    """Parsed hashes of the documents with the nearest summary vectors"""
+    parsed_docs: pa.Table = (
+        await doc_vector_table.query()
+        .nearest_to(vector)
+        .distance_type(distance_metric)
+        .column(row_doc_vector)
+        .select([row_parsed_content_hash])
+        .limit(limit)
+        .to_arrow()
+    )
+    return cast("list[str]", parsed_docs[row_parsed_content_hash].to_pylist())
+
+
+def in_parsed_hashes(parsed_hashes: list[str]) -> str:
+    sql_in_str = ",".join([f"'{parsed_hash}'" for parsed_hash in parsed_hashes])
+    return f"{row_parsed_content_hash} IN ({sql_in_str})"
+
+
+async def search_chunk_table(  # noqa: PLR0913
+    chunk_table: lancedb.AsyncTable,
+    vector: list[float],
+    limit: int,
+    distance_metric: str,
+    settings: LanceDbSettings,
+    where: str | None = None,
+) -> pa.Table:
+    """Nearest chunks (among chunks matching where, if given), with a _distance column"""
+    output_columns = [
+        lancedb.common.VECTOR_COLUMN_NAME,
+        row_parsed_content_hash,
+        row_start_index_in_doc,
+        row_end_index_in_doc,
+    ]
+    if settings.quantization == "binary":
+        candidates_query = (
+            chunk_table.query()
+            .nearest_to(binary_quantize(np.array(vector)))
+            .column(row_binary_vector)
+            .distance_type("hamming")
+            .select(output_columns)
+            .limit(limit * settings.rescoring_factor)
+        )
+        return rescore(await _filtered(candidates_query, where).to_arrow(), vector, limit, distance_metric)
+
+    if settings.candidate_dimensions is not None:
+        query = (
+            chunk_table.query()
+            .nearest_to(truncate(np.array(vector), settings.candidate_dimensions).tolist())
+            .distance_type(distance_metric)
+            .column(row_candidate_vector)
+            .select(output_columns)
+            .limit(limit * settings.rescoring_factor)
+        )
+        if settings.quantization == "int8":
+            query = query.refine_factor(settings.rescoring_factor)
+        return rescore(await _filtered(query, where).to_arrow(), vector, limit, distance_metric)
+
+    query = (
+        chunk_table.query()
+        .nearest_to(vector)
+        .distance_type(distance_metric)
+        .column(lancedb.common.VECTOR_COLUMN_NAME)
+        .limit(limit)
+    )
+    if settings.quantization == "int8":
+        # rescoring of the candidates of the quantized index with float16 vectors (no-op without index)
+        query = query.refine_factor(settings.rescoring_factor)
+    return await _filtered(query, where).to_arrow()
+
+
+def _filtered(query: AsyncVectorQuery, where: str | None) -> AsyncVectorQuery:
+    # filter applied before the vector search (prefilter)
+    return query.where(where) if where else query
+
+
+def _read_consistency_interval(settings: LanceDbSettings) -> timedelta | None:
+    if settings.read_consistency_interval is None:
+        return None
+    return timedelta(seconds=settings.read_consistency_interval)
+
+
+async def connect(settings: LanceDbSettings) -> AsyncConnection:
+    read_consistency_interval = _read_consistency_interval(settings)
+    minio = settings.minio
+    if minio is None:
+        return await lancedb.connect_async(
+            cast("str", settings.local_path),
+            read_consistency_interval=read_consistency_interval,
+        )
+    protocol = "https" if minio.use_tls else "http"
+    return await lancedb.connect_async(
+        f"s3://{minio.bucket}/{lance_prefix}",
+        read_consistency_interval=read_consistency_interval,
+        storage_options={
+            "access_key_id": minio.access_key,
+            "secret_access_key": minio.secret_key,
+            "endpoint": f"{protocol}://{minio.endpoint}",
+            "allow_http": f"{not minio.use_tls}",
+        },
+    )
+
+
+async def drop_tables(settings: LanceDbSettings, table_names: list[str]) -> None:
+    """Delete the datasets of the tables (retired indexer versions), missing tables are ignored"""
+    db = await connect(settings)
+    for table_name in table_names:
+        await db.drop_table(table_name, ignore_missing=True)
 
 
 class VectorDB:
@@ -56,86 +430,346 @@ class VectorDB:
     _db: AsyncConnection
     _parsed_doc_table: lancedb.AsyncTable
     _chunk_table: lancedb.AsyncTable
+    _doc_vector_table: lancedb.AsyncTable | None = None  # only if settings.document_vectors
     distance_metric: str
     _connected = False
     parsed_doc_table_name: str
     chunk_table_name: str
-
-    def __init__(self, settings: LanceDbSettings, distance_metric: DistanceMetric, indexer_version: int) -> None:
+    doc_vector_table_name: str
+    _has_vector_index = False
+    _nb_chunk_rows: int | None = None  # counted once until the vector index is created, then counted by this instance
+    _chunk_table_schema: pa.Schema
+    _embedding_dimensions: int
+    _cache: LanceDiskCache | None = None  # only if settings.cache
+    _cache_db: AsyncConnection  # mirrored tables
+    _mirrored_table_names: set[str]
+    _refresh_task: "asyncio.Task[None] | None" = None
+    _flat_index: FlatIndex | None = None  # only if settings.flat_index
+    _document_cache: DocumentCache | None = None  # only if settings.document_cache
+    _connect_lock: asyncio.Lock  # concurrent first calls connect once
+
+    def __init__(  # noqa: PLR0913
+        self,
+        settings: LanceDbSettings,
+        distance_metric: DistanceMetric,
+        indexer_version: int,
+        embedding_dimensions: int = embedding_dim,
+        stage_versions: StageVersions | None = None,
+        chunks_fingerprint: str | None = None,
+    ) -> None:
+        """chunks_fingerprint is stored in the chunk table when this instance creates it"""
         self._settings = settings
         self.distance_metric = distance_metric
-        self.parsed_doc_table_name = f"parsed_doc_v{indexer_version}"
-        self.chunk_table_name = f"chunk_v{indexer_version}"
+        self._embedding_dimensions = embedding_dimensions
+        self._mirrored_table_names = set()
+        self._connect_lock = asyncio.Lock()
+        if settings.cache is not None:
+            assert settings.minio is not None, "cache requires tables stored in minio"
+            self._cache = LanceDiskCache(settings.cache, settings.minio)
+        self._chunk_table_schema = get_chunk_table_schema(embedding_dimensions, settings)
+        if chunks_fingerprint is not None:
+            self._chunk_table_schema = self._chunk_table_schema.with_metadata(
+                {fingerprint_metadata_key: chunks_fingerprint.encode()},
+            )
+        if stage_versions is None:
+            # all tables are specific to the indexer version
+            parsed_doc_suffix = chunk_suffix = f"v{indexer_version}"
+        else:
+            parsed_doc_suffix = f"p{stage_versions.parser}"
+            # chunks reference parsed docs by hash, they are only valid with the parsed doc table of their parser
+            chunk_suffix = f"{parsed_doc_suffix}_c{stage_versions.chunker}_e{stage_versions.embedder}"
+        self.parsed_doc_table_name = f"parsed_doc_{parsed_doc_suffix}"
+        self.chunk_table_name = f"chunk_{chunk_suffix}"
+        self.doc_vector_table_name = f"doc_vector_{chunk_suffix}"
+        if settings.document_cache is not None:
+            self._document_cache = DocumentCache(settings.document_cache)
+        if settings.flat_index is not None:
+            self._flat_index = FlatIndex(
+                settings.flat_index,
+                self.chunk_table_name,
+                embedding_dimensions,
+                distance_metric,
+            )
+
+    def table_names(self) -> list[str]:
+        """Names of the tables of this db (existing or not), in write order"""
+        names = [self.parsed_doc_table_name]
+        if self._settings.document_vectors:
+            names.append(self.doc_vector_table_name)
+        names.append(self.chunk_table_name)
+        return names
 
     async def connect_if_needed(self) -> None:
         if self._connected:
             return
-        minio = self._settings.minio
-        protocol = "https" if minio.use_tls else "http"
-        self._db = await lancedb.connect_async(
-            f"s3://{minio.bucket}/lancedb",
-            read_consistency_interval=timedelta(seconds=self._settings.read_consistency_interval),
-            storage_options={
-                "access_key_id": minio.access_key,
-                "secret_access_key": minio.secret_key,
-                "endpoint": f"{protocol}://{minio.endpoint}",
-                "allow_http": f"{not minio.use_tls}",
-            },
-        )
+        async with self._connect_lock:
+            if self._connected:
+                return  # connected by a concurrent call
+            self._db = await connect(self._settings)
+            if self._cache is not None:
+                self._cache_db = await lancedb.connect_async(
+                    str(self._cache.path),
+                    read_consistency_interval=_read_consistency_interval(self._settings),
+                )
 
-        self._parsed_doc_table = await self._db.create_table(
-            self.parsed_doc_table_name,
-            exist_ok=True,
-            schema=parsed_doc_table_schema,
-            mode="create",  # For now as we test, this should be removed after
+            self._parsed_doc_table = await self._open_or_create_table(
+                self.parsed_doc_table_name,
+                parsed_doc_table_schema,
+            )
+            self._chunk_table = await self._open_or_create_table(self.chunk_table_name, self._chunk_table_schema)
+            if self._settings.document_vectors:
+                self._doc_vector_table = await self._open_or_create_table(
+                    self.doc_vector_table_name,
+                    get_doc_vector_table_schema(self._embedding_dimensions),
+                )
+            await self._update_has_vector_index()
+            if self._flat_index is not None:
+                await self._sync_flat_index(self._flat_index)
+            self._connected = True
+            if self._cache is not None and self._settings.read_consistency_interval is not None:
+                self._refresh_task = asyncio.create_task(self._refresh_mirrors(self._cache))
+
+    async def _get_vector_index(self) -> IndexConfig | None:
+        for index in await self._chunk_table.list_indices():
+            if any(column in (lancedb.common.VECTOR_COLUMN_NAME, row_candidate_vector) for column in index.columns):
+                return index
+        return None
+
+    async def _update_has_vector_index(self) -> None:
+        self._has_vector_index = await self._get_vector_index() is not None
+
+    async def refresh(self) -> None:
+        """Point the tables at their latest version (mirrored first if cached), e.g. once documents are indexed.
+        Required to see new rows if read_consistency_interval is None."""
+        # serialized with the connection: tables opened by a connection in progress may miss the new rows
+        async with self._connect_lock:
+            if not self._connected:
+                return  # tables are opened at their latest version on connection
+            if self._cache is not None:
+                await self._sync_mirrors(self._cache)
+            for table in self._tables().values():
+                await table.checkout_latest()
+            await self._update_has_vector_index()
+            if self._flat_index is not None:
+                await self._sync_flat_index(self._flat_index)
+
+    async def _sync_flat_index(self, flat_index: FlatIndex) -> None:
+        hashes = await self._chunk_table.query().select([row_parsed_content_hash]).to_arrow()
+        stored_hashes = set(cast("list[str]", hashes[row_parsed_content_hash].unique().to_pylist()))
+        await flat_index.sync(stored_hashes, self._fetch_flat_index_rows)
+
+    async def _fetch_flat_index_rows(self, parsed_hashes: set[str]) -> AsyncGenerator[FlatIndexRows, None]:
+        query = self._chunk_table.query().select(
+            [lancedb.common.VECTOR_COLUMN_NAME, row_parsed_content_hash, row_start_index_in_doc, row_end_index_in_doc],
         )
+        if len(parsed_hashes) <= flat_index_max_hashes_per_query:
+            query = query.where(in_parsed_hashes(sorted(parsed_hashes)))
+        value_set = pa.array(list(parsed_hashes), type=pa.string())
+        async for batch in await query.to_batches():
+            rows = batch.filter(pc.is_in(batch.column(row_parsed_content_hash), value_set=value_set))
+            if rows.num_rows == 0:
+                continue
+            vectors = rows.column(lancedb.common.VECTOR_COLUMN_NAME).flatten().to_numpy(zero_copy_only=False)
+            yield FlatIndexRows(
+                vectors.reshape(rows.num_rows, self._embedding_dimensions),
+                cast("list[str]", rows.column(row_parsed_content_hash).to_pylist()),
+                rows.column(row_start_index_in_doc).to_numpy(),
+                rows.column(row_end_index_in_doc).to_numpy(),
+            )
 
-        self._chunk_table = await self._db.create_table(
-            self.chunk_table_name,
-            exist_ok=True,
-            schema=chunk_table_schema,
-            mode="create",  # For now as we test, this should be removed after
-        )
-        self._connected = True
+    async def _open_or_create_table(self, name: str, schema: pa.Schema) -> lancedb.AsyncTable:
+        if self._cache is not None and await self._cache.sync(name):
+            self._mirrored_table_names.add(name)
+            return await self._cache_db.open_table(name)
+        # existing tables are opened without schema check, as their metadata (fingerprint) may differ
+        try:
+            return await self._db.open_table(name)
+        except ValueError:  # table not found
+            return await self._db.create_table(
+                name,
+                exist_ok=True,
+                schema=schema,
+                mode="create",  # For now as we test, this should be removed after
+            )
+
+    async def warm_up(self) -> None:
+        """Open the tables and run a search, so that the first queries do not pay for it"""
+        await self.connect_if_needed()
+        vector = [0.0] * self._embedding_dimensions
+        vector[0] = 1.0
+        await self.query(vector, 1)
+
+    async def get_chunks_fingerprint(self) -> str | None:
+        """Fingerprint of the settings that produced the chunks, None if the chunk table was created without one"""
+        await self.connect_if_needed()
+        fingerprint = ((await self._chunk_table.schema()).metadata or {}).get(fingerprint_metadata_key)
+        return fingerprint.decode() if fingerprint is not None else None
+
+    async def copy_missing_documents_from(
+        self,
+        source: "VectorDB",
+        batch_size: int,
+        on_progress: CopyProgressCallback,
+    ) -> int:
+        """Copy the parsed docs, doc vectors and chunks of source that are missing in this db, without embedding them
+        again. Source chunks must have been produced with the same settings (cf. get_chunks_fingerprint).
+        Returns the number of chunks copied."""
+        await self.connect_if_needed()
+        await source.connect_if_needed()
+        source_tables = source._tables()  # noqa: SLF001
+        nb_copied_rows: dict[TableRole, int] = {}
+        for role, table in self._tables().items():
+            if role in source_tables:
+                nb_copied_rows[role] = await copy_missing_documents(source_tables[role], table, batch_size, on_progress)
+        if self._settings.quantization == "int8":
+            await self._create_vector_index_if_needed(nb_copied_rows.get("chunk", 0))
+        return nb_copied_rows.get("chunk", 0)
+
+    async def _refresh_mirrors(self, cache: LanceDiskCache) -> None:
+        """Infinite loop mirroring the new versions of the tables every read consistency interval"""
+        assert self._settings.read_consistency_interval is not None
+        while True:
+            await asyncio.sleep(max(self._settings.read_consistency_interval, 1))
+            await self._sync_mirrors(cache)
+
+    async def _sync_mirrors(self, cache: LanceDiskCache) -> None:
+        """Mirror the new versions of the tables. A table that starts or stops being mirrored (created after this db
+        connected, evicted, grown too big) is reopened from the cache or from minio."""
+        for role, table in self._tables().items():
+            try:
+                mirrored = await cache.sync(table.name)
+                if mirrored != (table.name in self._mirrored_table_names):
+                    self._set_table(role, await (self._cache_db if mirrored else self._db).open_table(table.name))
+                    if mirrored:
+                        self._mirrored_table_names.add(table.name)
+                    else:
+                        self._mirrored_table_names.discard(table.name)
+                    logging.info(f"{table.name} now read from {'lance cache' if mirrored else 'minio'}")
+            except Exception:
+                logging.exception(f"Error refreshing the mirror of {table.name}")
+
+    def _set_table(self, role: TableRole, table: lancedb.AsyncTable) -> None:
+        match role:
+            case "parsed_doc":
+                self._parsed_doc_table = table
+            case "doc_vector":
+                self._doc_vector_table = table
+            case "chunk":
+                self._chunk_table = table
+
+    def _tables(self) -> dict[TableRole, lancedb.AsyncTable]:
+        """Tables in write order: chunks last, as they mark the parsed docs as indexed (cf. is_indexed)"""
+        tables: dict[TableRole, lancedb.AsyncTable] = {"parsed_doc": self._parsed_doc_table}
+        if self._doc_vector_table is not None:
+            tables["doc_vector"] = self._doc_vector_table
+        tables["chunk"] = self._chunk_table
+        return tables
+
+    async def open_pinned_tables(self) -> dict[TableRole, lancedb.AsyncTable]:
+        """New handles on the tables, checked out at their current version (in write order): reading them does not
+        block writers, and is not affected by later writes"""
+        await self.connect_if_needed()
+        pinned_tables: dict[TableRole, lancedb.AsyncTable] = {}
+        for role, table in self._tables().items():
+            pinned_table = await self._db.open_table(table.name)
+            await pinned_table.checkout(await pinned_table.version())
+            pinned_tables[role] = pinned_table
+        return pinned_tables
+
+    async def append_missing_documents(
+        self,
+        role: TableRole,
+        batches: AsyncIterable[pa.RecordBatch],
+        source_counts: dict[str, int],
+        on_progress: CopyProgressCallback,
+    ) -> int:
+        """Append the rows of the batches whose parsed hash is not in the table (cf. append_missing_documents)"""
+        await self.connect_if_needed()
+        table = self._tables()[role]
+        return await append_missing_documents(batches, table.name, source_counts, table, on_progress)
 
     async def get_document(self, parsed_content_hash: str) -> ParsedDocument | None:
         await self.connect_if_needed()
 
-        parsed_table: pa.Table = (
+        contents = await self._get_contents([parsed_content_hash])
+        if parsed_content_hash not in contents:
+            return None
+        return ParsedDocument(hash=parsed_content_hash, markdown_content=contents[parsed_content_hash])
+
+    async def _get_contents(self, parsed_hashes: list[str]) -> dict[str, str]:
+        """Markdown contents of the parsed docs (from the document cache if enabled), missing ones are absent"""
+        contents = self._document_cache.get(parsed_hashes) if self._document_cache is not None else {}
+        missing_hashes = [parsed_hash for parsed_hash in parsed_hashes if parsed_hash not in contents]
+        if not missing_hashes:
+            return contents
+        parsed_table = (
             await self._parsed_doc_table.query()
-            .where(f"{row_parsed_content_hash} = '{parsed_content_hash}'")
+            .where(in_parsed_hashes(missing_hashes))
+            .select([row_parsed_content_hash, row_str_content])
             .to_arrow()
         )
-
-        if parsed_table.num_rows == 0:
-            return None
-
-        markdown_content: str = parsed_table.column(row_str_content)[0].as_py()
-        return ParsedDocument(hash=parsed_content_hash, markdown_content=markdown_content)
-
-    async def query(self, vector: list[float], nb_chunks_to_retrieve: int) -> list[ParsedDocumentResult]:
+        fetched_contents = dict(
+            zip(
+                cast("list[str]", parsed_table[row_parsed_content_hash].to_pylist()),
+                cast("list[str]", parsed_table[row_str_content].to_pylist()),
+                strict=True,
+            ),
+        )
+        if self._document_cache is not None:
+            self._document_cache.put(fetched_contents)
+        return contents | fetched_contents
+
+    async def query(
+        self,
+        vector: list[float],
+        nb_chunks_to_retrieve: int,
+        nb_documents_to_search: int | None = None,
+    ) -> list[ParsedDocumentResult]:
+        """If nb_documents_to_search is given, chunks are only searched in the documents with the nearest summary
+        vectors (requires document_vectors)"""
         await self.connect_if_needed()
 
-        chunk_table: pa.Table = (
-            await self._chunk_table.query()
-            .nearest_to(vector)
-            .distance_type(self.distance_metric)
-            .column(lancedb.common.VECTOR_COLUMN_NAME)
-            .limit(nb_chunks_to_retrieve)
-            .to_arrow()
-        )
+        parsed_hashes: list[str] | None = None
+        where: str | None = None
+        if nb_documents_to_search is not None:
+            assert self._doc_vector_table is not None, "document search requires lance_db.document_vectors"
+            parsed_hashes = await search_doc_vector_table(
+                self._doc_vector_table,
+                vector,
+                nb_documents_to_search,
+                self.distance_metric,
+            )
+            if not parsed_hashes:
+                return []
+            where = in_parsed_hashes(parsed_hashes)
+
+        if self._flat_index is not None:
+            result = await self._flat_index.search(vector, nb_chunks_to_retrieve, parsed_hashes)
+            chunk_table = pa.table(
+                {
+                    row_parsed_content_hash: pa.array(result.parsed_hashes, type=pa.string()),
+                    row_start_index_in_doc: result.starts,
+                    row_end_index_in_doc: result.ends,
+                    row_distance: result.distances,
+                },
+            )
+        else:
+            chunk_table = await search_chunk_table(
+                self._chunk_table,
+                vector,
+                nb_chunks_to_retrieve,
+                self.distance_metric,
+                self._settings,
+                where,
+            )
         # if no chunks are found, return empty list
         if chunk_table.num_rows == 0:
             return []
-        parsed_doc_hashes = cast("set[str]", set(chunk_table[row_parsed_content_hash].to_pylist()))
-        sql_in_str = ",".join([f"'{parsed_doc_hash}'" for parsed_doc_hash in parsed_doc_hashes])
+        parsed_doc_hashes = cast("list[str]", list(set(chunk_table[row_parsed_content_hash].to_pylist())))
 
-        parsed_table = (
-            await self._parsed_doc_table.query().where(f"{row_parsed_content_hash} IN ({sql_in_str})").to_arrow()
-        )
+        contents = await self._get_contents(parsed_doc_hashes)
 
         # Convert to Pandas for fast groupby operations
-        parsed_df = parsed_table.to_pandas()
         chunk_df = chunk_table.to_pandas()
 
         # Group chunks by parsed_content_hash (avoids repeated filtering)
@@ -144,9 +778,7 @@ class VectorDB:
         # Build results using dictionary lookups
         results = []
 
-        for _, parsed_row in parsed_df.iterrows():
-            parsed_hash = cast("str", parsed_row[row_parsed_content_hash])
-            content = cast("str", parsed_row[row_str_content])
+        for parsed_hash, content in contents.items():
             parsed_doc = ParsedDocument(hash=parsed_hash, markdown_content=content)
 
             # Retrieve chunks efficiently using groupby dictionary
@@ -156,7 +788,7 @@ class VectorDB:
                         start_index_in_doc=cast("int", chunk_row[row_start_index_in_doc]),
                         end_index_in_doc=cast("int", chunk_row[row_end_index_in_doc]),
                     ),
-                    distance=cast("float", chunk_row["_distance"]),  # Placeholder for distance computation
+                    distance=cast("float", chunk_row[row_distance]),  # Placeholder for distance computation
                 )
                 for _, chunk_row in chunk_groups.get_group(parsed_hash).iterrows()
             ]
@@ -165,10 +797,14 @@ class VectorDB:
 
         return results
 
-    async def is_indexed(self, parsed_content_hash: str) -> bool:
+    async def is_indexed(self, parsed_content_hash: str, *, latest: bool = False) -> bool:
+        """latest: read the latest version of the table, instead of a version up to read_consistency_interval old
+        (e.g. to see a deletion by another indexer replica)"""
         await self.connect_if_needed()
+        if latest:
+            await self._chunk_table.checkout_latest()
 
-        # we check _chunk_table as it is created last after _parsed_doc_table (and deleted first)
+        # we check _chunk_table as it is written last after _parsed_doc_table and _doc_vector_table (and deleted first)
         nb_rows = await self._chunk_table.count_rows(f"{row_parsed_content_hash} = '{parsed_content_hash}'")
         return nb_rows > 0
 
@@ -177,10 +813,15 @@ class VectorDB:
         content_array = pa.array([document.markdown_content])
         parsed_content_hash = document.hash
         parsed_content_hash_array = pa.array([parsed_content_hash])
+        vectors = np.array([c.embedding.embedding for c in chunks], dtype=np.float32).reshape(
+            len(chunks),
+            self._embedding_dimensions,
+        )
         doc_table = pa.Table.from_arrays(
             [parsed_content_hash_array, content_array],
             schema=parsed_doc_table_schema,
         )
+        # the parsed doc may already be stored by an indexer version with another chunker or embedder
         await (
             self._parsed_doc_table.merge_insert(
                 row_parsed_content_hash,
@@ -194,13 +835,29 @@ class VectorDB:
             )
         )
 
-        embedding_array = pa.array([c.embedding.embedding for c in chunks])
-        parsed_content_hash_array_chunk_table: pa.StringArray = pa.array([parsed_content_hash] * len(chunks))
-        start_index_array = pa.array([c.chunk.start_index_in_doc for c in chunks])
-        end_index_array = pa.array([c.chunk.end_index_in_doc for c in chunks])
-        chunk_table = pa.Table.from_arrays(
-            [embedding_array, parsed_content_hash_array_chunk_table, start_index_array, end_index_array],
-            schema=chunk_table_schema,
+        # documents without chunks have no summary vector
+        if self._doc_vector_table is not None and (doc_vector := document_vector(vectors)) is not None:
+            doc_vector_schema = get_doc_vector_table_schema(self._embedding_dimensions)
+            doc_vector_table = pa.Table.from_arrays(
+                [
+                    parsed_content_hash_array,
+                    pa.array([list(doc_vector)], type=doc_vector_schema.field(row_doc_vector).type),
+                ],
+                schema=doc_vector_schema,
+            )
+            await (
+                self._doc_vector_table.merge_insert(row_parsed_content_hash)
+                .when_not_matched_insert_all()
+                .execute(doc_vector_table)
+            )
+
+        chunk_table = to_chunk_table(
+            vectors,
+            [parsed_content_hash] * len(chunks),
+            [c.chunk.start_index_in_doc for c in chunks],
+            [c.chunk.end_index_in_doc for c in chunks],
+            self._chunk_table_schema,
+            self._settings,
         )
 
         await (
@@ -216,3 +873,131 @@ class VectorDB:
             )
         )
         # indexing is not necessary up to 100k rows. cf. https://lancedb.github.io/lancedb/ann_indexes/#when-is-it-necessary-to-create-an-ann-vector-index
+        if self._settings.quantization == "int8":
+            await self._create_vector_index_if_needed(len(chunks))
+
+    async def get_indexed_parsed_hashes(self) -> set[str]:
+        await self.connect_if_needed()
+        hashes = await self._chunk_table.query().select([row_parsed_content_hash]).to_arrow()
+        return set(cast("list[str]", hashes[row_parsed_content_hash].unique().to_pylist()))
+
+    async def get_stored_parsed_hashes(self) -> set[str]:
+        """Parsed hashes with rows in any table, including parsed docs whose chunks were not written (crash)"""
+        await self.connect_if_needed()
+        parsed_hashes: set[str] = set()
+        for table in self._tables().values():
+            hashes = await table.query().select([row_parsed_content_hash]).to_arrow()
+            parsed_hashes.update(cast("list[str]", hashes[row_parsed_content_hash].unique().to_pylist()))
+        return parsed_hashes
+
+    async def delete_documents(self, parsed_hashes: list[str]) -> None:
+        """Delete the rows of the parsed docs, in reverse write order: chunks first (cf. is_indexed)"""
+        if not parsed_hashes:
+            return
+        await self.connect_if_needed()
+        for table in reversed(self._tables().values()):
+            await table.delete(in_parsed_hashes(parsed_hashes))
+
+    async def append_documents(self, documents: list[tuple[ParsedDocument, list[EmbeddedChunk]]]) -> None:
+        """Bulk import: append documents not indexed yet with one write per table (no merge, no vector index update,
+        cf. finish_appends)"""
+        if not documents:
+            return
+        await self.connect_if_needed()
+        all_vectors = [
+            np.array([c.embedding.embedding for c in chunks], dtype=np.float32).reshape(
+                len(chunks),
+                self._embedding_dimensions,
+            )
+            for _, chunks in documents
+        ]
+        await self._parsed_doc_table.add(
+            pa.Table.from_arrays(
+                [
+                    pa.array([document.hash for document, _ in documents], type=pa.string()),
+                    pa.array([document.markdown_content for document, _ in documents], type=pa.string()),
+                ],
+                schema=parsed_doc_table_schema,
+            ),
+        )
+        if self._doc_vector_table is not None:
+            doc_vector_schema = get_doc_vector_table_schema(self._embedding_dimensions)
+            doc_vectors = [
+                (document.hash, doc_vector)
+                for (document, _), vectors in zip(documents, all_vectors, strict=True)
+                if (doc_vector := document_vector(vectors)) is not None
+            ]
+            if doc_vectors:
+                await self._doc_vector_table.add(
+                    pa.Table.from_arrays(
+                        [
+                            pa.array([parsed_hash for parsed_hash, _ in doc_vectors], type=pa.string()),
+                            pa.array(
+                                [list(doc_vector) for _, doc_vector in doc_vectors],
+                                type=doc_vector_schema.field(row_doc_vector).type,
+                            ),
+                        ],
+                        schema=doc_vector_schema,
+                    ),
+                )
+        # chunks are written last, as they mark the parsed docs as indexed (cf. is_indexed)
+        all_chunks = [(document.hash, c.chunk) for document, chunks in documents for c in chunks]
+        if all_chunks:
+            await self._chunk_table.add(
+                to_chunk_table(
+                    np.concatenate(all_vectors),
+                    [parsed_hash for parsed_hash, _ in all_chunks],
+                    [chunk.start_index_in_doc for _, chunk in all_chunks],
+                    [chunk.end_index_in_doc for _, chunk in all_chunks],
+                    self._chunk_table_schema,
+                    self._settings,
+                ),
+            )
+
+    async def finish_appends(self) -> None:
+        """Compact the fragments written by append_documents, and create the vector index"""
+        await self.optimize()
+
+    async def optimize(self) -> None:
+        """Compact the tables (small fragments of each indexing, deleted rows) and keep the vector index up to date:
+        chunks written after it was built are searched exhaustively. Called periodically by the indexer garbage
+        collector."""
+        await self.connect_if_needed()
+        for role, table in self._tables().items():
+            if role != "chunk":
+                await table.optimize()
+        if self._settings.quantization != "int8":
+            await self._chunk_table.optimize()
+            return
+
+        vector_index = await self._get_vector_index()  # it may have been created by another indexer replica
+        if vector_index is not None:
+            stats = await self._chunk_table.index_stats(vector_index.name)
+            threshold = self._settings.vector_index_rebuild_threshold
+            if stats is None or stats.num_unindexed_rows <= threshold * stats.num_indexed_rows:
+                return
+            # a compaction cannot remap an IVF_HNSW_SQ index: it is dropped (chunks are searched exhaustively
+            # meanwhile), then built again on the compacted table
+            logging.info(f"Rebuilding vector index, {stats.num_unindexed_rows} chunks not indexed")
+            await self._chunk_table.drop_index(vector_index.name)
+        self._has_vector_index = False
+        await self._chunk_table.optimize()
+        self._nb_chunk_rows = None
+        await self._create_vector_index_if_needed()
+
+    async def _create_vector_index_if_needed(self, nb_added_rows: int = 0) -> None:
+        """Scalar quantized index, created once (then rebuilt by optimize)"""
+        if self._has_vector_index:
+            return
+        if self._nb_chunk_rows is None:
+            self._nb_chunk_rows = await self._chunk_table.count_rows()
+        else:
+            self._nb_chunk_rows += nb_added_rows  # approximate: rows of other replicas are counted on optimize
+        if self._nb_chunk_rows < self._settings.min_rows_for_vector_index:
+            return
+        # candidates are searched on the truncated vectors if any
+        await self._chunk_table.create_index(
+            row_candidate_vector if self._settings.candidate_dimensions else lancedb.common.VECTOR_COLUMN_NAME,
+            config=HnswSq(distance_type=cast("Literal['l2', 'cosine', 'dot']", self.distance_metric.lower())),
+        )
+        self._has_vector_index = True
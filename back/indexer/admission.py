@@ -0,0 +1,148 @@
+import asyncio
+import contextlib
+import logging
+import os
+import resource
+import sys
+from collections.abc import AsyncIterator, Callable
+from typing import Final
+
+from pydantic import BaseModel
+
+logging = logging.getLogger(__name__)
+
+_statm_path: Final[str] = "/proc/self/statm"
+_status_path: Final[str] = "/proc/self/status"
+_clear_refs_path: Final[str] = "/proc/self/clear_refs"
+_clear_refs_reset_peak: Final[str] = "5"  # cf. man proc_pid_clear_refs
+_max_rss_unit: Final[int] = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in kB on linux, in bytes on macOS
+
+
+class AdmissionSettings(BaseModel, frozen=True):
+    memory_budget: int = 4_000_000_000  # in bytes, estimated memory of the documents being parsed concurrently
+    initial_memory_multiplier: float = 20.0  # estimated parsing memory / document size, before any observation
+    learning_rate: float = 0.2  # weight of a new observation when the estimate decreases
+
+
+def current_rss() -> int | None:
+    """Resident set size of the process in bytes, None if not available on this platform"""
+    try:
+        with open(_statm_path) as f:  # noqa: PTH123
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _reset_peak_rss() -> int | None:
+    """Reset the peak resident set size of the process (linux only), return the current one in bytes"""
+    initial_rss = current_rss()
+    try:
+        with open(_clear_refs_path, "w") as f:  # noqa: PTH123
+            f.write(_clear_refs_reset_peak)
+    except OSError:
+        return None
+    return initial_rss
+
+
+def _peak_rss_since_reset() -> int | None:
+    try:
+        with open(_status_path) as f:  # noqa: PTH123
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def _max_rss() -> int:
+    """Peak resident set size of the process over its lifetime, in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _max_rss_unit
+
+
+def measure_peak_memory[**P, T](func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> tuple[T, int | None]:
+    """Run func and return its result with the peak increase of the process resident memory while it ran.
+    Meant to run in the parsing processes (ProcessPoolExecutor), where the memory of a document is allocated: each
+    process parses one document at a time, so its peak is the document's one, whatever the concurrency.
+    Without a resettable peak (not linux), the increase of the lifetime peak is used, 0 if it was not exceeded."""
+    initial_rss = _reset_peak_rss()
+    initial_max_rss = _max_rss()
+    result = func(*args, **kwargs)
+    if initial_rss is not None:
+        peak_rss = _peak_rss_since_reset()
+        if peak_rss is not None:
+            return result, max(peak_rss - initial_rss, 0)
+    return result, _max_rss() - initial_max_rss
+
+
+class AdmittedDocument:
+    """Set the peak memory measured while parsing the document, to learn the estimates"""
+
+    peak_memory: int | None
+
+    def __init__(self) -> None:
+        self.peak_memory = None
+
+
+class MemoryAdmissionController:
+    """Admit documents to parse while their total estimated memory stays under the budget.
+    A document estimated over the budget is admitted alone.
+    The estimate (memory / document size, per file type) is learned from the peak memory of the parsing process
+    (cf. measure_peak_memory): it increases immediately on a bigger observation, and decreases slowly."""
+
+    _settings: AdmissionSettings
+    _memory_multipliers: dict[str, float]  # file type -> observed peak memory / document size
+    _admitted: dict[int, int]  # admission id -> estimated memory
+    _next_admission_id: int
+    _condition: asyncio.Condition
+
+    def __init__(self, settings: AdmissionSettings) -> None:
+        self._settings = settings
+        self._memory_multipliers = {}
+        self._admitted = {}
+        self._next_admission_id = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def estimated_memory_in_flight(self) -> int:
+        return sum(self._admitted.values())
+
+    def estimate(self, filetype: str | None, size: int) -> int:
+        multiplier = self._memory_multipliers.get(filetype or "", self._settings.initial_memory_multiplier)
+        return int(size * multiplier)
+
+    def observe(self, filetype: str | None, size: int, peak_memory: int) -> None:
+        if size <= 0:
+            return
+        key = filetype or ""
+        observed = peak_memory / size
+        previous = self._memory_multipliers.get(key)
+        if previous is None or observed > previous:
+            self._memory_multipliers[key] = observed
+        else:
+            rate = self._settings.learning_rate
+            self._memory_multipliers[key] = (1 - rate) * previous + rate * observed
+
+    def _can_admit(self, estimated_memory: int) -> bool:
+        return not self._admitted or self.estimated_memory_in_flight + estimated_memory <= self._settings.memory_budget
+
+    @contextlib.asynccontextmanager
+    async def admit(self, filetype: str | None, size: int) -> AsyncIterator[AdmittedDocument]:
+        """Wait until the document fits in the memory budget, and keep it admitted in the context.
+        The peak memory set on the admitted document, if any, is observed on exit."""
+        estimated_memory = self.estimate(filetype, size)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._can_admit(estimated_memory))
+            admission_id = self._next_admission_id
+            self._next_admission_id += 1
+            self._admitted[admission_id] = estimated_memory
+
+        admitted = AdmittedDocument()
+        try:
+            yield admitted
+        finally:
+            if admitted.peak_memory is not None:
+                self.observe(filetype, size, admitted.peak_memory)
+            async with self._condition:
+                del self._admitted[admission_id]
+                self._condition.notify_all()
@@ -0,0 +1,158 @@
+import asyncio
+import itertools
+import logging
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import cast
+
+from common.db_service import DbBulkLoadedDocument, DbService
+from common.document import ParsableFileType, ParsedDocument, is_parsable
+from common.embedding_service import EmbeddingService
+from common.utils import hash_file_content
+from common.vector_db import VectorDB
+from indexer.chunker import Chunker, TokenChunker, get_chunker
+from indexer.settings import Settings, chunks_fingerprint
+from indexer.source import Source, SourceDocument, SourceDocumentReference
+
+logging = logging.getLogger(__name__)
+
+
+def _parse(uri: str, filetype: ParsableFileType, content: bytes) -> ParsedDocument:
+    """Run in the parsing processes: docling is only imported there, not in the main one"""
+    from indexer.parser import parse_in_process
+
+    return parse_in_process(uri, filetype, content)
+
+
+class BulkImportCheckpoint:
+    """uris already imported (or skipped), one per line, appended once their batch is committed"""
+
+    _path: pathlib.Path
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self._path = path
+
+    def read(self) -> set[str]:
+        if not self._path.exists():
+            return set()
+        return set(self._path.read_text(encoding="utf-8").splitlines())
+
+    def append(self, uris: list[str]) -> None:
+        with self._path.open("a", encoding="utf-8") as f:
+            f.writelines(f"{uri}\n" for uri in uris)
+
+
+class BulkImporter:
+    """Offline import of a whole source: documents are parsed in a process pool, embedded in large concurrent
+    requests, and written by batch with a few appends in Lance and COPY in db. The vector index is built once at the
+    end. Failed documents are left to the live indexer, which indexes them (or records their error) on startup.
+    The import is resumable: batches are committed in vector db, then in db, then in the checkpoint."""
+
+    source: Source
+    db: DbService
+    vector_db: VectorDB
+    embedder: EmbeddingService
+    chunker: Chunker | TokenChunker
+    checkpoint: BulkImportCheckpoint
+    batch_size: int
+    nb_processes: int
+
+    def __init__(
+        self,
+        settings: Settings,
+        source: Source,
+        checkpoint_path: pathlib.Path,
+        batch_size: int,
+        nb_processes: int,
+    ) -> None:
+        self.source = source
+        self.db = DbService(settings.db)
+        self.embedder = EmbeddingService(settings.embedding, settings.embedding__litellm_api_key)
+        self.vector_db = VectorDB(
+            settings.lance_db,
+            self.embedder.distance_metric(),
+            settings.indexer_version,
+            settings.embedding.dimensions,
+            settings.stage_versions,
+            chunks_fingerprint(settings),
+        )
+        self.chunker = get_chunker(settings.chunker)
+        self.indexer_version = settings.indexer_version
+        self.parser_version = settings.stage_versions.parser if settings.stage_versions else None
+        self.checkpoint = BulkImportCheckpoint(checkpoint_path)
+        self.batch_size = batch_size
+        self.nb_processes = nb_processes
+
+    async def run(self) -> None:
+        await self.db.register_indexer_version(self.indexer_version, self.vector_db.table_names())
+        imported_uris = self.checkpoint.read()
+        doc_refs = [doc_ref for doc_ref in await self.source.all_doc_refs() if doc_ref.uri not in imported_uris]
+        logging.info(f"{len(doc_refs)} documents to import ({len(imported_uris)} already imported)")
+        indexed_parsed_hashes = await self.vector_db.get_indexed_parsed_hashes()
+
+        start = time.monotonic()
+        nb_imported = 0
+        with ProcessPoolExecutor(max_workers=self.nb_processes) as pool:
+            for batch in itertools.batched(doc_refs, self.batch_size):
+                await self._import_batch(list(batch), pool, indexed_parsed_hashes)
+                nb_imported += len(batch)
+                rate = nb_imported / (time.monotonic() - start)
+                logging.info(f"{nb_imported}/{len(doc_refs)} documents imported ({rate:.1f} documents/s)")
+
+        logging.info("Compacting tables and creating vector index")
+        await self.vector_db.finish_appends()
+
+    async def _import_batch(
+        self,
+        doc_refs: list[SourceDocumentReference],
+        pool: ProcessPoolExecutor,
+        indexed_parsed_hashes: set[str],
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        # documents are parsed while the next ones are downloaded
+        parsings: list[tuple[SourceDocument, str, asyncio.Future[ParsedDocument]]] = []
+        for doc_ref in doc_refs:
+            source_doc = await self.source.get_document(doc_ref.uri)
+            if source_doc is None or source_doc.doc_ref.source_version_id is None:
+                continue
+            if not is_parsable(source_doc.filetype):
+                continue
+            content = source_doc.content.getvalue()
+            filetype = cast("ParsableFileType", source_doc.filetype)
+            parsing = loop.run_in_executor(pool, _parse, doc_ref.uri, filetype, content)
+            parsings.append((source_doc, hash_file_content(source_doc.content), parsing))
+
+        parsed_docs: list[tuple[SourceDocument, str, ParsedDocument]] = []
+        for source_doc, raw_hash, parsing in parsings:
+            try:
+                parsed_docs.append((source_doc, raw_hash, await parsing))
+            except Exception as e:  # noqa: BLE001
+                logging.warning(f"Parsing of {source_doc.doc_ref.uri} failed, left to the indexer: {e}")
+
+        # contents already indexed (or appearing several times in the batch) are not embedded again
+        to_embed: dict[str, ParsedDocument] = {
+            parsed.hash: parsed for _, _, parsed in parsed_docs if parsed.hash not in indexed_parsed_hashes
+        }
+        documents = [(parsed, self.chunker.chunk(parsed)) for parsed in to_embed.values()]
+        embedded_chunks = await self.embedder.embed_documents(documents)
+        await self.vector_db.append_documents(
+            [(parsed, chunks) for (parsed, _), chunks in zip(documents, embedded_chunks, strict=True)],
+        )
+        indexed_parsed_hashes.update(to_embed)
+
+        await self.db.bulk_load_indexed_documents(
+            [
+                DbBulkLoadedDocument(
+                    uri=source_doc.doc_ref.uri,
+                    source_version=cast("str", source_doc.doc_ref.source_version_id),
+                    size=source_doc.doc_ref.size,
+                    raw_hash=raw_hash,
+                    parsed_hash=parsed.hash,
+                )
+                for source_doc, raw_hash, parsed in parsed_docs
+            ],
+            self.indexer_version,
+            self.parser_version,
+        )
+        self.checkpoint.append([doc_ref.uri for doc_ref in doc_refs])
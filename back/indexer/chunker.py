@@ -1,9 +1,41 @@
+import bisect
+import itertools
 import math
 import re
-from typing import Final
+from typing import Final, Literal
+
+from pydantic import BaseModel
 
 from common.document import Chunk, ParsedDocument
 
+header_pattern: Final[re.Pattern[str]] = re.compile(r"^(#{1,6})\s+(.+)", re.MULTILINE)
+# heuristic tokenization, close to subword tokenizers: a token is a piece of word (up to 4 chars) or a punctuation
+token_pattern: Final[re.Pattern[str]] = re.compile(r"\w{1,4}|[^\w\s]")
+paragraph_end_pattern: Final[re.Pattern[str]] = re.compile(r"\n[^\S\n]*\n\s*")
+sentence_end_pattern: Final[re.Pattern[str]] = re.compile(r"(?<=[.!?;:])\s+|\n\s*")
+
+
+class ChunkerSettings(BaseModel, frozen=True):
+    """Chunking is part of the indexer version: changing it requires a new indexer_version (and chunker stage version)"""
+
+    kind: Literal["characters", "tokens"] = "characters"
+    chunk_size: int = 256  # in tokens, for "tokens" chunker
+    chunk_overlap: int = 32  # in tokens, for "tokens" chunker
+
+
+def count_tokens(text: str) -> int:
+    """Estimation of the number of embedding tokens of text"""
+    return sum(1 for _ in token_pattern.finditer(text))
+
+
+def header_sections(md_content: str) -> list[tuple[int, int]]:
+    """(start, end) of the sections of the document, each starting with its header except the first one"""
+    starts = [match.start() for match in header_pattern.finditer(md_content)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(md_content))
+    return [(start, end) for start, end in itertools.pairwise(starts) if end > start]
+
 
 class Chunker:
 
@@ -37,8 +69,6 @@ class Chunker:
             list[Chunk]: A list of Chunk objects, each representing a section of the Markdown content.
         """
         chunks: list[Chunk] = []
-        # Regular expression to match headers
-        header_pattern = re.compile(r"^(#{1,6})\s+(.+)", re.MULTILINE)
         md_content = doc.markdown_content
 
         # Find all headers and their positions
@@ -56,3 +86,76 @@ class Chunker:
                 chunks.append(chunk)
 
         return chunks
+
+
+class TokenChunker:
+    """Chunks of about chunk_size tokens, overlapping by about chunk_overlap tokens.
+    Chunks never cross a header section, and end on a paragraph or a sentence end when possible."""
+
+    chunk_size: int
+    chunk_overlap: int
+
+    def __init__(self, chunk_size: int, chunk_overlap: int) -> None:
+        assert 0 <= chunk_overlap < chunk_size
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def _chunk_section(self, md_content: str, start_index: int, end_index: int) -> list[Chunk]:
+        section = md_content[start_index:end_index]
+        token_starts = [start_index + m.start() for m in token_pattern.finditer(section)]
+        if len(token_starts) <= self.chunk_size:
+            return [Chunk(start_index_in_doc=start_index, end_index_in_doc=end_index)]
+        paragraph_ends = [start_index + m.end() for m in paragraph_end_pattern.finditer(section)]
+        sentence_ends = [start_index + m.end() for m in sentence_end_pattern.finditer(section)]
+
+        chunks: list[Chunk] = []
+        chunk_start = start_index
+        while True:
+            first_token = bisect.bisect_left(token_starts, chunk_start)
+            if len(token_starts) - first_token <= self.chunk_size:
+                chunks.append(Chunk(start_index_in_doc=chunk_start, end_index_in_doc=end_index))
+                return chunks
+            max_end = token_starts[first_token + self.chunk_size]
+            # prefer a paragraph end in the second half of the chunk, then a sentence end, then a token boundary
+            min_end = token_starts[first_token + max(1, self.chunk_size // 2)]
+            chunk_end = (
+                self._last_boundary(paragraph_ends, min_end, max_end)
+                or self._last_boundary(sentence_ends, min_end, max_end)
+                or max_end
+            )
+            chunks.append(Chunk(start_index_in_doc=chunk_start, end_index_in_doc=chunk_end))
+
+            next_start = chunk_end
+            if self.chunk_overlap:
+                last_token = bisect.bisect_left(token_starts, chunk_end)
+                overlap_start = token_starts[max(first_token + 1, last_token - self.chunk_overlap)]
+                # start the overlap on a sentence when possible
+                next_start = self._first_boundary(sentence_ends, overlap_start, chunk_end) or overlap_start
+            chunk_start = next_start
+
+    @staticmethod
+    def _last_boundary(boundaries: list[int], min_index: int, max_index: int) -> int | None:
+        """last boundary in [min_index, max_index]"""
+        i = bisect.bisect_right(boundaries, max_index)
+        return boundaries[i - 1] if i > 0 and boundaries[i - 1] >= min_index else None
+
+    @staticmethod
+    def _first_boundary(boundaries: list[int], min_index: int, max_index: int) -> int | None:
+        """first boundary in [min_index, max_index)"""
+        i = bisect.bisect_left(boundaries, min_index)
+        return boundaries[i] if i < len(boundaries) and boundaries[i] < max_index else None
+
+    def chunk(self, doc: ParsedDocument) -> list[Chunk]:
+        """Same contract as Chunker.chunk: chunks are in document order and aligned on header sections.
+        Without overlap, chunks are contiguous and rebuild the document."""
+        md_content = doc.markdown_content
+        chunks: list[Chunk] = []
+        for start_index, end_index in header_sections(md_content):
+            chunks.extend(self._chunk_section(md_content, start_index, end_index))
+        return chunks
+
+
+def get_chunker(settings: ChunkerSettings) -> Chunker | TokenChunker:
+    if settings.kind == "tokens":
+        return TokenChunker(settings.chunk_size, settings.chunk_overlap)
+    return Chunker()
@@ -0,0 +1,60 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncGenerator, AsyncIterator
+from datetime import timedelta
+
+from pydantic import BaseModel
+
+from indexer.source import SourceEvent, SourceUpsertEvent
+
+
+class EventBatcherSettings(BaseModel, frozen=True):
+    window: timedelta = timedelta(milliseconds=500)  # events are collected for this duration after the first one
+    max_batch_size: int = 1000  # nb of documents after which a batch is processed without waiting for the window
+
+
+def event_uri(event: SourceEvent) -> str:
+    return event.doc_ref.uri if isinstance(event, SourceUpsertEvent) else event.uri
+
+
+async def batch_events(
+    events: AsyncIterator[SourceEvent],
+    settings: EventBatcherSettings,
+) -> AsyncGenerator[list[SourceEvent], None]:
+    """Batches of the events received during the window following the first event of the batch.
+    Only the last event of a document is kept, so bursts of saves of the same file are indexed once."""
+    queue: asyncio.Queue[SourceEvent | None] = asyncio.Queue()  # None: end of events
+
+    async def receive() -> None:
+        try:
+            async for event in events:
+                queue.put_nowait(event)
+        finally:
+            queue.put_nowait(None)
+
+    receiver = asyncio.create_task(receive())
+    try:
+        ended = False
+        while not ended:
+            first_event = await queue.get()
+            if first_event is None:
+                break
+            batch: dict[str, SourceEvent] = {event_uri(first_event): first_event}
+            deadline = asyncio.get_running_loop().time() + settings.window.total_seconds()
+            while len(batch) < settings.max_batch_size:
+                try:
+                    async with asyncio.timeout_at(deadline):
+                        event = await queue.get()
+                except TimeoutError:
+                    break
+                if event is None:
+                    ended = True
+                    break
+                # a document is in the batch once, at the position of its last event
+                batch.pop(event_uri(event), None)
+                batch[event_uri(event)] = event
+            yield list(batch.values())
+    finally:
+        receiver.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await receiver
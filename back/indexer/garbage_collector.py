@@ -0,0 +1,96 @@
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+
+from pydantic import BaseModel
+
+from common.db_service import DbService
+from common.vector_db import VectorDB
+
+logging = logging.getLogger(__name__)
+
+
+class GarbageCollectorSettings(BaseModel, frozen=True):
+    enabled: bool = True
+    interval: timedelta = timedelta(hours=1)
+    # contents are written in vector db before being referenced in db: an orphan is deleted once it has been found
+    # orphaned for this duration (in-flight indexings, bulk and snapshot imports)
+    grace_period: timedelta = timedelta(days=1)
+    batch_size: int = 1000  # parsed hashes per db query and per vector db delete
+
+
+class OrphanTracker:
+    """Time at which each orphaned parsed hash was first found orphaned (monotonic clock)"""
+
+    _first_found: dict[str, float]
+
+    def __init__(self) -> None:
+        self._first_found = {}
+
+    def update(self, orphans: set[str], now: float, grace_period: timedelta) -> list[str]:
+        """Track the orphans found now, forget the others (referenced again or deleted), and return the orphans
+        found orphaned for longer than the grace period"""
+        self._first_found = {orphan: self._first_found.get(orphan, now) for orphan in orphans}
+        return [
+            orphan
+            for orphan, first_found in self._first_found.items()
+            if now - first_found >= grace_period.total_seconds()
+        ]
+
+
+class GarbageCollector:
+    """Delete the parsed documents and chunks of the vector db that no indexed content references anymore (deleted
+    documents, previous contents of edited documents), so that they do not take top-k slots in searches.
+    Indexed contents referenced by no indexed document are pruned first, after the grace period.
+    The vector db is optimized after each pass (compaction, new chunks added to the vector index)."""
+
+    db: DbService
+    vector_db: VectorDB
+    settings: GarbageCollectorSettings
+    _orphans: OrphanTracker
+
+    def __init__(self, db: DbService, vector_db: VectorDB, settings: GarbageCollectorSettings) -> None:
+        self.db = db
+        self.vector_db = vector_db
+        self.settings = settings
+        self._orphans = OrphanTracker()
+
+    async def collect(self) -> int:
+        """One pass, returns the number of parsed docs deleted from the vector db"""
+        nb_contents = await self.db.prune_unreferenced_indexed_contents(
+            self.settings.grace_period,
+            self.settings.batch_size,
+        )
+        if nb_contents:
+            logging.info(f"{nb_contents} unreferenced indexed contents deleted")
+
+        stored_parsed_hashes = sorted(await self.vector_db.get_stored_parsed_hashes())
+        orphans: set[str] = set()
+        for batch in itertools.batched(stored_parsed_hashes, self.settings.batch_size):
+            orphans.update(set(batch) - await self.db.get_referenced_parsed_hashes(list(batch)))
+
+        nb_deleted = 0
+        expired_orphans = self._orphans.update(orphans, time.monotonic(), self.settings.grace_period)
+        for batch in itertools.batched(expired_orphans, self.settings.batch_size):
+            # checked again just before deleting (a document may have been reverted to this content meanwhile), and
+            # locked while deleting: an indexing reusing them waits, then finds them not indexed anymore
+            async with self.db.lock_unreferenced_parsed_hashes(list(batch)) as to_delete:
+                await self.vector_db.delete_documents(to_delete)
+            nb_deleted += len(to_delete)
+        logging.info(f"{len(orphans)} orphaned parsed docs in vector db, {nb_deleted} deleted")
+        return nb_deleted
+
+    async def run(self) -> None:
+        """Infinite loop collecting garbage every interval"""
+        while True:
+            try:
+                await self.collect()
+            except Exception:
+                logging.exception("Error collecting vector db garbage")
+            try:
+                await self.vector_db.optimize()
+            except Exception:
+                logging.exception("Error optimizing vector db")
+            await asyncio.sleep(self.settings.interval.total_seconds())
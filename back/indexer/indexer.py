@@ -1,23 +1,41 @@
 import asyncio
+import contextlib
 import logging
-from typing import cast
-from uuid import UUID
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Final, cast
+from uuid import UUID, uuid4
 
 from pydantic import BaseModel
 
-from common.db_service import DbDocument, DbIndexedContent, DbService, TableIndexedDocumentStatusEnum
-from common.document import ParsableFileType, is_parsable
+from common.db_service import (
+    DbDocument,
+    DbIndexingRequest,
+    DbService,
+    TableIndexedDocumentStatusEnum,
+)
+from common.document import ParsableFileType, ParsedDocument, is_parsable
 from common.embedding_service import EmbeddingService
 from common.utils import hash_file_content
-from common.vector_db import VectorDB
-from indexer.chunker import Chunker
-from indexer.parser import Parser
-from indexer.settings import Settings
-from indexer.source import Source, SourceDeleteEvent, SourceDocumentReference, SourceUpsertEvent
+from common.vector_db import StageVersions, VectorDB
+from indexer.admission import MemoryAdmissionController, measure_peak_memory
+from indexer.chunker import Chunker, TokenChunker, get_chunker
+from indexer.event_batcher import EventBatcherSettings, batch_events
+from indexer.garbage_collector import GarbageCollector
+from indexer.parser import parse_in_process
+from indexer.scheduling import IndexingPriority, SchedulingSettings, indexing_delay
+from indexer.settings import IndexingQueueSettings, Settings, chunks_fingerprint
+from indexer.source import Source, SourceDeleteEvent, SourceDocument, SourceDocumentReference, SourceUpsertEvent
 from indexer.sources.seemantic_drive import SeemanticDriveSource
 
 logging = logging.getLogger(__name__)
 
+# changes are kept long enough for API listeners to resume after a reconnection
+document_changes_retention: Final[timedelta] = timedelta(days=1)
+document_changes_prune_interval: Final[timedelta] = timedelta(hours=1)
+
 
 class RawDocIndexationResult(BaseModel):
     raw_content_hash: str
@@ -38,41 +56,64 @@ class IndexingError(Exception):
         return self.public_error
 
 
-class DocToIndex(BaseModel, frozen=True):
-    source_ref: SourceDocumentReference
-    indexed_doc_id: UUID
-
-
 class Indexer:
     source: Source
     db: DbService
-    parser: Parser = Parser()
-    chunker: Chunker = Chunker()
+    chunker: Chunker | TokenChunker
     embedder: EmbeddingService
     vector_db: VectorDB
-    docs_to_index_queue: asyncio.Queue[DocToIndex]
-    uris_in_queue: set[
-        str
-    ]  # to not re-add uri to queue if already in it (cap queue size to the number of documents in source)
-    queue_started: asyncio.Event  # to signal that the queue is started
-    background_task_process_queue: asyncio.Task[
-        None
-    ]  # keep a ref to the queue processing task, so it's not garbage collected, cf. RUF006
+    stage_versions: StageVersions | None
+    queue_settings: IndexingQueueSettings
+    scheduling_settings: SchedulingSettings
+    event_batcher_settings: EventBatcherSettings
+    garbage_collector: GarbageCollector | None  # None if disabled
+    parsing_admission: MemoryAdmissionController  # limits the memory of documents parsed concurrently by workers
+    parsing_pool: ProcessPoolExecutor  # docling converters are not thread-safe, each parsing process has its own
+    worker_id: str  # lease owner of the documents claimed by this indexer, unique across replicas and restarts
+    docs_being_indexed: dict[UUID, str]  # indexed document id -> uri, leases to renew
+    docs_enqueued: asyncio.Event  # to wake up workers when documents are enqueued by this indexer
+    # keep a ref to the workers, so they're not garbage collected, cf. RUF006
+    background_tasks: list[asyncio.Task[None]]
 
     def __init__(self, settings: Settings) -> None:
         self.embedder = EmbeddingService(settings.embedding, settings.embedding__litellm_api_key)
-        self.vector_db = VectorDB(settings.lance_db, self.embedder.distance_metric(), settings.indexer_version)
+        self.vector_db = VectorDB(
+            settings.lance_db,
+            self.embedder.distance_metric(),
+            settings.indexer_version,
+            settings.embedding.dimensions,
+            settings.stage_versions,
+            chunks_fingerprint(settings),
+        )
         self.source = SeemanticDriveSource(settings=settings.minio)
         self.db = DbService(settings.db)
-        self.docs_to_index_queue = asyncio.Queue(maxsize=10000)
-        self.uris_in_queue = set()
-        self.queue_started = asyncio.Event()
+        self.queue_settings = settings.indexing_queue
+        self.scheduling_settings = settings.indexing_scheduling
+        self.event_batcher_settings = settings.source_events
+        self.parsing_admission = MemoryAdmissionController(settings.parsing_admission)
+        self.parsing_pool = ProcessPoolExecutor(max_workers=settings.indexing_queue.nb_workers)
+        self.chunker = get_chunker(settings.chunker)
+        self.garbage_collector = (
+            GarbageCollector(self.db, self.vector_db, settings.garbage_collector)
+            if settings.garbage_collector.enabled
+            else None
+        )
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:8]}"
+        self.docs_being_indexed = {}
+        self.docs_enqueued = asyncio.Event()
+        self.background_tasks = []
         self.indexer_version = settings.indexer_version
-
-    async def _start_queue_processing(self) -> None:
-        """Start the queue processing task, return only when the processing actually started"""
-        self.background_task_process_queue = asyncio.create_task(self._process_queue())
-        await self.queue_started.wait()
+        self.stage_versions = settings.stage_versions
+
+    def _start_queue_processing(self) -> None:
+        """Start the indexing workers, the heartbeat renewing their leases and the vector db garbage collector"""
+        self.background_tasks = [
+            asyncio.create_task(self._process_queue()) for _ in range(self.queue_settings.nb_workers)
+        ]
+        self.background_tasks.append(asyncio.create_task(self._heartbeat()))
+        if self.garbage_collector is not None:
+            self.background_tasks.append(asyncio.create_task(self.garbage_collector.run()))
+        logging.info(f"Indexing queue started with {self.queue_settings.nb_workers} workers (id {self.worker_id})")
 
     async def _set_indexing_error(
         self,
@@ -82,39 +123,118 @@ class Indexer:
     ) -> None:
         """set the document status to indexing error in case of error during indexing (parsing, embedding...)"""
         logging.warning(f"indexing error for document {indexed_doc_id}: {internal_error or public_error}")
-        await self.db.update_indexed_documents_status(
-            [indexed_doc_id],
-            TableIndexedDocumentStatusEnum.indexing_error,
-            public_error,
-        )
+        await self.db.mark_indexing_error(indexed_doc_id, self.indexer_version, public_error, self.worker_id)
+
+    async def _claim_next_document(self) -> DbDocument:
+        """Wait for a pending document of the shared queue and claim it"""
+        while True:
+            self.docs_enqueued.clear()  # cleared before claiming, so that documents enqueued meanwhile are not missed
+            claimed = await self.db.claim_documents_to_index(
+                self.indexer_version,
+                self.worker_id,
+                self.queue_settings.lease_duration,
+                limit=1,
+                max_attempts=self.queue_settings.max_attempts,
+            )
+            if claimed:
+                return claimed[0]
+            # other replicas may enqueue documents too, so the queue is polled even if not woken up
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(
+                    self.docs_enqueued.wait(),
+                    timeout=self.queue_settings.poll_interval.total_seconds(),
+                )
 
     async def _process_queue(self) -> None:
-        """Infinite loop waiting for updated documents to index"""
-        self.queue_started.set()
-        logging.info("Indexing queue started")
+        """Infinite loop claiming documents to index"""
         while True:
-            doc_to_index = await self.docs_to_index_queue.get()
-            uri = doc_to_index.source_ref.uri
-            indexed_doc_id = doc_to_index.indexed_doc_id
             try:
-                self.uris_in_queue.remove(uri)  # uri can be re-added to queue as soon as processing starts
+                doc = await self._claim_next_document()
+            except Exception:
+                logging.exception("Error claiming documents to index")
+                await asyncio.sleep(self.queue_settings.poll_interval.total_seconds())
+                continue
+            uri = doc.uri
+            indexed_doc_id = doc.indexed_document_id
+            self.docs_being_indexed[indexed_doc_id] = uri
+            try:
                 logging.info(f"Start indexing: {uri}")
-                await self._index_and_store(doc_to_index)
+                await self._index_and_store(doc)
             except IndexingError as e:
                 logging.exception(f"Error indexing {uri}")
                 await self._set_indexing_error(indexed_doc_id, e.public_error)
             except Exception:
                 logging.exception(f"Unexpected error indexing {uri}")
                 await self._set_indexing_error(indexed_doc_id, "Unknown error")
-            self.docs_to_index_queue.task_done()
+            finally:
+                self.docs_being_indexed.pop(indexed_doc_id, None)
+
+    async def _heartbeat(self) -> None:
+        """Renew the leases of the documents being indexed, give up documents that crashed too many workers, and
+        prune the change feed from time to time (it is pruned at startup too)"""
+        loop = asyncio.get_running_loop()
+        last_changes_prune = loop.time()
+        while True:
+            await asyncio.sleep(self.queue_settings.heartbeat_interval.total_seconds())
+            if loop.time() - last_changes_prune > document_changes_prune_interval.total_seconds():
+                last_changes_prune = loop.time()
+                try:
+                    await self.db.prune_document_changes(document_changes_retention)
+                except Exception:
+                    logging.exception("Error pruning document changes")
+            try:
+                if self.docs_being_indexed:
+                    await self.db.renew_leases(
+                        list(self.docs_being_indexed),
+                        self.worker_id,
+                        self.queue_settings.lease_duration,
+                    )
+                await self.db.fail_abandoned_documents(self.indexer_version, self.queue_settings.max_attempts)
+            except Exception:
+                logging.exception("Error renewing indexing leases")
 
-    async def _index_and_store(self, doc_to_index: DocToIndex) -> None:
-        """indexing workflow for one enqeued document"""
-        # Update document status to indexing
-        indexed_doc_id = doc_to_index.indexed_doc_id
-        uri = doc_to_index.source_ref.uri
-        await self.db.update_indexed_documents_status([indexed_doc_id], TableIndexedDocumentStatusEnum.indexing, None)
+    async def _index_and_store(self, doc: DbDocument) -> None:
+        """indexing workflow for one claimed document (status already set to indexing by the claim)"""
+        indexed_doc_id = doc.indexed_document_id
+        uri = doc.uri
 
+        known_content = await self._get_known_indexed_content(uri)
+        if known_content is not None:
+            indexed_content, source_version_id = known_content
+        else:
+            indexed_content, source_version_id = await self._download_and_index(uri)
+
+        # attach the indexed content to the document
+        logging.info(f"Mark document as indexed in db for {uri}")
+        updated = await self.db.mark_indexing_success(
+            indexed_doc_id,
+            self.indexer_version,
+            source_version_id,
+            indexed_content,
+            self.worker_id,
+        )
+        if updated:
+            logging.info(f"indexing process completed for {uri}")
+        else:
+            logging.info(f"lease lost while indexing {uri} (re-enqueued or expired), result discarded")
+
+    async def _get_known_indexed_content(self, uri: str) -> tuple[UUID, str | None] | None:
+        """(indexed content id, source version) if the current object was already downloaded with the same etag and
+        size (e.g. copied, moved or uploaded again), without downloading it"""
+        doc_ref = await self.source.get_document_ref(uri)
+        if doc_ref is None or doc_ref.source_version_id is None or doc_ref.size is None:
+            return None
+        raw_hash = await self.db.get_raw_hash_if_known(doc_ref.source_version_id, doc_ref.size)
+        if raw_hash is None:
+            return None
+        indexed_content = await self.db.touch_indexed_content(raw_hash, self.indexer_version)
+        if indexed_content is None:
+            return None
+        logging.info(f"etag and size of {uri} known (raw_hash {raw_hash}), download and indexing skipped")
+        return indexed_content[0], doc_ref.source_version_id
+
+    async def _download_and_index(self, uri: str) -> tuple[UUID, str | None]:
+        """(indexed content id, source version) of the downloaded document, indexed if its raw hash is not"""
         # Retrieve the source document
         source_doc = await self.source.get_document(uri)
         if source_doc is None:
@@ -126,63 +246,101 @@ class Indexer:
 
         # check if raw hash changed
         raw_hash = hash_file_content(source_doc.content)
-        indexed_content = await self.db.get_indexed_content_if_exists(raw_hash, self.indexer_version)
-        if indexed_content:
+        etag, size = source_doc.doc_ref.source_version_id, source_doc.doc_ref.size
+        if etag is not None and size is not None:
+            await self.db.upsert_source_object_content(etag, size, raw_hash)
+        existing_content = await self.db.touch_indexed_content(raw_hash, self.indexer_version)
+        indexed_content: UUID
+        if existing_content:
             # raw hash already indexed, no need to parse again
-            indexed_content_id = indexed_content[0]
+            indexed_content = existing_content[0]
             logging.info(
-                f"content with raw_hash {raw_hash} already indexed for {uri} with id {indexed_content_id}, indexing skipped",
+                f"content with raw_hash {raw_hash} already indexed for {uri} with id {indexed_content}, indexing skipped",
             )
         else:
             # raw hash not found in indexed documents
-            logging.info(f"Parsing {uri}")
-            filetype = cast("ParsableFileType", source_doc.filetype)
-            parsed = self.parser.parse(uri, filetype, source_doc.content)
+            parsed = await self._get_parsed_or_parse(source_doc, raw_hash)
             if await self.vector_db.is_indexed(parsed.hash):
                 logging.info(f"parsed_hash already indexed, indexing skipped for {uri}")
             else:
-                logging.info(f"Chunking {uri}")
-                chunks = self.chunker.chunk(parsed)
-                logging.info(f"Embedding {uri}")
-                embedded_chunks = await self.embedder.embed_document(parsed, chunks)
-                logging.info(f"Storing {uri} in vector db")
-                await self.vector_db.index(parsed, embedded_chunks)
-                logging.info(f"Mark content as indexed in db for {uri}")
-
-            # upsert indexed content
-            indexed_content_id = await self.db.upsert_indexed_content(
-                DbIndexedContent(raw_hash=raw_hash, parsed_hash=parsed.hash),
-                self.indexer_version,
+                await self._index_parsed(uri, parsed)
+
+            indexed_content = await self.db.upsert_indexed_content(raw_hash, parsed.hash, self.indexer_version)
+            # the parsed doc may have been deleted by a garbage collector (of any replica) before the indexed content
+            # referenced it, it cannot be anymore
+            if not await self.vector_db.is_indexed(parsed.hash, latest=True):
+                logging.info(f"parsed_hash garbage collected meanwhile, indexing again {uri}")
+                await self._index_parsed(uri, parsed)
+        return indexed_content, source_doc.doc_ref.source_version_id
+
+    async def _index_parsed(self, uri: str, parsed: ParsedDocument) -> None:
+        """Chunk, embed and store the parsed document in the vector db"""
+        logging.info(f"Chunking {uri}")
+        chunks = self.chunker.chunk(parsed)
+        logging.info(f"Embedding {uri}")
+        embedded_chunks = await self.embedder.embed_document(parsed, chunks)
+        logging.info(f"Storing {uri} in vector db")
+        await self.vector_db.index(parsed, embedded_chunks)
+
+    async def _get_parsed_or_parse(self, source_doc: SourceDocument, raw_hash: str) -> ParsedDocument:
+        """Parsed content of the raw hash stored by an indexer version with the same parser version, parse otherwise"""
+        uri = source_doc.doc_ref.uri
+        if self.stage_versions is not None:
+            parsed_hash = await self.db.get_parsed_hash_if_exists(raw_hash, self.stage_versions.parser)
+            parsed = await self.vector_db.get_document(parsed_hash) if parsed_hash else None
+            if parsed is not None:
+                logging.info(f"content with raw_hash {raw_hash} already parsed for {uri}, parsing skipped")
+                return parsed
+
+        logging.info(f"Parsing {uri}")
+        filetype = cast("ParsableFileType", source_doc.filetype)
+        # parsing is cpu bound, run in a process so that other workers and heartbeats are not blocked
+        loop = asyncio.get_running_loop()
+        async with self.parsing_admission.admit(filetype, source_doc.content.getbuffer().nbytes) as admitted:
+            content = source_doc.content.getvalue()
+            parsed, admitted.peak_memory = await loop.run_in_executor(
+                self.parsing_pool,
+                measure_peak_memory,
+                parse_in_process,
+                uri,
+                filetype,
+                content,
             )
+        if self.stage_versions is not None:
+            # the parsed doc is stored in vector db afterwards with the chunks, if it is not (crash) it is parsed again
+            await self.db.upsert_parsed_content(raw_hash, parsed.hash, self.stage_versions.parser)
+        return parsed
 
-        # update document indexed content id
-        logging.info(f"Mark document as indexed in db for {uri}")
-        await self.db.update_indexed_document_indexed_content_id(
-            indexed_doc_id,
-            source_doc.doc_ref.source_version_id,
-            indexed_content_id,
-        )
-        logging.info(f"indexing process completed for {uri}")
-
-    async def _enqueue_doc_refs(self, refs: list[DocToIndex]) -> None:
-        for ref in refs:
-            self.uris_in_queue.add(
-                ref.source_ref.uri,
-            )  # when uri is added to queue, unique set should already be updated (so it can be removed)
-            self.docs_to_index_queue.put_nowait(ref)
-
-    async def _manage_upserts(self, refs: list[SourceDocumentReference], uri_to_db_docs: dict[str, DbDocument]) -> None:
+    async def _manage_upserts(
+        self,
+        refs: list[SourceDocumentReference],
+        uri_to_db_docs: dict[str, DbDocument],
+        priority: IndexingPriority,
+    ) -> None:
         """Qualify documents to be indexed and enqueue them if needed"""
-        docs_to_update: list[DocToIndex] = []
-        docs_to_create: list[DocToIndex] = []
-        new_doc_refs: list[SourceDocumentReference] = []
+        docs_to_update: dict[UUID, DbIndexingRequest] = {}
+        docs_to_create: list[DbIndexingRequest] = []
         for doc_ref in refs:
             uri = doc_ref.uri
-            if uri in self.uris_in_queue:
-                continue
+            request = DbIndexingRequest(
+                uri=uri,
+                source_version=doc_ref.source_version_id,
+                indexing_delay=indexing_delay(doc_ref, priority, self.scheduling_settings),
+            )
             db_doc = uri_to_db_docs.get(uri)
             if db_doc is None:
-                new_doc_refs.append(doc_ref)
+                docs_to_create.append(request)
+            elif (
+                db_doc.status.status == TableIndexedDocumentStatusEnum.indexing
+                or (
+                    db_doc.status.status == TableIndexedDocumentStatusEnum.pending
+                    and priority == IndexingPriority.reconciliation
+                )
+            ) and (
+                doc_ref.source_version_id is not None and db_doc.source_version_to_index == doc_ref.source_version_id
+            ):
+                # already in queue for this version (a live event re-enqueues a pending document to bump its priority)
+                continue
             elif (
                 db_doc.last_indexing is None
                 or db_doc.indexed_source_version is None
@@ -190,30 +348,19 @@ class Indexer:
                 or db_doc.indexed_source_version != doc_ref.source_version_id
             ):
                 # doc might have changed
-                docs_to_update.append(DocToIndex(source_ref=doc_ref, indexed_doc_id=db_doc.indexed_document_id))
+                docs_to_update[db_doc.indexed_document_id] = request
             else:
                 # doc did not change since last successful indexing
                 continue
 
-        if new_doc_refs:
-            uri_to_created_indexed_id = await self.db.create_indexed_documents(
-                [doc.uri for doc in new_doc_refs],
-                self.indexer_version,
-            )
-            docs_to_create = [
-                DocToIndex(source_ref=doc_ref, indexed_doc_id=uri_to_created_indexed_id[doc_ref.uri])
-                for doc_ref in new_doc_refs
-            ]
+        if docs_to_create:
+            # documents are created in pending status, ready to be claimed
+            await self.db.create_indexed_documents(docs_to_create, self.indexer_version)
         if docs_to_update:
-            await self.db.update_indexed_documents_status(
-                [doc.indexed_doc_id for doc in docs_to_update],
-                TableIndexedDocumentStatusEnum.pending,
-                None,
-            )
+            await self.db.enqueue_indexed_documents(docs_to_update, self.indexer_version)
         if docs_to_update or docs_to_create:
-            docs_enqueued = docs_to_update + docs_to_create
-            logging.info(f"Enqueuing documents: {docs_enqueued}")
-            await self._enqueue_doc_refs(docs_enqueued)
+            logging.info(f"Enqueued {len(docs_to_create) + len(docs_to_update)} documents")
+            self.docs_enqueued.set()
 
     async def start(self) -> None:
         """Start the indexer
@@ -221,40 +368,41 @@ class Indexer:
         2. Listen to source events and process them as they come
         """
         logging.info("Starting indexer")
-        await self._start_queue_processing()
+        await self.db.register_indexer_version(self.indexer_version, self.vector_db.table_names())
+        await self.db.prune_document_changes(document_changes_retention)
+        self._start_queue_processing()
 
         source_doc_refs = await self.source.all_doc_refs()
         uri_to_doc_refs = {doc_ref.uri: doc_ref for doc_ref in source_doc_refs}
         db_docs = await self.db.get_all_documents(indexer_version=self.indexer_version)
         uri_to_db = {doc.uri: doc for doc in db_docs}
 
-        await self._manage_upserts(source_doc_refs, uri_to_db)
+        await self._manage_upserts(source_doc_refs, uri_to_db, IndexingPriority.reconciliation)
         to_delete = set(uri_to_db.keys()) - set(uri_to_doc_refs.keys())
         if to_delete:
             await self.db.delete_documents(list(to_delete))
 
-        async for event in self.source.listen():
-            if isinstance(event, SourceUpsertEvent):
-                uri_to_db = await self.db.get_documents([event.doc_ref.uri], self.indexer_version)
-                await self._manage_upserts([event.doc_ref], uri_to_db)
-            else:
-                assert isinstance(event, SourceDeleteEvent)
-                await self.db.delete_documents([event.uri])
+        # bursts of events (sync clients, repeated saves) are processed in batches, with one db round trip per batch
+        async for batch in batch_events(self.source.listen(), self.event_batcher_settings):
+            upserted_refs = [event.doc_ref for event in batch if isinstance(event, SourceUpsertEvent)]
+            deleted_uris = [event.uri for event in batch if isinstance(event, SourceDeleteEvent)]
+            if upserted_refs:
+                uri_to_db = await self.db.get_documents([ref.uri for ref in upserted_refs], self.indexer_version)
+                await self._manage_upserts(upserted_refs, uri_to_db, IndexingPriority.interactive)
+            if deleted_uris:
+                await self.db.delete_documents(deleted_uris)
 
         logging.info("Indexer stopped")
 
 
 # on each source_ref received:
-# if uri is in queue:
-#     nothing to do, status should already be set to pending
+# if uri is being indexed (or pending, on reconciliation) for the same source version:
+#     nothing to do, it's already in the queue
 # if uri is not in db:
-#     create document with empty version and status pending
-#     enqueue in indexing queue
+#     create document with empty version and status pending (claimed by an indexer worker)
 # if uri in db but without indexed version: has never been indexed
 #     update document with status pending
-#     enqueue in indexing queue
 # if uri in db and with indexed_version but version changed or is unkown: content may have changed
 #     update document with status pending
-#     enqueue in indexing queue
 # if uri in db and indxed_version is the same:
 #     nothing to do
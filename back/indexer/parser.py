@@ -1,3 +1,4 @@
+import functools
 from io import BytesIO
 
 from docling.document_converter import DocumentConverter, DocumentStream  # type: ignore[StubNotFound]
@@ -7,8 +8,10 @@ from common.document import ParsableFileType, ParsedDocument
 
 
 class Parser:
+    """Not thread-safe, as docling converters are not: concurrent parsings use one parser per process
+    (cf. parse_in_process)"""
 
-    _converter: DocumentConverter = DocumentConverter()
+    _converter: DocumentConverter | None = None  # created on first docx or pdf, it loads the docling models
 
     def parse(self, filename: str, filetype: ParsableFileType, file_content: BytesIO) -> ParsedDocument:
         file_content.seek(0)
@@ -17,6 +20,8 @@ class Parser:
             content_hash = xxh3_128_hexdigest(content)
             return ParsedDocument(hash=content_hash, markdown_content=content)
         if filetype in ("docx", "pdf"):
+            if self._converter is None:
+                self._converter = DocumentConverter()
             document_stream = DocumentStream(name=filename, stream=file_content)
             result = self._converter.convert(document_stream)
             docling_doc = result.document
@@ -25,3 +30,14 @@ class Parser:
             return ParsedDocument(hash=content_hash, markdown_content=content)
         error = f"Unsupported file_type {filetype}"
         raise ValueError(error)
+
+
+@functools.cache
+def _process_parser() -> Parser:
+    return Parser()
+
+
+def parse_in_process(filename: str, filetype: ParsableFileType, content: bytes) -> ParsedDocument:
+    """Run in parsing processes (ProcessPoolExecutor): one parser per process, whose docling models are loaded once,
+    not in the main one"""
+    return _process_parser().parse(filename, filetype, BytesIO(content))
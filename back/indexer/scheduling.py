@@ -0,0 +1,50 @@
+import enum
+import pathlib
+from datetime import timedelta
+from typing import Final
+
+from pydantic import BaseModel
+
+from indexer.source import SourceDocumentReference
+
+# relative indexing cost of one byte, by file extension (pdf parsing includes layout analysis and ocr)
+filetype_cost_weights: Final[dict[str, float]] = {
+    "pdf": 4.0,
+    "doc": 1.5,
+    "docx": 1.5,
+    "md": 0.2,
+    "txt": 0.2,
+}
+default_cost_weight: Final[float] = 1.0
+
+
+class IndexingPriority(enum.Enum):
+    interactive = "interactive"  # live source events, a user is waiting for the document to be searchable
+    reconciliation = "reconciliation"  # diff between source and db on startup
+
+
+class SchedulingSettings(BaseModel, frozen=True):
+    """Documents are claimed by due time: enqueue time + a delay depending on priority and estimated cost.
+    A document enqueued long enough ago always gets ahead of new ones, so the backlog keeps moving."""
+
+    reconciliation_delay: timedelta = timedelta(minutes=10)
+    delay_per_weighted_mb: timedelta = timedelta(seconds=2)
+    max_cost_delay: timedelta = timedelta(minutes=10)
+    default_size: int = 1_000_000  # in bytes, when the source does not provide it
+
+
+def estimated_cost(doc_ref: SourceDocumentReference, settings: SchedulingSettings) -> float:
+    """Estimated indexing cost in weighted MB"""
+    size = doc_ref.size if doc_ref.size is not None else settings.default_size
+    extension = pathlib.PurePosixPath(doc_ref.uri).suffix[1:].lower()
+    return size / 1_000_000 * filetype_cost_weights.get(extension, default_cost_weight)
+
+
+def indexing_delay(
+    doc_ref: SourceDocumentReference,
+    priority: IndexingPriority,
+    settings: SchedulingSettings,
+) -> timedelta:
+    cost_delay = min(settings.delay_per_weighted_mb * estimated_cost(doc_ref, settings), settings.max_cost_delay)
+    priority_delay = settings.reconciliation_delay if priority == IndexingPriority.reconciliation else timedelta(0)
+    return priority_delay + cost_delay
@@ -1,11 +1,34 @@
+from datetime import timedelta
 from functools import lru_cache
+from typing import Self
 
+from pydantic import BaseModel, model_validator
 from pydantic_settings import SettingsConfigDict
+from xxhash import xxh3_128_hexdigest
 
 from common.settings import CommonSettings
+from indexer.admission import AdmissionSettings
+from indexer.chunker import ChunkerSettings
+from indexer.event_batcher import EventBatcherSettings
+from indexer.garbage_collector import GarbageCollectorSettings
+from indexer.scheduling import SchedulingSettings
+
+
+class IndexingQueueSettings(BaseModel, frozen=True):
+    nb_workers: int = 1  # concurrent indexings in this indexer process
+    lease_duration: timedelta = timedelta(minutes=2)  # a document is claimed again if its worker did not renew it
+    heartbeat_interval: timedelta = timedelta(seconds=30)
+    poll_interval: timedelta = timedelta(seconds=5)  # to pick documents enqueued by other indexer replicas
+    max_attempts: int = 3  # indexing attempts of a document before it's set in error (crashed workers)
 
 
 class Settings(CommonSettings):
+    indexing_queue: IndexingQueueSettings = IndexingQueueSettings()
+    indexing_scheduling: SchedulingSettings = SchedulingSettings()
+    parsing_admission: AdmissionSettings = AdmissionSettings()
+    chunker: ChunkerSettings = ChunkerSettings()
+    source_events: EventBatcherSettings = EventBatcherSettings()
+    garbage_collector: GarbageCollectorSettings = GarbageCollectorSettings()
 
     # frozen=True makes it hashable so it can be used as an argument of other functions decorated with lru_cache
     model_config = SettingsConfigDict(
@@ -15,7 +38,26 @@ class Settings(CommonSettings):
         secrets_dir=".ignored/secrets",
     )
 
+    @model_validator(mode="after")
+    def check_lance_db(self) -> Self:
+        if self.lance_db.cache is not None or self.lance_db.flat_index is not None:
+            error = "lance_db.cache and lance_db.flat_index are for readers only (API)"
+            raise ValueError(error)
+        if self.lance_db.read_consistency_interval is None:
+            # e.g. a parsed doc written by another replica would not be seen, and would be written again
+            error = "lance_db.read_consistency_interval is required, indexer replicas must see each other's writes"
+            raise ValueError(error)
+        return self
+
 
 @lru_cache
 def get_settings() -> Settings:
     return Settings()  # type: ignore[reportCallIssue]
+
+
+def chunks_fingerprint(settings: Settings) -> str:
+    """Hash of the settings producing the rows of the chunk table (chunk boundaries, embeddings and their compact
+    forms). Chunks can be copied between indexer versions with the same fingerprint instead of being embedded again."""
+    embedding = settings.embedding.model_dump_json(exclude={"litellm_query_kwargs"})
+    lance_db = settings.lance_db.model_dump_json(include={"quantization", "candidate_dimensions"})
+    return xxh3_128_hexdigest(settings.chunker.model_dump_json() + embedding + lance_db)
@@ -0,0 +1,190 @@
+import datetime as dt
+import logging
+import pathlib
+from collections.abc import AsyncGenerator, AsyncIterable, Callable
+from datetime import datetime
+from typing import Final
+
+import pyarrow as pa
+from pydantic import BaseModel
+
+from common.db_service import DbBulkLoadedDocument, DbService
+from common.embedding_service import EmbeddingService
+from common.vector_db import StageVersions, TableRole, VectorDB, count_batch_rows_by_parsed_hash
+from indexer.settings import Settings, chunks_fingerprint
+
+logging = logging.getLogger(__name__)
+
+snapshot_format_version: Final[int] = 1
+manifest_file_name: Final[str] = "manifest.json"
+documents_file_name: Final[str] = "indexed_document.arrow"
+
+document_snapshot_schema = pa.schema(
+    [
+        ("uri", pa.string()),
+        ("source_version", pa.string()),
+        ("raw_hash", pa.string()),
+        ("parsed_hash", pa.string()),
+    ],
+)
+
+
+class SnapshotTable(BaseModel):
+    table_name: str
+    lance_version: int  # version of the table when it was exported
+    nb_rows: int
+
+
+class SnapshotManifest(BaseModel):
+    """Written last: a snapshot without manifest is incomplete"""
+
+    format_version: int
+    indexer_version: int
+    stage_versions: StageVersions | None
+    chunks_fingerprint: str
+    creation_datetime: datetime
+    nb_documents: int
+    tables: dict[TableRole, SnapshotTable]  # in write order
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _log_progress(name: str, nb_rows_read: int, nb_rows: int) -> None:
+    logging.info(f"{name}: {nb_rows_read}/{nb_rows} rows")
+
+
+def _vector_db(settings: Settings) -> VectorDB:
+    return VectorDB(
+        settings.lance_db,
+        EmbeddingService(settings.embedding, settings.embedding__litellm_api_key).distance_metric(),
+        settings.indexer_version,
+        settings.embedding.dimensions,
+        settings.stage_versions,
+        chunks_fingerprint(settings),
+    )
+
+
+def _table_file_name(role: TableRole) -> str:
+    return f"{role}.arrow"
+
+
+async def write_batches(
+    path: pathlib.Path,
+    schema: pa.Schema,
+    batches: AsyncIterable[pa.RecordBatch],
+    on_batch: Callable[[int], None],
+) -> int:
+    """Write the batches in an Arrow IPC stream file, without schema metadata. Returns the number of rows written."""
+    nb_rows = 0
+    with pa.OSFile(str(path), "wb") as file, pa.ipc.new_stream(file, schema.remove_metadata()) as writer:
+        async for batch in batches:
+            writer.write_batch(batch.replace_schema_metadata(None))
+            nb_rows += batch.num_rows
+            on_batch(nb_rows)
+    return nb_rows
+
+
+async def read_batches(path: pathlib.Path) -> AsyncGenerator[pa.RecordBatch, None]:
+    with pa.memory_map(str(path)) as source:
+        for batch in pa.ipc.open_stream(source):
+            yield batch
+
+
+async def _document_batches(
+    db: DbService,
+    indexer_version: int,
+    batch_size: int,
+) -> AsyncGenerator[pa.RecordBatch, None]:
+    async for documents in db.stream_indexed_documents(indexer_version, batch_size):
+        yield pa.RecordBatch.from_pylist(
+            [document.model_dump(exclude={"size"}) for document in documents],
+            schema=document_snapshot_schema,
+        )
+
+
+async def export_snapshot(settings: Settings, path: pathlib.Path, batch_size: int) -> SnapshotManifest:
+    """Export the indexed documents of the indexer version and their vector db tables in a new directory:
+    Arrow IPC streams and a manifest. It does not block running indexers: db rows are read in a single query, and
+    tables are read at their version pinned afterwards, so that they contain all the contents the rows reference."""
+    path.mkdir(parents=True)
+    db = DbService(settings.db)
+    vector_db = _vector_db(settings)
+
+    nb_documents = await write_batches(
+        path / documents_file_name,
+        document_snapshot_schema,
+        _document_batches(db, settings.indexer_version, batch_size),
+        lambda nb_rows: _log_progress(documents_file_name, nb_rows, nb_rows),
+    )
+
+    tables: dict[TableRole, SnapshotTable] = {}
+    for role, table in (await vector_db.open_pinned_tables()).items():
+        nb_rows = await table.count_rows()
+        await write_batches(
+            path / _table_file_name(role),
+            await table.schema(),
+            await table.query().to_batches(max_batch_length=batch_size),
+            lambda nb_rows_read: _log_progress(table.name, nb_rows_read, nb_rows),  # noqa: B023
+        )
+        tables[role] = SnapshotTable(table_name=table.name, lance_version=await table.version(), nb_rows=nb_rows)
+
+    manifest = SnapshotManifest(
+        format_version=snapshot_format_version,
+        indexer_version=settings.indexer_version,
+        stage_versions=settings.stage_versions,
+        chunks_fingerprint=chunks_fingerprint(settings),
+        creation_datetime=datetime.now(tz=dt.UTC),
+        nb_documents=nb_documents,
+        tables=tables,
+    )
+    (path / manifest_file_name).write_text(manifest.model_dump_json(indent=2), encoding="utf-8")
+    return manifest
+
+
+def read_manifest(path: pathlib.Path, settings: Settings) -> SnapshotManifest:
+    """Manifest of a complete snapshot that can be imported with the settings"""
+    manifest_path = path / manifest_file_name
+    if not manifest_path.exists():
+        error = f"{manifest_path} not found, the snapshot is incomplete"
+        raise SnapshotError(error)
+    manifest = SnapshotManifest.model_validate_json(manifest_path.read_text(encoding="utf-8"))
+    if manifest.format_version != snapshot_format_version:
+        error = f"snapshot format {manifest.format_version} is not supported (expected {snapshot_format_version})"
+        raise SnapshotError(error)
+    if manifest.indexer_version != settings.indexer_version or manifest.stage_versions != settings.stage_versions:
+        error = "the snapshot was exported with another indexer version or other stage versions"
+        raise SnapshotError(error)
+    if manifest.chunks_fingerprint != chunks_fingerprint(settings):
+        error = "the snapshot was exported with other chunker or embedding settings"
+        raise SnapshotError(error)
+    return manifest
+
+
+async def import_snapshot(settings: Settings, path: pathlib.Path) -> SnapshotManifest:
+    """Import a snapshot without computing anything: vector db tables first (rows of parsed docs already in the
+    tables are skipped), then db rows with COPY, in the batches of the export. It can be interrupted and run again."""
+    manifest = read_manifest(path, settings)
+    vector_db = _vector_db(settings)
+    db = DbService(settings.db)
+    await db.register_indexer_version(settings.indexer_version, vector_db.table_names())
+    for role, table in manifest.tables.items():
+        if role == "doc_vector" and not settings.lance_db.document_vectors:
+            continue
+        table_path = path / _table_file_name(role)
+        source_counts = await count_batch_rows_by_parsed_hash(read_batches(table_path))
+        if sum(source_counts.values()) != table.nb_rows:
+            error = f"{table_path} does not have the number of rows of the manifest, the snapshot is corrupted"
+            raise SnapshotError(error)
+        await vector_db.append_missing_documents(role, read_batches(table_path), source_counts, _log_progress)
+    await vector_db.finish_appends()
+
+    parser_version = settings.stage_versions.parser if settings.stage_versions else None
+    nb_documents = 0
+    async for batch in read_batches(path / documents_file_name):
+        documents = [DbBulkLoadedDocument(size=None, **row) for row in batch.to_pylist()]
+        await db.bulk_load_indexed_documents(documents, settings.indexer_version, parser_version)
+        nb_documents += len(documents)
+        _log_progress(documents_file_name, nb_documents, manifest.nb_documents)
+    return manifest
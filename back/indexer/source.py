@@ -1,14 +1,17 @@
+import pathlib
 from abc import abstractmethod
 from collections.abc import AsyncGenerator
 from datetime import datetime
 from io import BytesIO
 
+import filetype  # type: ignore[StubNotFound]
 from pydantic import BaseModel
 
 
 class SourceDocumentReference(BaseModel):
     uri: str
     source_version_id: str | None
+    size: int | None = None  # in bytes, if known without loading content
 
 
 class SourceUpsertEvent(BaseModel):
@@ -43,3 +46,17 @@ class Source:
 
     @abstractmethod
     async def get_document(self, uri: str) -> SourceDocument | None: ...
+
+    @abstractmethod
+    async def get_document_ref(self, uri: str) -> SourceDocumentReference | None:
+        """Current version of the document, without loading its content"""
+
+
+def guess_filetype(content: BytesIO, uri: str) -> str | None:
+    """File type from the content, or from the extension of the uri if unknown"""
+    kind: str | None = filetype.guess_extension(content.read(1024))  # type: ignore[Attribute]
+    content.seek(0)
+    if not kind:
+        kind_with_dot_or_empty = pathlib.Path(uri).suffix
+        kind = kind_with_dot_or_empty[1:] if kind_with_dot_or_empty else None
+    return kind
@@ -0,0 +1,62 @@
+import datetime as dt
+import hashlib
+import pathlib
+from collections.abc import AsyncGenerator
+from datetime import datetime
+from io import BytesIO
+
+from indexer.source import Source, SourceDocument, SourceDocumentReference, SourceEvent, guess_filetype
+
+
+def local_etag(content: bytes) -> str:
+    """etag of a single part upload of the content in MinIO / S3"""
+    return hashlib.md5(content, usedforsecurity=False).hexdigest()
+
+
+class LocalDirectorySource(Source):
+    """Local copy of the seemantic drive (uri: path relative to the directory), for the bulk import.
+    The source version of a document is the etag of its single part upload. It does not listen to changes."""
+
+    _root: pathlib.Path
+
+    def __init__(self, root: pathlib.Path) -> None:
+        self._root = root
+
+    async def all_doc_refs(self) -> list[SourceDocumentReference]:
+        # the source version requires the content, it is known once the document is loaded
+        return [
+            SourceDocumentReference(
+                uri=path.relative_to(self._root).as_posix(),
+                source_version_id=None,
+                size=path.stat().st_size,
+            )
+            for path in sorted(self._root.rglob("*"))
+            if path.is_file()
+        ]
+
+    async def listen(self) -> AsyncGenerator[SourceEvent, None]:
+        return
+        yield
+
+    async def get_document(self, uri: str) -> SourceDocument | None:
+        path = self._root / uri
+        if not path.is_file():
+            return None
+        content = path.read_bytes()
+        file = BytesIO(content)
+        return SourceDocument(
+            doc_ref=SourceDocumentReference(uri=uri, source_version_id=local_etag(content), size=len(content)),
+            content=file,
+            crawling_datetime=datetime.now(tz=dt.UTC),
+            filetype=guess_filetype(file, uri),
+        )
+
+    async def get_document_ref(self, uri: str) -> SourceDocumentReference | None:
+        path = self._root / uri
+        if not path.is_file():
+            return None
+        return SourceDocumentReference(
+            uri=uri,
+            source_version_id=local_etag(path.read_bytes()),
+            size=path.stat().st_size,
+        )
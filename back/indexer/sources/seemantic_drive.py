@@ -1,10 +1,7 @@
 import datetime as dt
-import pathlib
 from collections.abc import AsyncGenerator
 from datetime import datetime
 
-import filetype  # type: ignore[StubNotFound]
-
 from common.minio_service import DeleteMinioEvent, MinioObjectContent, MinioService
 from common.settings import MinioSettings
 from indexer.source import (
@@ -14,6 +11,7 @@ from indexer.source import (
     SourceDocumentReference,
     SourceEvent,
     SourceUpsertEvent,
+    guess_filetype,
 )
 
 
@@ -34,7 +32,11 @@ class SeemanticDriveSource(Source):
 
     async def all_doc_refs(self) -> list[SourceDocumentReference]:
         return [
-            SourceDocumentReference(uri=self._without_prefix(object_name=obj.key), source_version_id=obj.etag)
+            SourceDocumentReference(
+                uri=self._without_prefix(object_name=obj.key),
+                source_version_id=obj.etag,
+                size=obj.size,
+            )
             for obj in self._minio_service.get_all_documents(prefix=self.prefix)
         ]
 
@@ -48,6 +50,7 @@ class SeemanticDriveSource(Source):
                     doc_ref=SourceDocumentReference(
                         uri=self._without_prefix(event.object.key),
                         source_version_id=event.object.etag,
+                        size=event.object.size,
                     ),
                 )
 
@@ -59,17 +62,22 @@ class SeemanticDriveSource(Source):
             object_content.content.seek(0)
             # check that kind is a supported file type
             return SourceDocument(
-                doc_ref=SourceDocumentReference(uri=uri, source_version_id=object_content.object.etag),
+                doc_ref=SourceDocumentReference(
+                    uri=uri,
+                    source_version_id=object_content.object.etag,
+                    size=object_content.object.size,
+                ),
                 content=object_content.content,
                 crawling_datetime=datetime.now(tz=dt.UTC),
                 filetype=kind,
             )
         return None
 
+    async def get_document_ref(self, uri: str) -> SourceDocumentReference | None:
+        obj = self._minio_service.stat_document(object_name=self._with_prefix(uri))
+        if obj is None:
+            return None
+        return SourceDocumentReference(uri=uri, source_version_id=obj.etag, size=obj.size)
+
     def get_extension(self, object_content: MinioObjectContent, uri: str) -> str | None:
-        kind: str | None = filetype.guess_extension(object_content.content.read(1024))  # type: ignore[Attribute]
-        object_content.content.seek(0)
-        if not kind:
-            kind_with_dot_or_empty = pathlib.Path(uri).suffix
-            kind = kind_with_dot_or_empty[1:] if kind_with_dot_or_empty else None
-        return kind
+        return guess_filetype(object_content.content, uri)
@@ -1,15 +1,77 @@
+import asyncio
 import logging
+import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Final
 
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.app_services import (
+    get_db_service,
+    get_document_catalog,
+    get_generator_service,
+    get_minio_service,
+    get_search_engine,
+)
 from app.rest_api import router
+from app.settings import get_settings
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# an indexer version served within the retirement min idle time cannot be retired
+served_heartbeat_interval: Final[timedelta] = timedelta(minutes=1)
+
+
+async def mark_indexer_version_served() -> None:
+    settings = get_settings()
+    db = get_db_service(settings=settings)
+    while True:
+        try:
+            await db.mark_indexer_version_served(settings.indexer_version)
+        except Exception:
+            logger.exception("Error marking the indexer version as served")
+        await asyncio.sleep(served_heartbeat_interval.total_seconds())
+
+
+async def warm_up(app: FastAPI) -> None:
+    """Build the services and open their connections before the first requests (which would otherwise pay for it),
+    then mark the app as ready. Retried until it succeeds, requests are served meanwhile."""
+    settings = get_settings()
+    while True:
+        start = time.monotonic()
+        try:
+            db = get_db_service(settings=settings)
+            await db.warm_up()
+            await asyncio.to_thread(get_minio_service, settings=settings)  # checks the bucket, blocking
+            get_generator_service(settings=settings)
+            catalog = get_document_catalog(settings=settings, db=db)
+            search_engine = get_search_engine(settings=settings, db=db, catalog=catalog)
+            await search_engine.warm_up()
+        except Exception:
+            logger.exception("Error warming up, retrying in 5 seconds")
+            await asyncio.sleep(5)
+        else:
+            app.state.ready = True
+            logger.info(f"Warm-up done in {time.monotonic() - start:.1f}s, ready")
+            return
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    app.state.ready = False
+    heartbeat = asyncio.create_task(mark_indexer_version_served())
+    warm_up_task = asyncio.create_task(warm_up(app))
+    yield
+    warm_up_task.cancel()
+    heartbeat.cancel()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Manage CORS
 origins = [
@@ -0,0 +1,43 @@
+"""Offline import of all the documents of the seemantic drive (or of a local copy of it), for a new deployment or
+indexer version: much faster than the live indexer on large sources. Run it before starting the indexer, it can be
+interrupted and run again (resumed from the checkpoint file).
+
+Usage (from back/): python main_bulk_import.py [--local-dir PATH] [--checkpoint bulk_import.checkpoint]
+    [--batch-size 1000] [--nb-processes 4]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import pathlib
+
+from indexer.bulk_import import BulkImporter
+from indexer.settings import get_settings
+from indexer.source import Source
+from indexer.sources.local_directory import LocalDirectorySource
+from indexer.sources.seemantic_drive import SeemanticDriveSource
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+async def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument(
+        "--local-dir",
+        type=pathlib.Path,
+        help="local copy of the seemantic drive, read instead of downloading the documents",
+    )
+    arg_parser.add_argument("--checkpoint", type=pathlib.Path, default=pathlib.Path("bulk_import.checkpoint"))
+    arg_parser.add_argument("--batch-size", type=int, default=1000, help="documents per append / COPY")
+    arg_parser.add_argument("--nb-processes", type=int, default=os.cpu_count() or 1, help="parsing processes")
+    args = arg_parser.parse_args()
+
+    settings = get_settings()
+    source: Source = LocalDirectorySource(args.local_dir) if args.local_dir else SeemanticDriveSource(settings.minio)
+    importer = BulkImporter(settings, source, args.checkpoint, args.batch_size, args.nb_processes)
+    await importer.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Copy the chunks and vectors of a previous indexer version to the current one, instead of embedding them again.
+
+Only valid if the chunker, embedding and chunk table settings did not change (same chunks fingerprint). Run it with
+the settings of the new indexer version, before starting its indexer. It can be interrupted and run again.
+
+Usage (from back/): python main_migrate_embeddings.py --from-version 1 [--reuse-parsing] [--batch-size 10000]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from common.db_service import DbService
+from common.embedding_service import EmbeddingService
+from common.vector_db import VectorDB
+from indexer.settings import chunks_fingerprint, get_settings
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logging = logging.getLogger(__name__)
+
+
+def log_progress(table_name: str, nb_rows_read: int, nb_source_rows: int) -> None:
+    percent = 100 * nb_rows_read / max(1, nb_source_rows)
+    logging.info(f"{table_name}: {nb_rows_read}/{nb_source_rows} rows read ({percent:.0f}%)")
+
+
+async def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--from-version", type=int, required=True, help="indexer version to copy chunks from")
+    arg_parser.add_argument(
+        "--reuse-parsing",
+        action="store_true",
+        help="the parser did not change either: copy raw hash -> parsed hash so that documents are not parsed again",
+    )
+    arg_parser.add_argument("--batch-size", type=int, default=10_000, help="rows per arrow batch")
+    arg_parser.add_argument("--force", action="store_true", help="copy even if the source has no fingerprint")
+    args = arg_parser.parse_args()
+
+    settings = get_settings()
+    fingerprint = chunks_fingerprint(settings)
+    distance_metric = EmbeddingService(settings.embedding, settings.embedding__litellm_api_key).distance_metric()
+    target = VectorDB(
+        settings.lance_db,
+        distance_metric,
+        settings.indexer_version,
+        settings.embedding.dimensions,
+        settings.stage_versions,
+        fingerprint,
+    )
+    # tables of the source version are named after its indexer version (no stage versions)
+    source = VectorDB(settings.lance_db, distance_metric, args.from_version, settings.embedding.dimensions)
+
+    source_fingerprint = await source.get_chunks_fingerprint()
+    if source_fingerprint is None and not args.force:
+        logging.error(f"{source.chunk_table_name} has no fingerprint, use --force if its settings are the same")
+        sys.exit(1)
+    if source_fingerprint is not None and source_fingerprint != fingerprint:
+        logging.error(f"{source.chunk_table_name} was produced with other chunker or embedding settings")
+        sys.exit(1)
+
+    db = DbService(settings.db)
+    await db.register_indexer_version(settings.indexer_version, target.table_names())
+    logging.info(f"Copying {source.chunk_table_name} to {target.chunk_table_name}")
+    nb_chunks = await target.copy_missing_documents_from(source, args.batch_size, log_progress)
+    logging.info(f"{nb_chunks} chunks copied")
+
+    if args.reuse_parsing:
+        nb_contents = await db.copy_indexed_contents(args.from_version, settings.indexer_version)
+        logging.info(f"{nb_contents} indexed contents copied")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
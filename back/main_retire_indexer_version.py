@@ -0,0 +1,62 @@
+"""Retire an indexer version once the app serves a newer one: drop its partitions of indexed_document and
+indexed_content (metadata only, whatever their size), then delete its Lance tables that no other version uses.
+
+The version must not have been served by an app for --min-idle-hours (apps mark the version they serve every minute),
+and no indexer must be indexing its documents. Run it with the settings of the current indexer version. A version never
+served or newer than the current one is only retired with --force (e.g. an abandoned version).
+
+Usage (from back/): python main_retire_indexer_version.py --version 1 [--min-idle-hours 24] [--force]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import timedelta
+
+from common.db_service import DbService, IndexerVersionInUseError, IndexerVersionNotRegisteredError
+from common.vector_db import drop_tables
+from indexer.settings import get_settings
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logging = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--version", type=int, required=True, help="indexer version to retire")
+    arg_parser.add_argument("--min-idle-hours", type=float, default=24, help="time since the version was last served")
+    arg_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="retire the version even if it was never served or is newer than the current one",
+    )
+    args = arg_parser.parse_args()
+
+    settings = get_settings()
+    if args.version == settings.indexer_version:
+        logging.error(f"{args.version} is the indexer version of the current settings")
+        sys.exit(1)
+
+    db = DbService(settings.db)
+    try:
+        lance_tables = await db.retire_indexer_version(
+            args.version,
+            timedelta(hours=args.min_idle_hours),
+            settings.indexer_version,
+            force=args.force,
+        )
+    except IndexerVersionNotRegisteredError:
+        logging.error(f"Indexer version {args.version} is not registered")  # noqa: TRY400
+        sys.exit(1)
+    except IndexerVersionInUseError as e:
+        logging.error(f"Cannot retire indexer version {args.version}: {e}")  # noqa: TRY400
+        sys.exit(1)
+    logging.info(f"Partitions of indexer version {args.version} dropped, deleting lance tables {lance_tables}")
+    # the db no longer references the tables: an interrupted deletion can be completed by running it again manually
+    await drop_tables(settings.lance_db, lance_tables)
+    logging.info(f"Indexer version {args.version} retired")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
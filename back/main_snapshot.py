@@ -0,0 +1,49 @@
+"""Export the indexed documents of the current indexer version with their chunks and vectors, or import them on a new
+node instead of indexing its source again.
+
+The snapshot is a directory of Arrow IPC streams and a manifest. Export does not block a running indexer. Import
+requires the same indexer version, stage versions, chunker and embedding settings. It can be interrupted and run again.
+
+Usage (from back/):
+    python main_snapshot.py export --output /path/to/snapshot [--batch-size 10000]
+    python main_snapshot.py import --input /path/to/snapshot
+"""
+
+import argparse
+import asyncio
+import logging
+import pathlib
+import sys
+
+from indexer.settings import get_settings
+from indexer.snapshot import SnapshotError, export_snapshot, import_snapshot
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logging = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="export a snapshot in a new directory")
+    export_parser.add_argument("--output", type=pathlib.Path, required=True, help="directory to create")
+    export_parser.add_argument("--batch-size", type=int, default=10_000, help="rows per arrow batch")
+    import_parser = commands.add_parser("import", help="import a snapshot")
+    import_parser.add_argument("--input", type=pathlib.Path, required=True, help="snapshot directory")
+    args = arg_parser.parse_args()
+
+    settings = get_settings()
+    if args.command == "export":
+        manifest = await export_snapshot(settings, args.output, args.batch_size)
+        logging.info(f"{manifest.nb_documents} documents exported to {args.output}")
+    else:
+        try:
+            manifest = await import_snapshot(settings, args.input)
+        except SnapshotError as e:
+            logging.error(f"Cannot import {args.input}: {e}")  # noqa: TRY400
+            sys.exit(1)
+        logging.info(f"{manifest.nb_documents} documents imported from {args.input}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
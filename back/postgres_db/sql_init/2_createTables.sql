@@ -6,13 +6,55 @@
 CREATE TYPE document_status AS ENUM ('pending', 'indexing', 'indexing_success', 'indexing_error');
 
 
+-- indexer versions: their rows of indexed_content and indexed_document are stored in dedicated partitions, created
+-- when the version is registered (indexer startup, imports) and dropped in O(1) when it is retired
+CREATE TABLE seemantic_schema.indexer_version(
+   indexer_version SMALLINT PRIMARY KEY,
+   lance_tables TEXT[] NOT NULL, -- lance datasets of the version, that can be shared with other versions (stage versions)
+   last_served TIMESTAMPTZ, -- heartbeat of the apps serving this version, a served version cannot be retired
+   retirement_datetime TIMESTAMPTZ,
+   creation_datetime TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+
+-- indexed_content and indexed_document are partitioned by indexer version: primary keys include it
 CREATE TABLE seemantic_schema.indexed_content(
-   id UUID PRIMARY KEY,
+   id UUID NOT NULL,
    raw_hash CHAR(32) NOT NULL, -- source independant hash of the raw content
    parsed_hash CHAR(32) NOT NULL, -- hash of the parsed content
    indexer_version SMALLINT NOT NULL,
+   -- indexed contents referenced by no indexed document are deleted by the indexer garbage collector after a grace period
+   -- (reset when an indexing reuses the indexed content)
+   creation_datetime TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP NOT NULL,
 
+   PRIMARY KEY (id, indexer_version),
    UNIQUE (raw_hash, indexer_version)
+) PARTITION BY LIST (indexer_version);
+
+
+-- parsed content of a raw content per parser version (cf. stage versions): indexer versions sharing
+-- a parser version reuse it instead of parsing again
+CREATE TABLE seemantic_schema.parsed_content(
+   id UUID PRIMARY KEY,
+   raw_hash CHAR(32) NOT NULL, -- source independant hash of the raw content
+   parser_version SMALLINT NOT NULL,
+   parsed_hash CHAR(32) NOT NULL, -- hash of the parsed content, stored in lance parsed doc table of the parser version
+
+   UNIQUE (raw_hash, parser_version)
+);
+
+
+-- raw hash of the source objects already downloaded, by (etag, size): objects copied, moved or uploaded again
+-- with the same content resolve to their indexed content without being downloaded.
+-- Multipart etags depend on the part size: the same content uploaded in other parts is downloaded and hashed
+-- again, and its etag added here.
+CREATE TABLE seemantic_schema.source_object_content(
+   id UUID PRIMARY KEY,
+   etag TEXT NOT NULL,
+   size BIGINT NOT NULL, -- in bytes
+   raw_hash CHAR(32) NOT NULL, -- source independant hash of the raw content
+
+   UNIQUE (etag, size)
 );
 
 
@@ -24,27 +66,46 @@ CREATE TABLE seemantic_schema.document(
 
 
 CREATE TABLE seemantic_schema.indexed_document(
-   id UUID PRIMARY KEY,
+   id UUID NOT NULL,
    document_id UUID REFERENCES seemantic_schema.document(id) ON DELETE CASCADE NOT NULL,
    uri TEXT NOT NULL, -- Document URI, denormalized from document.uri to avoid joins
    indexer_version SMALLINT NOT NULL,
    indexed_source_version TEXT, -- info that can be retreived from source without loading content (last update timestamp, hash, version id...)
-   indexed_content_id UUID REFERENCES seemantic_schema.indexed_content(id), -- set when status is indexing_success
+   indexed_content_id UUID, -- set when status is indexing_success, indexed content of the same indexer version
    last_indexing TIMESTAMPTZ, -- set when indexed_content_id is updated
    status document_status NOT NULL,
    last_status_change TIMESTAMPTZ NOT NULL,
    error_status_message TEXT, -- set when status is Error
    creation_datetime TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP NOT NULL,
 
+   -- indexing queue: pending documents are claimed by indexer workers (FOR UPDATE SKIP LOCKED),
+   -- a worker holds a lease on a document while indexing it and renews it with heartbeats.
+   -- Documents whose lease expired (crashed worker) are claimed again, up to a max number of attempts.
+   source_version_to_index TEXT, -- source version when the document was enqueued
+   -- documents are claimed by due time: enqueue time + delay depending on priority (live event or reconciliation)
+   -- and estimated cost (size, file type). Old enqueued documents get ahead of new ones, so nothing starves.
+   indexing_due TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP NOT NULL,
+   lease_owner TEXT, -- id of the worker indexing the document
+   lease_expiration TIMESTAMPTZ,
+   indexing_attempts SMALLINT DEFAULT 0 NOT NULL,
+
    -- fields copy-pasted from indexed_content
    raw_hash_if_indexed CHAR(32), -- source independant hash of the raw content
    parsed_hash_if_indexed CHAR(32), -- hash of the parsed content
 
+   PRIMARY KEY (id, indexer_version),
+   FOREIGN KEY (indexed_content_id, indexer_version)
+   REFERENCES seemantic_schema.indexed_content(id, indexer_version),
    UNIQUE (document_id, indexer_version)
-);
+) PARTITION BY LIST (indexer_version);
 
 
 CREATE INDEX idx_document_uri ON seemantic_schema.document (uri);
+-- explorer keyset pagination
+CREATE INDEX idx_indexed_document_indexer_version_uri ON seemantic_schema.indexed_document (indexer_version, uri);
+-- claimable documents of an indexer version, partial so that it only contains the (small) backlog
+CREATE INDEX idx_indexed_document_to_index ON seemantic_schema.indexed_document (indexer_version, indexing_due)
+WHERE status IN ('pending', 'indexing');
 CREATE INDEX idx_indexed_document_indexed_content_id ON seemantic_schema.indexed_document (indexed_content_id);
 CREATE INDEX idx_indexed_content_parsed_hash ON seemantic_schema.indexed_content (parsed_hash);
 
@@ -61,6 +122,59 @@ CHECK (
 );
 
 
+-- Partitions of an indexer version
+-- The tables are owned by the admin user: partitions are managed by these SECURITY DEFINER functions, that the
+-- back user can execute. Concurrent calls (indexer replicas starting together) are serialized by an advisory lock.
+
+CREATE OR REPLACE FUNCTION seemantic_schema.register_indexer_version(version SMALLINT, lance_tables TEXT[])
+RETURNS VOID
+SECURITY DEFINER
+SET search_path = seemantic_schema, pg_temp
+AS $$
+BEGIN
+   PERFORM pg_advisory_xact_lock(hashtext('seemantic_schema.indexer_version'));
+   EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS seemantic_schema.%I PARTITION OF seemantic_schema.indexed_content FOR VALUES IN (%s)',
+      'indexed_content_v' || version, version
+   );
+   EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS seemantic_schema.%I PARTITION OF seemantic_schema.indexed_document FOR VALUES IN (%s)',
+      'indexed_document_v' || version, version
+   );
+   INSERT INTO seemantic_schema.indexer_version(indexer_version, lance_tables)
+   VALUES (version, register_indexer_version.lance_tables)
+   ON CONFLICT (indexer_version) DO UPDATE SET lance_tables = EXCLUDED.lance_tables, retirement_datetime = NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- detach and drop the partitions of the version: metadata only, whatever their size. Document changes are not
+-- notified (no row trigger). A short lock timeout, so that waiting for the lock on parents does not block queries.
+CREATE OR REPLACE FUNCTION seemantic_schema.drop_indexer_version_partitions(version SMALLINT)
+RETURNS VOID
+SECURITY DEFINER
+SET search_path = seemantic_schema, pg_temp
+SET lock_timeout = '10s'
+AS $$
+DECLARE
+   table_name TEXT;
+BEGIN
+   PERFORM pg_advisory_xact_lock(hashtext('seemantic_schema.indexer_version'));
+   -- indexed_document first, as it references indexed_content
+   FOREACH table_name IN ARRAY ARRAY['indexed_document', 'indexed_content'] LOOP
+      IF to_regclass(format('seemantic_schema.%I', table_name || '_v' || version)) IS NOT NULL THEN
+         EXECUTE format(
+            'ALTER TABLE seemantic_schema.%I DETACH PARTITION seemantic_schema.%I',
+            table_name, table_name || '_v' || version
+         );
+         EXECUTE format('DROP TABLE seemantic_schema.%I', table_name || '_v' || version);
+      END IF;
+   END LOOP;
+   DELETE FROM seemantic_schema.indexed_document_change WHERE indexer_version = version;
+   UPDATE seemantic_schema.indexer_version SET retirement_datetime = CURRENT_TIMESTAMP WHERE indexer_version = version;
+END;
+$$ LANGUAGE plpgsql;
+
+
 CREATE OR REPLACE FUNCTION update_indexed_document_uri()
 RETURNS TRIGGER AS $$
 BEGIN
@@ -81,22 +195,47 @@ EXECUTE FUNCTION update_indexed_document_uri();
 
 
 -- Notify table changes
+-- Each change of indexed_document is appended to indexed_document_change, and notified with a compact payload
+-- (seq, id, operation): listeners batch-fetch the changed rows by id, and resume from the last seq they processed.
+-- seqs are allocated before commit: a change can become visible before a change with a lower seq (or the lower seq
+-- be rolled back). xid_horizon is the xmax of a snapshot taken once the seq is allocated: the transactions that
+-- allocated lower seqs had their xid already, below xid_horizon. Once the oldest running transaction (xmin of a
+-- snapshot) is not below xid_horizon, every lower seq is either visible or rolled back (cf.
+-- DbService.get_last_document_change_seq).
+-- Writers of indexed_document are READ COMMITTED, each statement of the trigger takes a new snapshot.
+
+CREATE TABLE seemantic_schema.indexed_document_change(
+   seq BIGSERIAL PRIMARY KEY,
+   indexed_document_id UUID NOT NULL,
+   indexer_version SMALLINT NOT NULL,
+   uri TEXT NOT NULL, -- kept to resolve deletes once the row is gone
+   operation TEXT NOT NULL, -- INSERT, UPDATE or DELETE
+   change_datetime TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP NOT NULL,
+   xid_horizon XID8 NOT NULL
+);
+
+CREATE INDEX idx_indexed_document_change_change_datetime ON seemantic_schema.indexed_document_change (change_datetime);
 
 CREATE OR REPLACE FUNCTION notify_table_changes()
 RETURNS TRIGGER AS $$
 DECLARE
-   operation TEXT;
-   row_data JSON;
-   table_name TEXT;
+   changed_row seemantic_schema.indexed_document%ROWTYPE;
+   change_seq BIGINT;
 BEGIN
-   table_name := TG_TABLE_NAME;
-   operation := TG_OP;
-   IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
-      row_data := to_json(NEW);
-   ELSIF TG_OP = 'DELETE' THEN
-      row_data := to_json(OLD);
+   IF TG_OP = 'DELETE' THEN
+      changed_row := OLD;
+   ELSE
+      changed_row := NEW;
    END IF;
-   PERFORM pg_notify('table_changes', json_build_object('table', table_name, 'operation', operation, 'data', row_data)::TEXT);
+   change_seq := nextval('seemantic_schema.indexed_document_change_seq_seq');
+   -- new statement, new snapshot: taken after the seq allocation
+   INSERT INTO seemantic_schema.indexed_document_change(
+      seq, indexed_document_id, indexer_version, uri, operation, xid_horizon
+   ) VALUES (
+      change_seq, changed_row.id, changed_row.indexer_version, changed_row.uri, TG_OP,
+      pg_snapshot_xmax(pg_current_snapshot())
+   );
+   PERFORM pg_notify('table_changes', json_build_object('seq', change_seq, 'id', changed_row.id, 'operation', TG_OP)::TEXT);
    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
@@ -164,4 +303,3 @@ CREATE TRIGGER trg_sync_parsed_hash_to_indexed_document
 AFTER UPDATE OF parsed_hash ON seemantic_schema.indexed_content
 FOR EACH ROW
 EXECUTE FUNCTION sync_parsed_hash_to_indexed_document();
-
@@ -0,0 +1,332 @@
+# pyright: strict, reportMissingTypeStubs=false
+import asyncio
+from collections.abc import AsyncGenerator
+from datetime import timedelta
+from pathlib import Path
+from typing import Literal
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import text
+from testcontainers.postgres import PostgresContainer
+
+from common.db_service import (
+    DbBulkLoadedDocument,
+    DbIndexedContent,
+    DbIndexingRequest,
+    DbService,
+    DbSettings,
+    IndexerVersionInUseError,
+    IndexerVersionNotRegisteredError,
+    TableIndexedDocumentStatusEnum,
+)
+
+
+@pytest.fixture(scope="module")
+def anyio_backend() -> Literal["asyncio"]:
+    return "asyncio"
+
+
+@pytest.fixture(scope="module")
+async def db_service(anyio_backend: Literal["asyncio"]) -> AsyncGenerator[DbService, None]:
+    postgres = PostgresContainer("postgres:17", driver="asyncpg")
+    sql_init_folder = str(Path(__file__).resolve().parent.parent.parent / "postgres_db/sql_init/")
+    postgres.with_volume_mapping(sql_init_folder, "/docker-entrypoint-initdb.d/")
+    postgres.start()
+    try:
+        yield DbService(
+            DbSettings(
+                username=postgres.username,
+                password=postgres.password,
+                host="localhost",
+                port=postgres.get_exposed_port(postgres.port),
+                database=postgres.dbname,
+            ),
+        )
+    finally:
+        postgres.stop()
+
+
+@pytest.mark.anyio
+async def test_last_change_seq_stops_before_uncommitted_change(db_service: DbService) -> None:
+    await db_service.register_indexer_version(1, [])
+    await db_service.create_indexed_documents([DbIndexingRequest(uri="seq/a", source_version=None)], 1)
+    last_seq = await db_service.get_last_document_change_seq()
+
+    async with db_service.session_factory() as session, session.begin():
+        # the change of a is allocated a seq, but not committed yet
+        await session.execute(
+            text("UPDATE seemantic_schema.indexed_document SET status = 'indexing' WHERE uri = 'seq/a'"),
+        )
+        # the change of b, with a higher seq, is committed first
+        await db_service.create_indexed_documents([DbIndexingRequest(uri="seq/b", source_version=None)], 1)
+        assert await db_service.get_last_document_change_seq() == last_seq
+        _, fetched_seqs = await db_service.get_document_changes(last_seq, until_seq=last_seq)
+        assert fetched_seqs == []
+
+    # both changes are returned once a is committed
+    committed_seq = await db_service.get_last_document_change_seq()
+    events, _ = await db_service.get_document_changes(last_seq, until_seq=committed_seq)
+    assert {event.uri for event in events} == {"seq/a", "seq/b"}
+
+    # a rolled back change is skipped once its transaction ended, however long it lasted
+    async with db_service.session_factory() as session:
+        await session.execute(
+            text("UPDATE seemantic_schema.indexed_document SET status = 'pending' WHERE uri = 'seq/a'"),
+        )
+        await asyncio.sleep(1)
+        await db_service.create_indexed_documents([DbIndexingRequest(uri="seq/c", source_version=None)], 1)
+        assert await db_service.get_last_document_change_seq() == committed_seq
+        await session.rollback()
+    last_seq = await db_service.get_last_document_change_seq()
+    events, _ = await db_service.get_document_changes(committed_seq, until_seq=last_seq)
+    assert [event.uri for event in events] == ["seq/c"]
+
+
+@pytest.mark.anyio
+async def test_bulk_load_indexed_documents(db_service: DbService) -> None:
+    await db_service.register_indexer_version(2, [])
+    await db_service.create_indexed_documents([DbIndexingRequest(uri="bulk/c", source_version=None)], 2)
+    await db_service.bulk_load_indexed_documents(
+        [
+            DbBulkLoadedDocument(uri="bulk/a", source_version="etag-a", size=10, raw_hash="raw-ab", parsed_hash="p-ab"),
+            # same content as a
+            DbBulkLoadedDocument(uri="bulk/b", source_version="etag-b", size=10, raw_hash="raw-ab", parsed_hash="p-ab"),
+            # overwrites the pending document
+            DbBulkLoadedDocument(uri="bulk/c", source_version="etag-c", size=None, raw_hash="raw-c", parsed_hash="p-c"),
+        ],
+        2,
+        parser_version=1,
+    )
+    # loaded again: no duplicate content
+    await db_service.bulk_load_indexed_documents(
+        [DbBulkLoadedDocument(uri="bulk/a", source_version="etag-a", size=10, raw_hash="raw-ab", parsed_hash="p-ab")],
+        2,
+        parser_version=1,
+    )
+
+    documents = {document.uri: document for document in await db_service.get_all_documents(2)}
+    assert documents.keys() == {"bulk/a", "bulk/b", "bulk/c"}
+    for uri, parsed_hash in [("bulk/a", "p-ab"), ("bulk/b", "p-ab"), ("bulk/c", "p-c")]:
+        assert documents[uri].status.status == TableIndexedDocumentStatusEnum.indexing_success
+        assert documents[uri].indexed_content is not None
+        assert documents[uri].indexed_content.parsed_hash == parsed_hash
+    assert documents["bulk/c"].indexed_source_version == "etag-c"
+    assert await db_service.get_raw_hash_if_known("etag-a", 10) == "raw-ab"
+    assert await db_service.get_raw_hash_if_known("etag-c", 0) is None
+    assert await db_service.get_parsed_hash_if_exists("raw-c", 1) == "p-c"
+
+
+@pytest.mark.anyio
+async def test_indexed_content_upsert_waits_for_garbage_collection(db_service: DbService) -> None:
+    await db_service.register_indexer_version(1, [])
+    async with db_service.lock_unreferenced_parsed_hashes(["p-gc"]) as unreferenced:
+        assert unreferenced == ["p-gc"]
+        # an indexing reusing the parsed doc being deleted waits for the deletion
+        upsert = asyncio.create_task(db_service.upsert_indexed_content("raw-gc", "p-gc", 1))
+        await asyncio.sleep(0.5)
+        assert not upsert.done()
+    content_id = await upsert
+
+    # then the parsed doc is referenced: not deleted anymore
+    async with db_service.lock_unreferenced_parsed_hashes(["p-gc"]) as unreferenced:
+        assert unreferenced == []
+    # reused contents are touched, so that they are not pruned before being referenced
+    assert await db_service.upsert_indexed_content("raw-gc", "p-gc", 1) == content_id
+    assert await db_service.prune_unreferenced_indexed_contents(timedelta(minutes=1), 10) == 0
+    touched = await db_service.touch_indexed_content("raw-gc", 1)
+    assert touched is not None
+    assert touched[0] == content_id
+
+
+@pytest.mark.anyio
+async def test_retire_indexer_version(db_service: DbService) -> None:
+    await db_service.register_indexer_version(5, ["chunk_v5", "parsed_doc_shared"])
+    await db_service.register_indexer_version(6, ["chunk_v6", "parsed_doc_shared"])
+    await db_service.create_indexed_documents([DbIndexingRequest(uri="retire/a", source_version=None)], 5)
+    await db_service.bulk_load_indexed_documents(
+        [DbBulkLoadedDocument(uri="retire/b", source_version="etag-b", size=1, raw_hash="raw-r", parsed_hash="p-r")],
+        5,
+    )
+
+    with pytest.raises(IndexerVersionNotRegisteredError):
+        await db_service.retire_indexer_version(7, timedelta(0), current_version=6)
+    # never served: still being indexed, or abandoned
+    with pytest.raises(IndexerVersionInUseError, match="never served"):
+        await db_service.retire_indexer_version(5, timedelta(0), current_version=6)
+    await db_service.mark_indexer_version_served(5)
+    with pytest.raises(IndexerVersionInUseError, match="served at"):
+        await db_service.retire_indexer_version(5, timedelta(hours=1), current_version=6)
+    await db_service.mark_indexer_version_served(6)
+    with pytest.raises(IndexerVersionInUseError, match="newer"):
+        await db_service.retire_indexer_version(6, timedelta(0), current_version=5)
+
+    assert await db_service.retire_indexer_version(5, timedelta(0), current_version=6) == ["chunk_v5"]
+    assert await db_service.get_all_documents(5) == []
+    retired = {version.indexer_version: version for version in await db_service.get_indexer_versions()}
+    assert retired[5].retirement_datetime is not None
+    assert retired[6].retirement_datetime is None
+    # retired again to complete an interrupted deletion of the lance tables
+    assert await db_service.retire_indexer_version(5, timedelta(hours=1), current_version=6) == ["chunk_v5"]
+
+    # forced: an abandoned version, never served
+    await db_service.register_indexer_version(8, ["chunk_v8"])
+    assert await db_service.retire_indexer_version(8, timedelta(0), current_version=6, force=True) == ["chunk_v8"]
+
+
+@pytest.mark.anyio
+async def test_enqueue_existing_document(db_service: DbService) -> None:
+    await db_service.register_indexer_version(1, [])
+    ids = await db_service.create_indexed_documents([DbIndexingRequest(uri="enqueue/a", source_version="v1")], 1)
+    claimed = await db_service.claim_documents_to_index(1, "enqueue-worker", timedelta(minutes=1), 1000, 3)
+    assert ids["enqueue/a"] in {document.indexed_document_id for document in claimed}
+
+    # edited while being indexed: enqueued again at the new source version, the ongoing indexing loses its lease
+    await db_service.enqueue_indexed_documents(
+        {ids["enqueue/a"]: DbIndexingRequest(uri="enqueue/a", source_version="v2")},
+        1,
+    )
+    documents = {document.uri: document for document in await db_service.get_all_documents(1)}
+    assert documents["enqueue/a"].status.status == TableIndexedDocumentStatusEnum.pending
+    assert documents["enqueue/a"].source_version_to_index == "v2"
+    assert not await db_service.mark_indexing_success(ids["enqueue/a"], 1, "v1", uuid4(), "enqueue-worker")
+
+
+@pytest.mark.anyio
+async def test_concurrent_claims_skip_locked_documents(db_service: DbService) -> None:
+    await db_service.register_indexer_version(10, [])
+    ids = await db_service.create_indexed_documents(
+        [DbIndexingRequest(uri=f"claim/{i}", source_version=None) for i in range(20)],
+        10,
+    )
+
+    async with db_service.session_factory() as session, session.begin():
+        # rows locked by another transaction are skipped, not waited for
+        await session.execute(
+            text("SELECT id FROM seemantic_schema.indexed_document WHERE uri = 'claim/0' FOR UPDATE"),
+        )
+        claimed = await asyncio.wait_for(
+            asyncio.gather(
+                db_service.claim_documents_to_index(10, "claimer-a", timedelta(minutes=1), 10, 3),
+                db_service.claim_documents_to_index(10, "claimer-b", timedelta(minutes=1), 10, 3),
+            ),
+            timeout=5,
+        )
+    claimed_ids = [[document.indexed_document_id for document in documents] for documents in claimed]
+    # no document claimed twice
+    assert not set(claimed_ids[0]) & set(claimed_ids[1])
+    assert set(claimed_ids[0]) | set(claimed_ids[1]) == set(ids.values()) - {ids["claim/0"]}
+
+    # the skipped document is claimed once unlocked, the others are leased
+    claimed_after_unlock = await db_service.claim_documents_to_index(10, "claimer-a", timedelta(minutes=1), 10, 3)
+    assert [document.indexed_document_id for document in claimed_after_unlock] == [ids["claim/0"]]
+
+
+@pytest.mark.anyio
+async def test_expired_lease_is_claimed_again(db_service: DbService) -> None:
+    await db_service.register_indexer_version(11, [])
+    ids = await db_service.create_indexed_documents([DbIndexingRequest(uri="lease/a", source_version="v1")], 11)
+    assert len(await db_service.claim_documents_to_index(11, "dead-worker", timedelta(milliseconds=1), 10, 3)) == 1
+    await asyncio.sleep(0.1)
+
+    # the worker died: its lease expired, another worker claims the document
+    claimed = await db_service.claim_documents_to_index(11, "live-worker", timedelta(minutes=1), 10, 3)
+    assert [document.indexed_document_id for document in claimed] == [ids["lease/a"]]
+    assert claimed[0].status.status == TableIndexedDocumentStatusEnum.indexing
+
+    # the result of the worker which lost its lease is discarded
+    content_id = await db_service.upsert_indexed_content("raw-lease", "p-lease", 11)
+    assert not await db_service.mark_indexing_success(ids["lease/a"], 11, "v1", content_id, "dead-worker")
+    await db_service.mark_indexing_error(ids["lease/a"], 11, "error of the dead worker", "dead-worker")
+    documents = await db_service.get_all_documents(11)
+    assert documents[0].status.status == TableIndexedDocumentStatusEnum.indexing
+    assert await db_service.mark_indexing_success(ids["lease/a"], 11, "v1", content_id, "live-worker")
+    documents = await db_service.get_all_documents(11)
+    assert documents[0].status.status == TableIndexedDocumentStatusEnum.indexing_success
+    assert documents[0].indexed_content is not None
+    assert documents[0].indexed_content.parsed_hash == "p-lease"
+
+
+@pytest.mark.anyio
+async def test_renewed_lease_is_not_claimed(db_service: DbService) -> None:
+    await db_service.register_indexer_version(12, [])
+    ids = await db_service.create_indexed_documents([DbIndexingRequest(uri="renew/a", source_version=None)], 12)
+    assert len(await db_service.claim_documents_to_index(12, "worker-a", timedelta(seconds=1), 10, 3)) == 1
+
+    # renewed by its owner only
+    await db_service.renew_leases([ids["renew/a"]], "worker-b", timedelta(milliseconds=1))
+    await db_service.renew_leases([ids["renew/a"]], "worker-a", timedelta(minutes=1))
+    await asyncio.sleep(1.5)
+    assert await db_service.claim_documents_to_index(12, "worker-b", timedelta(minutes=1), 10, 3) == []
+
+
+@pytest.mark.anyio
+async def test_fail_abandoned_documents(db_service: DbService) -> None:
+    await db_service.register_indexer_version(13, [])
+    await db_service.create_indexed_documents([DbIndexingRequest(uri="abandoned/a", source_version=None)], 13)
+    # crashes every worker claiming it
+    for worker in ["worker-a", "worker-b"]:
+        assert len(await db_service.claim_documents_to_index(13, worker, timedelta(milliseconds=1), 10, 2)) == 1
+        await asyncio.sleep(0.1)
+    assert await db_service.claim_documents_to_index(13, "worker-c", timedelta(minutes=1), 10, 2) == []
+
+    await db_service.fail_abandoned_documents(13, 2)
+    documents = await db_service.get_all_documents(13)
+    assert documents[0].status.status == TableIndexedDocumentStatusEnum.indexing_error
+    assert documents[0].status.error_status_message == "Indexing aborted after 2 attempts"
+    assert await db_service.claim_documents_to_index(13, "worker-c", timedelta(minutes=1), 10, 2) == []
+
+
+@pytest.mark.anyio
+async def test_fast_path_state_transitions(db_service: DbService) -> None:
+    await db_service.register_indexer_version(14, [])
+    ids = await db_service.create_indexed_documents([DbIndexingRequest(uri="fast/a", source_version="v1")], 14)
+    doc_id = ids["fast/a"]
+
+    async def lease() -> tuple[str | None, int]:
+        async with db_service.session_factory() as session:
+            result = await session.execute(
+                text(
+                    "SELECT lease_owner, indexing_attempts FROM seemantic_schema.indexed_document "
+                    "WHERE id = :id AND indexer_version = 14",
+                ),
+                {"id": doc_id},
+            )
+            lease_owner, indexing_attempts = result.one()
+            return lease_owner, indexing_attempts
+
+    async def changed_status_since(seq: int) -> TableIndexedDocumentStatusEnum:
+        # each transition is published in the change feed
+        events, _ = await db_service.get_document_changes(seq, indexer_version=14)
+        assert [event.uri for event in events] == ["fast/a"]
+        assert events[0].document is not None
+        return events[0].document.status.status
+
+    seq = await db_service.get_last_document_change_seq()
+    claimed = await db_service.claim_documents_to_index(14, "fast-worker", timedelta(minutes=1), 10, 3)
+    assert [document.indexed_document_id for document in claimed] == [doc_id]
+    assert claimed[0].status.status == TableIndexedDocumentStatusEnum.indexing
+    assert await lease() == ("fast-worker", 1)
+    assert await changed_status_since(seq) == TableIndexedDocumentStatusEnum.indexing
+
+    seq = await db_service.get_last_document_change_seq()
+    await db_service.mark_indexing_error(doc_id, 14, "parsing error", "fast-worker")
+    documents = await db_service.get_all_documents(14)
+    assert documents[0].status.status == TableIndexedDocumentStatusEnum.indexing_error
+    assert documents[0].status.error_status_message == "parsing error"
+    assert await lease() == (None, 1)
+    assert await changed_status_since(seq) == TableIndexedDocumentStatusEnum.indexing_error
+
+    await db_service.enqueue_indexed_documents({doc_id: DbIndexingRequest(uri="fast/a", source_version="v2")}, 14)
+    assert len(await db_service.claim_documents_to_index(14, "fast-worker", timedelta(minutes=1), 10, 3)) == 1
+    content_id = await db_service.upsert_indexed_content("raw-fast", "p-fast", 14)
+    seq = await db_service.get_last_document_change_seq()
+    assert await db_service.mark_indexing_success(doc_id, 14, "v2", content_id, "fast-worker")
+    documents = await db_service.get_all_documents(14)
+    assert documents[0].status.status == TableIndexedDocumentStatusEnum.indexing_success
+    assert documents[0].status.error_status_message is None
+    assert documents[0].indexed_source_version == "v2"
+    assert documents[0].last_indexing is not None
+    assert documents[0].indexed_content == DbIndexedContent(raw_hash="raw-fast", parsed_hash="p-fast")
+    assert await lease() == (None, 1)
+    assert await changed_status_since(seq) == TableIndexedDocumentStatusEnum.indexing_success
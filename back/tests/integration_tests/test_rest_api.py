@@ -18,6 +18,7 @@ from app.rest_api_data import (
     ApiQuery,
     ApiQueryMessage,
     ApiQueryResponseUpdate,
+    ApiResync,
     ApiSearchResult,
 )
 from app.settings import Settings as AppSettings
@@ -123,7 +124,7 @@ async def get_explorer(client: AsyncClient) -> list[ApiDocumentSnippet]:
     return explorer.documents
 
 
-DocEvent = tuple[ApiEventType | Literal["keep_alive"], ApiDocumentSnippet | ApiDocumentDelete | None]
+DocEvent = tuple[ApiEventType | Literal["keep_alive"], ApiDocumentSnippet | ApiDocumentDelete | ApiResync | None]
 
 
 def parse_event(event: str) -> DocEvent:
@@ -134,6 +135,8 @@ def parse_event(event: str) -> DocEvent:
 
     if event_type == "delete":
         return event_type, ApiDocumentDelete.model_validate_json(data)
+    if event_type == "resync":
+        return event_type, ApiResync.model_validate_json(data)
     return event_type, ApiDocumentSnippet.model_validate_json(data)
 
 
@@ -159,25 +162,21 @@ def listen_docs_task(
 
 
 def check_events_valid(uri: str, events: list[DocEvent]) -> None:
-    assert len(events) == 3
-
-    insert, val_pending = events[0]
-    update, val_indexing = events[1]
-    update_success, val_success = events[2]
-
-    assert insert == "update"
-    assert update == "update"
-    assert update_success == "update"
-
-    assert isinstance(val_pending, ApiDocumentSnippet)
-    assert val_pending.status == "pending"
-    assert isinstance(val_indexing, ApiDocumentSnippet)
-    assert val_indexing.status == "indexing"
-    assert isinstance(val_success, ApiDocumentSnippet)
-    assert val_success.status == "indexing_success"
-    assert val_pending.uri == uri
-    assert val_indexing.uri == uri
-    assert val_success.uri == uri
+    # changes happening faster than they are dispatched are coalesced, so intermediate statuses can be skipped
+    statuses_order = ["pending", "indexing", "indexing_success"]
+    doc_events = [event for event in events if event[0] != "keep_alive"]
+    assert doc_events
+
+    statuses: list[str] = []
+    for event_type, value in doc_events:
+        assert event_type == "update"
+        assert isinstance(value, ApiDocumentSnippet)
+        assert value.uri == uri
+        statuses.append(value.status)
+
+    assert statuses[-1] == "indexing_success"
+    assert statuses == sorted(statuses, key=statuses_order.index)
+    assert len(set(statuses)) == len(statuses)
 
 
 async def query(client: AsyncClient, query: str) -> ApiQueryResponseUpdate:
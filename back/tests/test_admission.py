@@ -0,0 +1,82 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from indexer.admission import AdmissionSettings, MemoryAdmissionController, measure_peak_memory
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def controller(memory_budget: int = 1000) -> MemoryAdmissionController:
+    return MemoryAdmissionController(AdmissionSettings(memory_budget=memory_budget, initial_memory_multiplier=10))
+
+
+@pytest.mark.anyio
+async def test_admit_under_budget() -> None:
+    admission = controller()
+    async with admission.admit("pdf", 40), admission.admit("pdf", 40):
+        assert admission.estimated_memory_in_flight == 800
+    assert admission.estimated_memory_in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_wait_for_budget() -> None:
+    admission = controller()
+    admitted_second = asyncio.Event()
+
+    async def second() -> None:
+        async with admission.admit("pdf", 60):
+            admitted_second.set()
+
+    async with admission.admit("pdf", 60):
+        task = asyncio.create_task(second())
+        await asyncio.sleep(0.01)
+        assert not admitted_second.is_set()
+    await task
+    assert admitted_second.is_set()
+
+
+@pytest.mark.anyio
+async def test_document_over_budget_admitted_alone() -> None:
+    admission = controller()
+    async with admission.admit("pdf", 1000):
+        assert admission.estimated_memory_in_flight == 10000
+
+
+def test_learn_memory_multiplier() -> None:
+    admission = controller()
+    admission.observe("pdf", 100, 5000)
+    assert admission.estimate("pdf", 10) == 500
+    assert admission.estimate("docx", 10) == 100  # other file types keep the initial estimate
+    # increases immediately, decreases slowly
+    admission.observe("pdf", 100, 8000)
+    assert admission.estimate("pdf", 10) == 800
+    admission.observe("pdf", 100, 0)
+    assert 0 < admission.estimate("pdf", 10) < 800
+
+
+def allocate(size: int) -> int:
+    """Run in a parsing process, like a document parsing"""
+    buffer = bytearray(size)  # zero-filled, so resident
+    return len(buffer)
+
+
+@pytest.mark.anyio
+async def test_learn_from_parsing_process_memory() -> None:
+    admission = controller(memory_budget=10**9)
+    size = 50_000_000
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        # the peak of the process was not reset since a bigger allocation
+        await loop.run_in_executor(pool, measure_peak_memory, allocate, 2 * size)
+        async with admission.admit("pdf", 1000) as admitted:
+            result, admitted.peak_memory = await loop.run_in_executor(pool, measure_peak_memory, allocate, size)
+    assert result == size
+    assert admitted.peak_memory is not None
+    assert 0.9 * size <= admitted.peak_memory < 2 * size
+    # observed in the parsing process, not in this one
+    assert admission.estimate("pdf", 1000) == admitted.peak_memory
@@ -0,0 +1,30 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.app_services import DepDbService, DepDocumentCatalog, get_db_service, get_document_catalog
+from app.settings import Settings, get_settings
+from common.db_service import DbSettings
+
+
+def test_requests_served_by_warmed_up_services() -> None:
+    db_settings = DbSettings(
+        username="user",
+        password="password",  # noqa: S106
+        host="localhost",
+        port=5432,
+        database="db",
+    )
+    settings = Settings.model_construct(db=db_settings, document_catalog=True, indexer_version=1)
+    app = FastAPI()
+    app.dependency_overrides[get_settings] = lambda: settings
+
+    @app.get("/services")
+    def services(db: DepDbService, catalog: DepDocumentCatalog) -> list[int]:
+        return [id(db), id(catalog)]
+
+    # services built by the warm-up, cf. main.warm_up
+    db = get_db_service(settings=settings)
+    catalog = get_document_catalog(settings=settings, db=db)
+
+    with TestClient(app) as client:
+        assert client.get("/services").json() == [id(db), id(catalog)]
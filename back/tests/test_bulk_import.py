@@ -0,0 +1,111 @@
+import asyncio
+import pathlib
+
+import numpy as np
+import pytest
+
+from common.document import Chunk, EmbeddedChunk, Embedding, ParsedDocument
+from common.embedding_service import EmbeddingService, EmbeddingSettings, EmbeddingTask
+from common.vector_db import LanceDbSettings, VectorDB
+from indexer.bulk_import import BulkImportCheckpoint
+from indexer.sources.local_directory import LocalDirectorySource, local_etag
+from tests.test_vector_db import random_vectors
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_local_directory_source(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "folder").mkdir()
+    (tmp_path / "folder" / "doc.md").write_text("# title")
+    (tmp_path / "other.txt").write_text("text")
+    source = LocalDirectorySource(tmp_path)
+
+    assert [(ref.uri, ref.size) for ref in await source.all_doc_refs()] == [("folder/doc.md", 7), ("other.txt", 4)]
+    document = await source.get_document("folder/doc.md")
+    assert document is not None
+    assert document.filetype == "md"
+    assert document.doc_ref.source_version_id == local_etag(b"# title")
+    assert await source.get_document("missing.md") is None
+
+
+def test_checkpoint(tmp_path: pathlib.Path) -> None:
+    checkpoint = BulkImportCheckpoint(tmp_path / "checkpoint")
+    assert checkpoint.read() == set()
+    checkpoint.append(["a", "b"])
+    checkpoint.append(["c"])
+    assert checkpoint.read() == {"a", "b", "c"}
+
+
+@pytest.mark.anyio
+async def test_embed_documents_across_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+    embedder = EmbeddingService(
+        EmbeddingSettings(litellm_model="model", litellm_query_kwargs={}, litellm_document_kwargs={}),
+        "api_key",
+    )
+    monkeypatch.setattr(embedder, "_max_chars", 10)  # requests of 2 passages of 4 characters
+    requests: list[list[str]] = []
+
+    async def fake_embed(_: EmbeddingTask, content: list[str]) -> list[Embedding]:
+        requests.append(content)
+        await asyncio.sleep(0.01 * (len(requests) % 3))  # requests complete out of order
+        # the embedding of a passage identifies it: [document, chunk]
+        return [Embedding(embedding=[float(passage[1]), float(passage[3])]) for passage in content]
+
+    monkeypatch.setattr(embedder, "_embed", fake_embed)
+    documents = [
+        ParsedDocument(hash=f"doc{document}", markdown_content="".join(f"d{document}c{chunk}" for chunk in range(3)))
+        for document in range(3)
+    ]
+    chunks = [Chunk(start_index_in_doc=4 * chunk, end_index_in_doc=4 * chunk + 4) for chunk in range(3)]
+    empty_document = ParsedDocument(hash="empty", markdown_content="")
+    results = await embedder.embed_documents(
+        [(documents[0], chunks), (empty_document, []), (documents[1], chunks[:1]), (documents[2], chunks)],
+    )
+
+    assert [len(request) for request in requests] == [2, 2, 2, 1]  # documents span several requests
+    assert results[1] == []
+    for result, (document, nb_chunks) in zip([results[0], *results[2:]], [(0, 3), (1, 1), (2, 3)], strict=True):
+        assert [embedded.chunk for embedded in result] == chunks[:nb_chunks]
+        assert [embedded.embedding.embedding for embedded in result] == [
+            [document, chunk] for chunk in range(nb_chunks)
+        ]
+
+
+@pytest.mark.anyio
+async def test_append_documents(tmp_path: pathlib.Path) -> None:
+    vector_db = VectorDB(
+        LanceDbSettings(local_path=str(tmp_path), read_consistency_interval=0, document_vectors=True),
+        "cosine",
+        1,
+    )
+    vectors = random_vectors(20)
+    documents = [
+        (
+            ParsedDocument(hash=f"doc{document}", markdown_content="0123456789"),
+            [
+                EmbeddedChunk(
+                    chunk=Chunk(start_index_in_doc=chunk, end_index_in_doc=chunk + 1),
+                    embedding=Embedding(embedding=vectors[document * 10 + chunk].tolist()),
+                )
+                for chunk in range(10)
+            ],
+        )
+        for document in range(2)
+    ]
+    await vector_db.append_documents([*documents, (ParsedDocument(hash="empty", markdown_content=""), [])])
+    await vector_db.finish_appends()
+
+    assert await vector_db.get_indexed_parsed_hashes() == {"doc0", "doc1"}
+    assert await vector_db.get_stored_parsed_hashes() == {"doc0", "doc1", "empty"}
+    assert await vector_db.get_document("doc1") == documents[1][0]
+    results = await vector_db.query(vectors[13].tolist(), 1)
+    assert results[0].parsed_document.hash == "doc1"
+    assert results[0].chunk_results[0].chunk == Chunk(start_index_in_doc=3, end_index_in_doc=4)
+    assert results[0].chunk_results[0].distance == pytest.approx(0, abs=1e-3)
+    # chunks are searched in the documents with the nearest summary vectors
+    results = await vector_db.query(np.mean(vectors[:10], axis=0).tolist(), 1, nb_documents_to_search=1)
+    assert results[0].parsed_document.hash == "doc0"
@@ -1,5 +1,7 @@
+import itertools
+
 from common.document import ParsedDocument
-from indexer.chunker import Chunker
+from indexer.chunker import Chunker, TokenChunker, count_tokens
 
 
 def test_chunk() -> None:
@@ -45,3 +47,37 @@ def test_chunk_with_section_too_long() -> None:
     assert len(chunks) == 4
     rebuilt = "".join([parsed[chunk] for chunk in chunks])
     assert rebuilt == content
+
+
+def test_token_chunker() -> None:
+    sentence = "This sentence has about ten tokens in it. "
+    content = "intro\n\n# title 1\n\n" + sentence * 20 + "\n\n## title 2\n\nshort section\n"
+    parsed = ParsedDocument(hash="hash", markdown_content=content)
+    chunks = TokenChunker(chunk_size=50, chunk_overlap=0).chunk(parsed)
+    assert "".join([parsed[chunk] for chunk in chunks]) == content
+    assert all(count_tokens(parsed[chunk]) <= 50 for chunk in chunks)
+    # chunks end on sentences, and are aligned on header sections
+    assert all(parsed[chunk].endswith((". ", "\n")) for chunk in chunks)
+    assert parsed[chunks[0]] == "intro\n\n"
+    assert parsed[chunks[1]].startswith("# title 1")
+    assert parsed[chunks[-1]] == "## title 2\n\nshort section\n"
+
+
+def test_token_chunker_overlap() -> None:
+    sentence = "This sentence has about ten tokens in it. "
+    content = "# title\n\n" + sentence * 30
+    parsed = ParsedDocument(hash="hash", markdown_content=content)
+    chunks = TokenChunker(chunk_size=50, chunk_overlap=15).chunk(parsed)
+    assert chunks[0].start_index_in_doc == 0
+    assert chunks[-1].end_index_in_doc == len(content)
+    for previous, chunk in itertools.pairwise(chunks):
+        assert previous.start_index_in_doc < chunk.start_index_in_doc < previous.end_index_in_doc
+        assert parsed[chunk].startswith("This sentence")
+
+
+def test_token_chunker_without_boundaries() -> None:
+    content = "azerty " * 500
+    parsed = ParsedDocument(hash="hash", markdown_content=content)
+    chunks = TokenChunker(chunk_size=64, chunk_overlap=0).chunk(parsed)
+    assert "".join([parsed[chunk] for chunk in chunks]) == content
+    assert all(count_tokens(parsed[chunk]) <= 64 for chunk in chunks)
@@ -0,0 +1,204 @@
+import asyncio
+import contextlib
+import datetime as dt
+from collections.abc import AsyncIterator, Callable
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from common.db_service import (
+    DbChangeCursor,
+    DbDocument,
+    DbDocumentStatus,
+    DbEventSubscription,
+    DbIndexedDocumentEvent,
+    DbResyncEvent,
+    DbService,
+    DbSettings,
+    TableIndexedDocumentStatusEnum,
+)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def doc_event(uri: str, seq: int = 1) -> DbIndexedDocumentEvent:
+    doc = DbDocument(
+        uri=uri,
+        indexed_document_id=uuid4(),
+        indexed_source_version=None,
+        status=DbDocumentStatus(
+            status=TableIndexedDocumentStatusEnum.pending,
+            last_status_change=datetime.now(tz=dt.UTC),
+            error_status_message=None,
+        ),
+        last_indexing=None,
+        indexed_content=None,
+    )
+    return DbIndexedDocumentEvent(seq=seq, event_type="update", uri=uri, indexer_version=1, document=doc)
+
+
+@pytest.mark.anyio
+async def test_subscription_delivers_events_in_order() -> None:
+    subscription = DbEventSubscription(subscriber_id=1, max_pending_events=3)
+    subscription.push(doc_event("a"))
+    subscription.push(doc_event("b"))
+    first = await subscription.get()
+    second = await subscription.get()
+    assert isinstance(first, DbIndexedDocumentEvent)
+    assert isinstance(second, DbIndexedDocumentEvent)
+    assert first.uri == "a"
+    assert second.uri == "b"
+    stats = subscription.stats()
+    assert stats.received_events == 2
+    assert stats.dropped_events == 0
+    assert stats.max_pending_events == 2
+    assert stats.pending_events == 0
+
+
+@pytest.mark.anyio
+async def test_subscription_overflow_replaces_backlog_with_resync() -> None:
+    subscription = DbEventSubscription(subscriber_id=1, max_pending_events=3)
+    for uri in ["a", "b", "c", "d", "e"]:
+        subscription.push(doc_event(uri))
+
+    # a, b, c filled the buffer, d overflowed it (4 dropped) then e was buffered after the resync
+    resync = await subscription.get()
+    assert isinstance(resync, DbResyncEvent)
+    assert resync.dropped_events == 4
+    last = await subscription.get()
+    assert isinstance(last, DbIndexedDocumentEvent)
+    assert last.uri == "e"
+
+    stats = subscription.stats()
+    assert stats.received_events == 5
+    assert stats.dropped_events == 4
+    assert stats.resyncs == 1
+    assert stats.max_pending_events == 3
+
+
+def test_change_cursor_advances_on_contiguous_seqs() -> None:
+    cursor = DbChangeCursor(last_seq=10)
+    cursor.advance([11, 12, 13])
+    assert cursor.last_seq == 13
+    assert not cursor.has_gap
+    assert not cursor.is_new(12)
+    assert cursor.is_new(14)
+
+
+def test_change_cursor_waits_for_uncommitted_seqs() -> None:
+    cursor = DbChangeCursor(last_seq=10)
+    # 11 is allocated but not committed yet
+    cursor.advance([12, 13])
+    assert cursor.last_seq == 10
+    assert cursor.has_gap
+    assert cursor.is_new(11)
+    assert not cursor.is_new(12)
+    assert cursor.dispatched_seq == 13
+    # 11 is committed
+    cursor.advance([11])
+    assert cursor.last_seq == 13
+    assert not cursor.has_gap
+
+
+def db_service(listen_start_timeout: float = 30.0) -> DbService:
+    settings = DbSettings(
+        username="user",
+        password="password",  # noqa: S106
+        host="localhost",
+        port=5432,
+        database="db",
+        listen_start_timeout=listen_start_timeout,
+    )
+    return DbService(settings)
+
+
+@pytest.mark.anyio
+async def test_listener_start_timeout() -> None:
+    db = db_service(listen_start_timeout=0.1)
+
+    async def get_last_document_change_seq() -> int:
+        return 0
+
+    @contextlib.asynccontextmanager
+    async def unreachable(_: Callable[[str], None]) -> AsyncIterator[Callable[[], bool]]:
+        raise OSError("connection refused")
+        yield lambda: False  # pragma: no cover
+
+    db.get_last_document_change_seq = get_last_document_change_seq  # type: ignore[method-assign]
+    db._change_notifications = unreachable  # type: ignore[method-assign] # noqa: SLF001
+    with pytest.raises(TimeoutError):
+        await db.listen_to_indexed_documents_changes(10, 1)
+    # the next subscriber starts a new listener
+    assert not db.subscribed_clients
+    assert db._listening_task is None  # noqa: SLF001
+
+
+@pytest.mark.anyio
+async def test_replay_includes_changes_dispatched_after_gap() -> None:
+    db = db_service()
+    # 11 is allocated but not committed yet, 12 is committed
+    feed = {10: doc_event("a", 10), 12: doc_event("b", 12)}
+
+    async def get_last_document_change_seq() -> int:
+        return 9
+
+    async def get_document_changes(
+        since_seq: int,
+        _limit: int,
+        _indexer_version: int | None = None,
+    ) -> tuple[list[DbIndexedDocumentEvent], list[int]]:
+        seqs = [seq for seq in sorted(feed) if seq > since_seq]
+        return [feed[seq] for seq in seqs], seqs
+
+    @contextlib.asynccontextmanager
+    async def notifications(_: Callable[[str], None]) -> AsyncIterator[Callable[[], bool]]:
+        yield lambda: True
+
+    db.get_last_document_change_seq = get_last_document_change_seq  # type: ignore[method-assign]
+    db.get_document_changes = get_document_changes  # type: ignore[method-assign]
+    db._change_notifications = notifications  # type: ignore[method-assign] # noqa: SLF001
+    first = await db.listen_to_indexed_documents_changes(10, 1)
+    try:
+        await asyncio.sleep(0.05)  # 10 and 12 dispatched
+        assert [event.seq for event in first.get_pending() if isinstance(event, DbIndexedDocumentEvent)] == [10, 12]
+        # a client resuming from 9 gets 12 too, although 11 is still missing
+        resumed = await db.listen_to_indexed_documents_changes(10, 1, since_seq=9)
+        assert [event.seq for event in resumed.get_pending() if isinstance(event, DbIndexedDocumentEvent)] == [10, 12]
+        await db.removed_listener_to_indexed_documents_changes(resumed)
+    finally:
+        await db.removed_listener_to_indexed_documents_changes(first)
+
+
+@pytest.mark.anyio
+async def test_dispatch_skips_rolled_back_seqs() -> None:
+    db = db_service()
+    subscription = DbEventSubscription(1, 10)
+    db.subscribed_clients.add(subscription)
+    # 11 is missing: in progress, then rolled back
+    feed = {12: doc_event("b", 12)}
+    last_seq = 10
+
+    async def get_last_document_change_seq() -> int:
+        return last_seq
+
+    async def get_document_changes(since_seq: int, _limit: int) -> tuple[list[DbIndexedDocumentEvent], list[int]]:
+        seqs = [seq for seq in sorted(feed) if seq > since_seq]
+        return [feed[seq] for seq in seqs], seqs
+
+    db.get_last_document_change_seq = get_last_document_change_seq  # type: ignore[method-assign]
+    db.get_document_changes = get_document_changes  # type: ignore[method-assign]
+    cursor = DbChangeCursor(last_seq=10)
+    await db._dispatch_document_changes(cursor)  # noqa: SLF001
+    assert cursor.has_gap
+    # still in progress, however long
+    await db._dispatch_document_changes(cursor)  # noqa: SLF001
+    assert cursor.last_seq == 10
+    last_seq = 12
+    await db._dispatch_document_changes(cursor)  # noqa: SLF001
+    assert cursor.last_seq == 12
+    assert not cursor.has_gap
+    assert [event.seq for event in subscription.get_pending() if isinstance(event, DbIndexedDocumentEvent)] == [12]
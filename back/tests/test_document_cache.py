@@ -0,0 +1,16 @@
+import os
+import pathlib
+
+from common.document_cache import DocumentCache, DocumentCacheSettings
+
+
+def test_cache_shared_and_evicted(tmp_path: pathlib.Path) -> None:
+    settings = DocumentCacheSettings(path=tmp_path, max_size_mb=100 / 2**20)  # 100 bytes
+    cache = DocumentCache(settings)
+    cache.put({"a": "a" * 40, "b": "b" * 40})
+    # another process sees the entries
+    assert DocumentCache(settings).get(["a", "b", "c"]) == {"a": "a" * 40, "b": "b" * 40}
+
+    os.utime(tmp_path / "b.md", (0, 0))  # b is the least recently used
+    cache.put({"c": "c" * 40})
+    assert set(cache.get(["a", "b", "c"])) == {"a", "c"}
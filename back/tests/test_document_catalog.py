@@ -0,0 +1,131 @@
+import asyncio
+import datetime as dt
+from datetime import datetime
+from typing import cast
+from uuid import uuid4
+
+import pytest
+
+from app.document_catalog import DocumentCatalog
+from common.db_service import (
+    DbDocument,
+    DbDocumentStatus,
+    DbEventSubscription,
+    DbIndexedContent,
+    DbIndexedDocumentEvent,
+    DbService,
+    TableIndexedDocumentStatusEnum,
+)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def db_doc(uri: str, parsed_hash: str | None = None) -> DbDocument:
+    return DbDocument(
+        uri=uri,
+        indexed_document_id=uuid4(),
+        indexed_source_version=None,
+        status=DbDocumentStatus(
+            status=TableIndexedDocumentStatusEnum.indexing_success,
+            last_status_change=datetime.now(tz=dt.UTC),
+            error_status_message=None,
+        ),
+        last_indexing=None,
+        indexed_content=DbIndexedContent(raw_hash="raw", parsed_hash=parsed_hash) if parsed_hash else None,
+    )
+
+
+class FakeDbService:
+    docs: list[DbDocument]
+    dispatched_seq: int = 10
+    subscription: DbEventSubscription
+
+    def __init__(self, docs: list[DbDocument]) -> None:
+        self.docs = docs
+
+    async def listen_to_indexed_documents_changes(self, max_pending_events: int, _: int) -> DbEventSubscription:
+        self.subscription = DbEventSubscription(1, max_pending_events)
+        # dispatched between the subscription and the snapshot
+        self.subscription.push(doc_event(9, "a", None))
+        return self.subscription
+
+    async def removed_listener_to_indexed_documents_changes(self, _: DbEventSubscription) -> None:
+        pass
+
+    def get_dispatched_document_change_seq(self) -> int:
+        return self.dispatched_seq
+
+    async def get_all_documents(self, _: int) -> list[DbDocument]:
+        return self.docs
+
+
+def doc_event(seq: int, uri: str, doc: DbDocument | None) -> DbIndexedDocumentEvent:
+    return DbIndexedDocumentEvent(
+        seq=seq,
+        event_type="update" if doc else "delete",
+        uri=uri,
+        indexer_version=1,
+        document=doc,
+    )
+
+
+async def started_catalog(docs: list[DbDocument], db: FakeDbService | None = None) -> DocumentCatalog:
+    catalog = DocumentCatalog(cast("DbService", db or FakeDbService(docs)), indexer_version=1, max_pending_events=10)
+    await catalog.start_if_needed()
+    return catalog
+
+
+@pytest.mark.anyio
+async def test_catalog_lookups() -> None:
+    catalog = await started_catalog([db_doc("b", "hash_b"), db_doc("a", "hash_a"), db_doc("c")])
+    try:
+        assert catalog.seq == 10
+        assert set(await catalog.get_documents(["a", "c", "missing"], 1)) == {"a", "c"}
+        hash_to_doc = await catalog.get_documents_from_indexed_parsed_hashes(["hash_a", "hash_c"], 1)
+        assert list(hash_to_doc) == ["hash_a"]
+        assert hash_to_doc["hash_a"].uri == "a"
+        page = await catalog.get_documents_page(1, None, 2)
+        assert [doc.uri for doc in page] == ["a", "b"]
+        page = await catalog.get_documents_page(1, "b", 2)
+        assert [doc.uri for doc in page] == ["c"]
+    finally:
+        await catalog.stop()
+
+
+@pytest.mark.anyio
+async def test_catalog_applies_changes() -> None:
+    catalog = await started_catalog([db_doc("a", "hash_a")])
+    try:
+        # the delete dispatched before the snapshot is discarded
+        await asyncio.sleep(0)
+        assert "a" in await catalog.get_documents(["a"], 1)
+
+        catalog.apply(doc_event(11, "a", db_doc("a", "h2")))
+        assert await catalog.get_documents_from_indexed_parsed_hashes(["hash_a"], 1) == {}
+        assert "h2" in await catalog.get_documents_from_indexed_parsed_hashes(["h2"], 1)
+
+        # 13 dispatched before 12, that committed after it
+        catalog.apply(doc_event(13, "0", db_doc("0")))
+        catalog.apply(doc_event(12, "a", None))
+        assert [doc.uri for doc in await catalog.get_documents_page(1, None, 10)] == ["0"]
+    finally:
+        await catalog.stop()
+
+
+@pytest.mark.anyio
+async def test_catalog_seq_follows_dispatched_changes() -> None:
+    db = FakeDbService([])
+    catalog = await started_catalog([], db)
+    try:
+        assert catalog.seq == 10
+        db.dispatched_seq = 12
+        db.subscription.push(doc_event(12, "b", db_doc("b")))
+        db.subscription.push(doc_event(11, "a", db_doc("a")))
+        await asyncio.sleep(0.01)
+        assert [doc.uri for doc in await catalog.get_documents_page(1, None, 10)] == ["a", "b"]
+        assert catalog.seq == 12
+    finally:
+        await catalog.stop()
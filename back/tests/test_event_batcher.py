@@ -0,0 +1,45 @@
+import asyncio
+from collections.abc import AsyncGenerator
+from datetime import timedelta
+
+import pytest
+
+from indexer.event_batcher import EventBatcherSettings, batch_events
+from indexer.source import SourceDeleteEvent, SourceDocumentReference, SourceEvent, SourceUpsertEvent
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def upsert(uri: str, version: str = "v1") -> SourceUpsertEvent:
+    return SourceUpsertEvent(doc_ref=SourceDocumentReference(uri=uri, source_version_id=version))
+
+
+async def source_events(*bursts: list[SourceEvent]) -> AsyncGenerator[SourceEvent, None]:
+    for burst in bursts:
+        for event in burst:
+            yield event
+        await asyncio.sleep(0.2)
+
+
+async def batches(settings: EventBatcherSettings, *bursts: list[SourceEvent]) -> list[list[SourceEvent]]:
+    return [batch async for batch in batch_events(source_events(*bursts), settings)]
+
+
+@pytest.mark.anyio
+async def test_last_event_per_document() -> None:
+    settings = EventBatcherSettings(window=timedelta(milliseconds=50))
+    burst: list[SourceEvent] = [upsert("a", "v1"), upsert("b"), upsert("a", "v2"), SourceDeleteEvent(uri="b")]
+    assert await batches(settings, burst, [upsert("c")]) == [
+        [upsert("a", "v2"), SourceDeleteEvent(uri="b")],
+        [upsert("c")],
+    ]
+
+
+@pytest.mark.anyio
+async def test_max_batch_size() -> None:
+    settings = EventBatcherSettings(window=timedelta(seconds=10), max_batch_size=2)
+    result = await batches(settings, [upsert("a"), upsert("a"), upsert("b"), upsert("c")])
+    assert result == [[upsert("a"), upsert("b")], [upsert("c")]]
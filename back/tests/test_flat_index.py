@@ -0,0 +1,119 @@
+import pathlib
+from collections.abc import AsyncGenerator
+
+import numpy as np
+import pytest
+
+from common.document import Chunk, EmbeddedChunk, Embedding, ParsedDocument
+from common.flat_index import FetchRows, FlatIndex, FlatIndexRows, FlatIndexSettings
+from common.vector_db import LanceDbSettings, VectorDB, vector_distances
+from tests.test_vector_db import random_vectors
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def rows_fetcher(
+    vectors: np.ndarray,
+    parsed_hashes: list[str],
+    fetched: list[set[str]],
+    batch_size: int = 7,
+) -> FetchRows:
+    async def fetch_rows(to_fetch: set[str]) -> AsyncGenerator[FlatIndexRows, None]:
+        fetched.append(to_fetch)
+        rows = [i for i, parsed_hash in enumerate(parsed_hashes) if parsed_hash in to_fetch]
+        # batches smaller than documents: a document spans several appends
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            yield FlatIndexRows(
+                vectors[batch],
+                [parsed_hashes[i] for i in batch],
+                np.array(batch, dtype=np.int64),
+                np.array(batch, dtype=np.int64) + 1,
+            )
+
+    return fetch_rows
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("distance_metric", ["cosine", "L2", "dot"])
+async def test_search_is_exact(tmp_path: pathlib.Path, distance_metric: str) -> None:
+    vectors = random_vectors(100).astype(np.float16)
+    parsed_hashes = [f"doc{i // 10}" for i in range(100)]  # 10 documents of 10 chunks
+    index = FlatIndex(FlatIndexSettings(path=tmp_path, block_size=16), "chunks", vectors.shape[1], distance_metric)
+    await index.sync(set(parsed_hashes), rows_fetcher(vectors, parsed_hashes, []))
+
+    query = random_vectors(101)[100]
+    distances = vector_distances(vectors, query, distance_metric)
+    result = await index.search(query.tolist(), 5)
+    assert result.starts.tolist() == np.argsort(distances)[:5].tolist()
+    assert result.distances == pytest.approx(np.sort(distances)[:5], abs=1e-4)
+    assert result.parsed_hashes == [parsed_hashes[i] for i in result.starts]
+
+    # chunks are only searched in the given documents
+    result = await index.search(query.tolist(), 5, ["doc3", "doc7"])
+    assert set(result.parsed_hashes) <= {"doc3", "doc7"}
+    assert len(result.parsed_hashes) == 5
+
+
+@pytest.mark.anyio
+async def test_incremental_sync(tmp_path: pathlib.Path) -> None:
+    vectors = random_vectors(40)
+    parsed_hashes = [f"doc{i // 10}" for i in range(40)]  # 4 documents of 10 chunks
+    settings = FlatIndexSettings(path=tmp_path, block_size=8)
+    index = FlatIndex(settings, "chunks", vectors.shape[1], "cosine")
+    fetched: list[set[str]] = []
+    await index.sync({"doc0", "doc1", "doc2"}, rows_fetcher(vectors, parsed_hashes, fetched))
+    # doc0 deleted (garbage collected), doc3 indexed
+    await index.sync({"doc1", "doc2", "doc3"}, rows_fetcher(vectors, parsed_hashes, fetched))
+    assert fetched == [{"doc0", "doc1", "doc2"}, {"doc3"}]
+    assert index.parsed_hashes() == {"doc1", "doc2", "doc3"}
+    result = await index.search(vectors[5].tolist(), 40)
+    assert len(result.parsed_hashes) == 30
+    assert "doc0" not in result.parsed_hashes
+
+    # another process opening the snapshot does not fetch anything
+    other_index = FlatIndex(settings, "chunks", vectors.shape[1], "cosine")
+    await other_index.sync({"doc1", "doc2", "doc3"}, rows_fetcher(vectors, parsed_hashes, fetched))
+    assert len(fetched) == 2
+    assert other_index.parsed_hashes() == {"doc1", "doc2", "doc3"}
+
+    # rebuilt once more than half of its rows are deleted
+    await index.sync({"doc3"}, rows_fetcher(vectors, parsed_hashes, fetched))
+    assert len(fetched) == 2
+    await index.sync({"doc3"}, rows_fetcher(vectors, parsed_hashes, fetched))
+    assert fetched[2:] == [{"doc3"}]
+    assert len((await index.search(vectors[35].tolist(), 40)).parsed_hashes) == 10
+
+
+@pytest.mark.anyio
+async def test_vector_db_flat_index_search(tmp_path: pathlib.Path) -> None:
+    lance_path = str(tmp_path / "lancedb")
+    vectors = random_vectors(30)
+    writer = VectorDB(LanceDbSettings(local_path=lance_path, read_consistency_interval=0), "cosine", 1)
+    for doc in range(3):
+        chunks = [
+            EmbeddedChunk(
+                chunk=Chunk(start_index_in_doc=i, end_index_in_doc=i + 1),
+                embedding=Embedding(embedding=vectors[doc * 10 + i].tolist()),
+            )
+            for i in range(10)
+        ]
+        await writer.index(ParsedDocument(hash=f"doc{doc}", markdown_content="0123456789"), chunks)
+
+    flat_index = FlatIndexSettings(path=tmp_path / "flat_index")
+    reader = VectorDB(LanceDbSettings(local_path=lance_path, flat_index=flat_index), "cosine", 1)
+    results = await reader.query(vectors[14].tolist(), 3)
+    expected = await writer.query(vectors[14].tolist(), 3)
+    # same results as the search in the chunk table
+    assert [result.parsed_document for result in results] == [result.parsed_document for result in expected]
+    for result, expected_result in zip(results, expected, strict=True):
+        assert [chunk.chunk for chunk in result.chunk_results] == [
+            chunk.chunk for chunk in expected_result.chunk_results
+        ]
+        distances = [chunk.distance for chunk in result.chunk_results]
+        assert distances == pytest.approx([chunk.distance for chunk in expected_result.chunk_results], abs=1e-3)
+    nearest_chunks = {(r.parsed_document.hash, c.chunk.start_index_in_doc) for r in results for c in r.chunk_results}
+    assert ("doc1", 4) in nearest_chunks
@@ -0,0 +1,89 @@
+import contextlib
+from collections.abc import AsyncIterator
+from datetime import timedelta
+from typing import cast
+
+import pytest
+
+from common.db_service import DbService
+from common.vector_db import VectorDB
+from indexer.garbage_collector import GarbageCollector, GarbageCollectorSettings, OrphanTracker
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def test_orphans_deleted_after_grace_period() -> None:
+    tracker = OrphanTracker()
+    grace_period = timedelta(seconds=10)
+    assert tracker.update({"a", "b"}, 0, grace_period) == []
+    # b is referenced again (e.g. in-flight indexing completed), c is a new orphan
+    assert tracker.update({"a", "c"}, 5, grace_period) == []
+    assert tracker.update({"a", "b", "c"}, 10, grace_period) == ["a"]
+    # b was forgotten when referenced: its grace period starts again
+    assert tracker.update({"b", "c"}, 15, grace_period) == ["c"]
+    assert tracker.update({"b"}, 20, grace_period) == ["b"]
+
+
+class FakeDbService:
+    referenced: set[str]
+    referenced_before_lock: set[str]  # parsed hashes referenced between the orphan search and the deletion
+    locked: list[str]
+
+    def __init__(self, referenced: set[str], referenced_before_lock: set[str]) -> None:
+        self.referenced = referenced
+        self.referenced_before_lock = referenced_before_lock
+        self.locked = []
+
+    async def prune_unreferenced_indexed_contents(self, _older_than: timedelta, _batch_size: int) -> int:
+        return 0
+
+    async def get_referenced_parsed_hashes(self, parsed_hashes: list[str]) -> set[str]:
+        return self.referenced.intersection(parsed_hashes)
+
+    @contextlib.asynccontextmanager
+    async def lock_unreferenced_parsed_hashes(self, parsed_hashes: list[str]) -> AsyncIterator[list[str]]:
+        self.referenced.update(self.referenced_before_lock)
+        self.locked.extend(parsed_hashes)
+        yield [parsed_hash for parsed_hash in parsed_hashes if parsed_hash not in self.referenced]
+
+
+class FakeVectorDB:
+    stored: set[str]
+
+    def __init__(self, stored: set[str]) -> None:
+        self.stored = stored
+
+    async def get_stored_parsed_hashes(self) -> set[str]:
+        return set(self.stored)
+
+    async def delete_documents(self, parsed_hashes: list[str]) -> None:
+        self.stored.difference_update(parsed_hashes)
+
+
+@pytest.mark.anyio
+async def test_collect_deletes_unreferenced_parsed_docs() -> None:
+    db = FakeDbService(referenced={"a"}, referenced_before_lock={"c"})
+    vector_db = FakeVectorDB({"a", "b", "c", "d"})
+    settings = GarbageCollectorSettings(grace_period=timedelta(0), batch_size=2)
+    collector = GarbageCollector(cast("DbService", db), cast("VectorDB", vector_db), settings)
+
+    # c is referenced again before being deleted (e.g. document reverted to this content)
+    assert await collector.collect() == 2
+    assert vector_db.stored == {"a", "c"}
+    assert sorted(db.locked) == ["b", "c", "d"]
+
+
+@pytest.mark.anyio
+async def test_collect_keeps_orphans_during_grace_period() -> None:
+    db = FakeDbService(referenced=set(), referenced_before_lock=set())
+    vector_db = FakeVectorDB({"a", "b"})
+    settings = GarbageCollectorSettings(grace_period=timedelta(hours=1))
+    collector = GarbageCollector(cast("DbService", db), cast("VectorDB", vector_db), settings)
+
+    assert await collector.collect() == 0
+    assert await collector.collect() == 0
+    assert vector_db.stored == {"a", "b"}
+    assert db.locked == []
@@ -0,0 +1,123 @@
+import datetime as dt
+from datetime import datetime
+from typing import cast
+from uuid import UUID, uuid4
+
+import pytest
+
+from common.db_service import (
+    DbDocument,
+    DbDocumentStatus,
+    DbIndexedContent,
+    DbService,
+    TableIndexedDocumentStatusEnum,
+)
+from indexer.indexer import Indexer, IndexingError
+from indexer.source import Source, SourceDocument, SourceDocumentReference
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+class FakeSource:
+    doc_ref: SourceDocumentReference
+    downloaded_uris: list[str]
+
+    def __init__(self, doc_ref: SourceDocumentReference) -> None:
+        self.doc_ref = doc_ref
+        self.downloaded_uris = []
+
+    async def get_document_ref(self, _: str) -> SourceDocumentReference | None:
+        return self.doc_ref
+
+    async def get_document(self, uri: str) -> SourceDocument | None:
+        self.downloaded_uris.append(uri)
+        return None  # deleted meanwhile: the indexing stops after the download
+
+
+class FakeDbService:
+    """Knows the raw hash of a downloaded object (etag, size) and its indexed content"""
+
+    known_objects: dict[tuple[str, int], str]  # (etag, size) -> raw hash
+    indexed_contents: dict[str, UUID]  # raw hash -> indexed content id
+    marked_as_indexed: list[tuple[UUID, str | None, UUID]]  # indexed document id, source version, indexed content id
+
+    def __init__(self) -> None:
+        self.known_objects = {("etag", 10): "raw"}
+        self.indexed_contents = {"raw": uuid4()}
+        self.marked_as_indexed = []
+
+    async def get_raw_hash_if_known(self, etag: str, size: int) -> str | None:
+        return self.known_objects.get((etag, size))
+
+    async def touch_indexed_content(self, raw_hash: str, _: int) -> tuple[UUID, DbIndexedContent] | None:
+        content_id = self.indexed_contents.get(raw_hash)
+        return (content_id, DbIndexedContent(raw_hash=raw_hash, parsed_hash="parsed")) if content_id else None
+
+    async def mark_indexing_success(
+        self,
+        indexed_document_id: UUID,
+        _: int,
+        indexed_source_version: str | None,
+        indexed_content_id: UUID,
+        __: str,
+    ) -> bool:
+        self.marked_as_indexed.append((indexed_document_id, indexed_source_version, indexed_content_id))
+        return True
+
+
+def indexer(source: FakeSource, db: FakeDbService) -> Indexer:
+    indexer = Indexer.__new__(Indexer)  # without its services
+    indexer.source = cast("Source", source)
+    indexer.db = cast("DbService", db)
+    indexer.indexer_version = 1
+    indexer.worker_id = "worker"
+    return indexer
+
+
+def claimed_doc(uri: str) -> DbDocument:
+    return DbDocument(
+        uri=uri,
+        indexed_document_id=uuid4(),
+        indexed_source_version=None,
+        status=DbDocumentStatus(
+            status=TableIndexedDocumentStatusEnum.indexing,
+            last_status_change=datetime.now(tz=dt.UTC),
+            error_status_message=None,
+        ),
+        last_indexing=None,
+        indexed_content=None,
+    )
+
+
+@pytest.mark.anyio
+async def test_known_object_not_downloaded() -> None:
+    # e.g. copied: same etag and size as an object already downloaded
+    source = FakeSource(SourceDocumentReference(uri="copy.pdf", source_version_id="etag", size=10))
+    db = FakeDbService()
+    doc = claimed_doc("copy.pdf")
+    await indexer(source, db)._index_and_store(doc)  # noqa: SLF001
+    assert source.downloaded_uris == []
+    assert db.marked_as_indexed == [(doc.indexed_document_id, "etag", db.indexed_contents["raw"])]
+
+
+@pytest.mark.anyio
+async def test_object_of_another_size_downloaded() -> None:
+    # an object is known by its etag and its size
+    source = FakeSource(SourceDocumentReference(uri="other.pdf", source_version_id="etag", size=11))
+    db = FakeDbService()
+    with pytest.raises(IndexingError):
+        await indexer(source, db)._index_and_store(claimed_doc("other.pdf"))  # noqa: SLF001
+    assert source.downloaded_uris == ["other.pdf"]
+    assert db.marked_as_indexed == []
+
+
+@pytest.mark.anyio
+async def test_object_without_size_downloaded() -> None:
+    source = FakeSource(SourceDocumentReference(uri="unknown.pdf", source_version_id="etag", size=None))
+    db = FakeDbService()
+    with pytest.raises(IndexingError):
+        await indexer(source, db)._index_and_store(claimed_doc("unknown.pdf"))  # noqa: SLF001
+    assert source.downloaded_uris == ["unknown.pdf"]
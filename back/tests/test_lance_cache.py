@@ -0,0 +1,118 @@
+import fcntl
+import pathlib
+
+import pytest
+from pydantic import ValidationError
+
+from common.lance_cache import CachedFile, LanceCacheSettings, LanceDiskCache, files_to_download, tables_to_evict
+from common.minio_service import MinioSettings
+from common.vector_db import LanceDbSettings
+
+
+def test_manifests_downloaded_last() -> None:
+    local = {
+        "data/a.lance": CachedFile(etag="a", size=10),
+        "_versions/1.manifest": CachedFile(etag="v1", size=1),
+    }
+    remote = {
+        "_versions/2.manifest": CachedFile(etag="v2", size=1),
+        "_versions/1.manifest": CachedFile(etag="v1", size=1),
+        "data/a.lance": CachedFile(etag="a", size=10),
+        "data/b.lance": CachedFile(etag="b", size=10),
+        "_indices/i/index.idx": CachedFile(etag="i", size=5),
+    }
+    assert files_to_download(remote, local) == ["data/b.lance", "_indices/i/index.idx", "_versions/2.manifest"]
+
+
+def test_least_recently_used_tables_evicted() -> None:
+    # name -> (size, last access time)
+    tables = {"old": (40, 1.0), "kept": (30, 0.0), "recent": (20, 3.0)}
+    assert tables_to_evict(tables, {"kept"}, 10, 100) == []
+    assert tables_to_evict(tables, {"kept"}, 20, 100) == ["old"]
+    assert tables_to_evict(tables, {"kept"}, 60, 100) == ["old", "recent"]
+
+
+def test_storage_settings() -> None:
+    minio = MinioSettings(endpoint="localhost:9000", access_key="", secret_key="", use_tls=False, bucket="test")
+    LanceDbSettings(local_path="/data/lancedb", read_consistency_interval=0)
+    with pytest.raises(ValidationError):
+        LanceDbSettings(minio=minio, local_path="/data/lancedb", read_consistency_interval=0)
+    with pytest.raises(ValidationError):
+        LanceDbSettings(
+            local_path="/data/lancedb",
+            cache=LanceCacheSettings(path="/cache"),  # type: ignore[reportArgumentType]
+            read_consistency_interval=0,
+        )
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def fake_minio_cache(
+    monkeypatch: pytest.MonkeyPatch,
+    path: pathlib.Path,
+    remote: dict[str, dict[str, CachedFile]],
+) -> LanceDiskCache:
+    """Cache of max 100 bytes, mirroring the remote files (table name -> key -> file)"""
+    minio = MinioSettings(endpoint="localhost:9000", access_key="", secret_key="", use_tls=False, bucket="test")
+    cache = LanceDiskCache(LanceCacheSettings(path=path, max_size_gb=100 / 2**30), minio)
+
+    def fget_object(_bucket_name: str, object_name: str, file_path: str) -> None:
+        table_name, key = object_name.removeprefix("lancedb/").split(".lance/")
+        pathlib.Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        pathlib.Path(file_path).write_bytes(b"x" * remote[table_name][key].size)
+
+    monkeypatch.setattr(cache, "_list_remote_files", lambda table_name: dict(remote.get(table_name, {})))
+    monkeypatch.setattr(cache._minio_client, "fget_object", fget_object)  # noqa: SLF001
+    return cache
+
+
+@pytest.mark.anyio
+async def test_tables_in_use_not_evicted(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    remote = {
+        "read": {"data/a.lance": CachedFile(etag="a", size=50)},
+        "unread": {"data/b.lance": CachedFile(etag="b", size=30)},
+        "new": {"data/c.lance": CachedFile(etag="c", size=40)},
+    }
+    other_process = fake_minio_cache(monkeypatch, tmp_path, remote)
+    cache = fake_minio_cache(monkeypatch, tmp_path, remote)
+    assert await other_process.sync("read")
+    assert await cache.sync("unread")
+    # unread deleted remotely: this process stops reading its mirror
+    del remote["unread"]
+    assert not await cache.sync("unread")
+
+    # the least recently used table is read by the other process: the next one is evicted instead
+    assert await cache.sync("new")
+    assert (tmp_path / "read.lance").exists()
+    assert not (tmp_path / "unread.lance").exists()
+    assert (tmp_path / "new.lance/data/c.lance").exists()
+
+    # a table being synced is not evicted either
+    del remote["read"]
+    assert not await other_process.sync("read")
+    remote["new"]["data/d.lance"] = CachedFile(etag="d", size=20)
+    with (tmp_path / "read.lock").open("w") as sync_lock:
+        fcntl.flock(sync_lock, fcntl.LOCK_EX)
+        assert await cache.sync("new")
+        assert (tmp_path / "read.lance").exists()
+    remote["new"]["data/e.lance"] = CachedFile(etag="e", size=1)
+    assert await cache.sync("new")
+    assert not (tmp_path / "read.lance").exists()
+
+
+@pytest.mark.anyio
+async def test_table_too_big_deleted_by_last_reader(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    remote = {"big": {"data/a.lance": CachedFile(etag="a", size=50)}}
+    other_process = fake_minio_cache(monkeypatch, tmp_path, remote)
+    cache = fake_minio_cache(monkeypatch, tmp_path, remote)
+    assert await other_process.sync("big")
+    assert await cache.sync("big")
+
+    remote["big"]["data/b.lance"] = CachedFile(etag="b", size=60)
+    assert not await cache.sync("big")
+    assert (tmp_path / "big.lance").exists()  # still read by the other process
+    assert not await other_process.sync("big")
+    assert not (tmp_path / "big.lance").exists()
@@ -0,0 +1,37 @@
+import asyncio
+import pathlib
+
+import pytest
+
+from common.notification_relay import NotificationRelay, NotificationRelaySettings
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_leader_forwards_notifications(tmp_path: pathlib.Path) -> None:
+    settings = NotificationRelaySettings(path=tmp_path)
+    leader = NotificationRelay(settings, "changes")
+    follower = NotificationRelay(settings, "changes")
+    assert leader.acquire_leadership()
+    assert not follower.acquire_leadership()
+
+    received: list[str] = []
+    await leader.serve()
+    async with follower.follow(received.append) as is_following:
+        await asyncio.sleep(0.05)  # followers are registered once accepted
+        leader.forward('{"seq": 1}')
+        leader.forward('{"seq": 2}')
+        await asyncio.sleep(0.05)
+        assert received == ['{"seq": 1}', '{"seq": 2}']
+
+        # the leader stops: its followers are disconnected, and one of them can take over
+        await leader.stop_serving()
+        leader.release_leadership()
+        await asyncio.sleep(0.05)
+        assert not is_following()
+    assert follower.acquire_leadership()
+    follower.release_leadership()
@@ -0,0 +1,162 @@
+import datetime as dt
+import json
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.app_services import get_db_service, get_document_catalog
+from app.rest_api import router
+from app.rest_api_data import ApiExplorer
+from app.settings import Settings, get_settings
+from common.db_service import (
+    DbDocument,
+    DbDocumentStatus,
+    DbIndexedDocumentEvent,
+    TableIndexedDocumentStatusEnum,
+)
+
+
+def db_doc(uri: str) -> DbDocument:
+    return DbDocument(
+        uri=uri,
+        indexed_document_id=uuid4(),
+        indexed_source_version=None,
+        status=DbDocumentStatus(
+            status=TableIndexedDocumentStatusEnum.pending,
+            last_status_change=datetime.now(tz=dt.UTC),
+            error_status_message=None,
+        ),
+        last_indexing=None,
+        indexed_content=None,
+    )
+
+
+class FakeDbService:
+    docs: list[DbDocument]
+    changes: list[DbIndexedDocumentEvent]  # ordered by seq, older ones pruned
+    last_seq: int
+
+    def __init__(self, docs: list[DbDocument]) -> None:
+        self.docs = sorted(docs, key=lambda doc: doc.uri)
+        self.changes = []
+        self.last_seq = 0
+
+    def change(self, uri: str, doc: DbDocument | None) -> None:
+        self.last_seq += 1
+        self.changes.append(
+            DbIndexedDocumentEvent(
+                seq=self.last_seq,
+                event_type="update" if doc else "delete",
+                uri=uri,
+                indexer_version=1,
+                document=doc,
+            ),
+        )
+
+    async def get_last_document_change_seq(self) -> int:
+        return self.last_seq
+
+    async def get_first_document_change_seq(self) -> int | None:
+        return self.changes[0].seq if self.changes else None
+
+    async def get_documents_page(self, _: int, after_uri: str | None, limit: int) -> list[DbDocument]:
+        return [doc for doc in self.docs if after_uri is None or doc.uri > after_uri][:limit]
+
+    async def get_document_changes(
+        self,
+        since_seq: int,
+        limit: int,
+        _: int,
+        until_seq: int,
+    ) -> tuple[list[DbIndexedDocumentEvent], list[int]]:
+        events = [event for event in self.changes if since_seq < event.seq <= until_seq][:limit]
+        return events, [event.seq for event in events]
+
+
+@pytest.fixture
+def db() -> FakeDbService:
+    return FakeDbService([db_doc(uri) for uri in ["a", "b", "c"]])
+
+
+@pytest.fixture
+def client(db: FakeDbService) -> TestClient:
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_settings] = lambda: Settings.model_construct(indexer_version=1)
+    app.dependency_overrides[get_db_service] = lambda: db
+    app.dependency_overrides[get_document_catalog] = lambda: None
+    return TestClient(app)
+
+
+def get_explorer(client: TestClient, **params: str | int) -> ApiExplorer:
+    response = client.get("/api/v1/explorer", params=params)
+    assert response.status_code == 200
+    return ApiExplorer.model_validate(response.json())
+
+
+def test_explorer_pages(client: TestClient) -> None:
+    first_page = get_explorer(client, limit=2)
+    assert [doc.uri for doc in first_page.documents] == ["a", "b"]
+    assert first_page.next_after == "b"
+    last_page = get_explorer(client, limit=2, after="b")
+    assert [doc.uri for doc in last_page.documents] == ["c"]
+    assert last_page.next_after is None
+
+
+def test_explorer_not_modified(client: TestClient, db: FakeDbService) -> None:
+    db.change("a", db.docs[0])
+    response = client.get("/api/v1/explorer")
+    etag = response.headers["ETag"]
+    assert etag == 'W/"1-1"'
+
+    response = client.get("/api/v1/explorer", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    # modified by a change
+    db.change("b", db.docs[1])
+    response = client.get("/api/v1/explorer", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == 'W/"1-2"'
+
+
+def test_explorer_changes_since(client: TestClient, db: FakeDbService) -> None:
+    db.change("a", db.docs[0])
+    seq = get_explorer(client).seq
+    db.change("b", db.docs[1])
+    db.change("c", None)
+    db.change("d", db_doc("d"))
+
+    delta = get_explorer(client, since=seq, limit=2)
+    assert [doc.uri for doc in delta.documents] == ["b"]
+    assert delta.deleted_uris == ["c"]
+    assert delta.next_since == 3
+    delta = get_explorer(client, since=delta.next_since, limit=2)
+    assert [doc.uri for doc in delta.documents] == ["d"]
+    assert delta.next_since is None
+    assert delta.seq == 4
+    # up to date
+    delta = get_explorer(client, since=delta.seq)
+    assert delta.documents == []
+    assert delta.seq == 4
+
+
+def test_explorer_changes_pruned(client: TestClient, db: FakeDbService) -> None:
+    for uri in ["a", "b", "c"]:
+        db.change(uri, None)
+    db.changes = db.changes[2:]  # pruned
+    assert client.get("/api/v1/explorer", params={"since": 1}).status_code == 410
+    assert get_explorer(client, since=2).deleted_uris == ["c"]
+
+
+def test_explorer_stream(client: TestClient, db: FakeDbService) -> None:
+    db.change("a", db.docs[0])
+    with client.stream("GET", "/api/v1/explorer/stream") as response:
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.headers["ETag"] == 'W/"1-1"'
+        assert response.headers["X-Explorer-Seq"] == "1"
+        lines = list(response.iter_lines())
+    assert [json.loads(line)["uri"] for line in lines] == ["a", "b", "c"]
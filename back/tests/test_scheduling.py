@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from indexer.scheduling import IndexingPriority, SchedulingSettings, indexing_delay
+from indexer.source import SourceDocumentReference
+
+settings = SchedulingSettings()
+
+
+def delay(uri: str, size: int | None, priority: IndexingPriority = IndexingPriority.interactive) -> timedelta:
+    return indexing_delay(SourceDocumentReference(uri=uri, source_version_id="v1", size=size), priority, settings)
+
+
+def test_live_upload_before_reconciliation() -> None:
+    # a big pdf uploaded by a user goes ahead of a small file found on startup
+    assert delay("big.pdf", 50_000_000) < delay("small.md", 1_000, IndexingPriority.reconciliation)
+
+
+def test_cheap_files_first() -> None:
+    assert delay("small.md", 100_000) < delay("small.docx", 100_000) < delay("small.pdf", 100_000)
+    assert delay("doc.pdf", 100_000) < delay("doc.pdf", 10_000_000)
+
+
+def test_cost_delay_is_capped() -> None:
+    # so that a huge document enqueued long ago still ends up ahead of new documents
+    assert delay("huge.pdf", 10_000_000_000) == settings.max_cost_delay
+    assert delay("huge.pdf", 10_000_000_000, IndexingPriority.reconciliation) == (
+        settings.max_cost_delay + settings.reconciliation_delay
+    )
+
+
+def test_unknown_size() -> None:
+    assert delay("doc.pdf", None) == delay("doc.pdf", settings.default_size)
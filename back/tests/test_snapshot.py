@@ -0,0 +1,42 @@
+import pathlib
+
+import lancedb
+import numpy as np
+import pytest
+
+from common.vector_db import (
+    append_missing_documents,
+    count_batch_rows_by_parsed_hash,
+    embedding_dim,
+    fingerprint_metadata_key,
+    get_chunk_table_schema,
+    row_parsed_content_hash,
+)
+from indexer.snapshot import read_batches, write_batches
+from tests.test_vector_db import chunk_table, lance_db_settings
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_table_round_trip(tmp_path: pathlib.Path) -> None:
+    settings = lance_db_settings()
+    vectors = np.random.default_rng(0).standard_normal((20, embedding_dim)).astype(np.float32)
+    parsed_hashes = [f"doc{i // 5}" for i in range(20)]
+    source = await chunk_table(tmp_path, vectors, settings, parsed_hashes, "source")
+    schema = get_chunk_table_schema(embedding_dim, settings).with_metadata({fingerprint_metadata_key: b"fingerprint"})
+    target = await (await lancedb.connect_async(str(tmp_path))).create_table("target", schema=schema)
+    path = tmp_path / "chunk.arrow"
+
+    batches = await source.query().to_batches(max_batch_length=3)
+    assert await write_batches(path, await source.schema(), batches, lambda _: None) == 20
+    source_counts = await count_batch_rows_by_parsed_hash(read_batches(path))
+    assert source_counts == {f"doc{i}": 5 for i in range(4)}
+    assert await append_missing_documents(read_batches(path), "chunk", source_counts, target, lambda *_: None) == 20
+
+    assert await target.count_rows(f"{row_parsed_content_hash} = 'doc3'") == 5
+    assert (await target.schema()).metadata == schema.metadata  # target metadata is kept
+    assert await append_missing_documents(read_batches(path), "chunk", source_counts, target, lambda *_: None) == 0
@@ -0,0 +1,79 @@
+import asyncio
+import datetime as dt
+from datetime import datetime, timedelta
+from typing import cast
+from uuid import uuid4
+
+import pytest
+
+from app.table_refresher import TableRefresher
+from common.db_service import (
+    DbDocument,
+    DbDocumentStatus,
+    DbEventSubscription,
+    DbIndexedDocumentEvent,
+    DbResyncEvent,
+    DbService,
+    TableIndexedDocumentStatusEnum,
+)
+from common.vector_db import VectorDB
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def doc_event(uri: str, status: TableIndexedDocumentStatusEnum, indexer_version: int = 1) -> DbIndexedDocumentEvent:
+    doc = DbDocument(
+        uri=uri,
+        indexed_document_id=uuid4(),
+        indexed_source_version=None,
+        status=DbDocumentStatus(status=status, last_status_change=datetime.now(tz=dt.UTC), error_status_message=None),
+        last_indexing=None,
+        indexed_content=None,
+    )
+    return DbIndexedDocumentEvent(seq=1, event_type="update", uri=uri, indexer_version=indexer_version, document=doc)
+
+
+class FakeDbService:
+    subscription: DbEventSubscription
+
+    async def listen_to_indexed_documents_changes(self, max_pending_events: int, _: int) -> DbEventSubscription:
+        self.subscription = DbEventSubscription(1, max_pending_events)
+        return self.subscription
+
+    async def removed_listener_to_indexed_documents_changes(self, _: DbEventSubscription) -> None:
+        pass
+
+
+class FakeVectorDB:
+    nb_refreshes = 0
+
+    async def refresh(self) -> None:
+        self.nb_refreshes += 1
+
+
+def test_refresh_on_indexing_success_only() -> None:
+    refresher = TableRefresher(cast("DbService", None), cast("VectorDB", None), 1, timedelta(0))
+    assert refresher.needs_refresh(doc_event("a", TableIndexedDocumentStatusEnum.indexing_success))
+    assert not refresher.needs_refresh(doc_event("a", TableIndexedDocumentStatusEnum.indexing))
+    assert not refresher.needs_refresh(doc_event("a", TableIndexedDocumentStatusEnum.indexing_success, 2))
+    assert refresher.needs_refresh(DbResyncEvent(dropped_events=3))
+
+
+@pytest.mark.anyio
+async def test_indexing_burst_refreshed_once() -> None:
+    db = FakeDbService()
+    vector_db = FakeVectorDB()
+    refresher = TableRefresher(cast("DbService", db), cast("VectorDB", vector_db), 1, timedelta(milliseconds=50))
+    await refresher.start_if_needed()
+    try:
+        assert vector_db.nb_refreshes == 1
+        for uri in ["a", "b", "c"]:
+            db.subscription.push(doc_event(uri, TableIndexedDocumentStatusEnum.indexing_success))
+        db.subscription.push(doc_event("d", TableIndexedDocumentStatusEnum.pending))
+        await asyncio.sleep(0.2)
+        assert vector_db.nb_refreshes == 2
+    finally:
+        await refresher.stop()
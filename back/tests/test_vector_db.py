@@ -0,0 +1,258 @@
+import asyncio
+import pathlib
+
+import lancedb
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from common import vector_db as vector_db_module
+from common.document import Chunk, EmbeddedChunk, Embedding, ParsedDocument
+from common.minio_service import MinioSettings
+from common.vector_db import (
+    LanceDbSettings,
+    Quantization,
+    StageVersions,
+    VectorDB,
+    binary_quantize,
+    copy_missing_documents,
+    document_vector,
+    embedding_dim,
+    get_chunk_table_schema,
+    get_doc_vector_table_schema,
+    in_parsed_hashes,
+    row_distance,
+    row_parsed_content_hash,
+    row_start_index_in_doc,
+    search_chunk_table,
+    search_doc_vector_table,
+    to_chunk_table,
+    truncate,
+    vector_distances,
+)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def lance_db_settings(
+    quantization: Quantization = "none",
+    candidate_dimensions: int | None = None,
+    document_vectors: bool = False,
+) -> LanceDbSettings:
+    minio = MinioSettings(endpoint="localhost:9000", access_key="", secret_key="", use_tls=False, bucket="test")
+    return LanceDbSettings(
+        minio=minio,
+        read_consistency_interval=0,
+        quantization=quantization,
+        candidate_dimensions=candidate_dimensions,
+        rescoring_factor=8,
+        document_vectors=document_vectors,
+    )
+
+
+def random_vectors(nb: int) -> np.ndarray:
+    vectors = np.random.default_rng(0).standard_normal((nb, embedding_dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+async def chunk_table(
+    path: pathlib.Path,
+    vectors: np.ndarray,
+    settings: LanceDbSettings,
+    parsed_hashes: list[str] | None = None,
+    table_name: str = "chunks",
+) -> lancedb.AsyncTable:
+    db = await lancedb.connect_async(str(path))
+    nb = len(vectors)
+    schema = get_chunk_table_schema(embedding_dim, settings)
+    hashes = parsed_hashes or ["hash"] * nb
+    table = to_chunk_table(vectors, hashes, list(range(nb)), list(range(1, nb + 1)), schema, settings)
+    return await db.create_table(table_name, table)
+
+
+def test_binary_quantize() -> None:
+    vectors = np.array([[1.0, -1.0] * (embedding_dim // 2)])
+    assert binary_quantize(vectors).tolist() == [[0b10101010] * (embedding_dim // 8)]
+
+
+def test_truncate() -> None:
+    truncated = truncate(random_vectors(3), 128)
+    assert truncated.shape == (3, 128)
+    assert np.linalg.norm(truncated, axis=1) == pytest.approx(1)
+
+
+def test_vector_distances() -> None:
+    vectors = random_vectors(3)
+    assert vector_distances(vectors, vectors[1], "cosine").argmin() == 1
+    assert vector_distances(vectors, vectors[1], "L2")[1] == pytest.approx(0)
+
+
+def test_binary_and_candidate_dimensions_exclusive() -> None:
+    with pytest.raises(ValueError, match="cannot be used together"):
+        lance_db_settings("binary", candidate_dimensions=256)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    ("quantization", "candidate_dimensions"),
+    [("none", None), ("int8", None), ("binary", None), ("none", 256), ("int8", 256)],
+)
+async def test_search_chunk_table(
+    tmp_path: pathlib.Path,
+    quantization: Quantization,
+    candidate_dimensions: int | None,
+) -> None:
+    settings = lance_db_settings(quantization, candidate_dimensions)
+    vectors = random_vectors(200)
+    table = await chunk_table(tmp_path, vectors, settings)
+    query = vectors[42] + 0.1 * random_vectors(1)[0]
+    result = await search_chunk_table(table, query.tolist(), 5, "cosine", settings)
+    assert result.num_rows == 5
+    assert result[row_start_index_in_doc][0].as_py() == 42
+    distances = result[row_distance].to_pylist()
+    assert distances == sorted(distances)
+
+
+def test_document_vector() -> None:
+    vectors = random_vectors(4)
+    doc_vector = document_vector(vectors)
+    assert doc_vector is not None
+    assert np.linalg.norm(doc_vector.astype(np.float32)) == pytest.approx(1, abs=1e-3)
+    assert document_vector(vectors[:0]) is None
+
+
+@pytest.mark.anyio
+async def test_search_documents_first(tmp_path: pathlib.Path) -> None:
+    settings = lance_db_settings(document_vectors=True)
+    vectors = random_vectors(40)
+    parsed_hashes = [f"doc{i // 10}" for i in range(40)]  # 4 documents of 10 chunks
+    db = await lancedb.connect_async(str(tmp_path))
+    doc_vectors = [document_vector(vectors[i : i + 10]) for i in range(0, 40, 10)]
+    schema = get_doc_vector_table_schema(embedding_dim)
+    doc_vector_table = await db.create_table(
+        "doc_vectors",
+        pa.Table.from_arrays(
+            [
+                pa.array(["doc0", "doc1", "doc2", "doc3"]),
+                pa.array([list(v) for v in doc_vectors], type=schema.field(1).type),
+            ],
+            schema=schema,
+        ),
+    )
+    table = await chunk_table(tmp_path, vectors, settings, parsed_hashes)
+
+    assert await search_doc_vector_table(doc_vector_table, doc_vectors[2].tolist(), 1, "cosine") == ["doc2"]
+    # chunks are only searched in the given documents
+    result = await search_chunk_table(table, vectors[5].tolist(), 3, "cosine", settings, in_parsed_hashes(["doc2"]))
+    assert set(result[row_parsed_content_hash].to_pylist()) == {"doc2"}
+
+
+def test_stage_versioned_table_names() -> None:
+    settings = lance_db_settings()
+    legacy = VectorDB(settings, "cosine", indexer_version=3)
+    assert (legacy.parsed_doc_table_name, legacy.chunk_table_name) == ("parsed_doc_v3", "chunk_v3")
+
+    # a new indexer version with a new chunker reuses the parsed docs
+    v3 = VectorDB(settings, "cosine", 3, stage_versions=StageVersions(parser=1, chunker=1, embedder=1))
+    v4 = VectorDB(settings, "cosine", 4, stage_versions=StageVersions(parser=1, chunker=2, embedder=1))
+    assert v3.parsed_doc_table_name == v4.parsed_doc_table_name == "parsed_doc_p1"
+    assert (v3.chunk_table_name, v4.chunk_table_name) == ("chunk_p1_c1_e1", "chunk_p1_c2_e1")
+
+
+@pytest.mark.anyio
+async def test_copy_missing_documents(tmp_path: pathlib.Path) -> None:
+    settings = lance_db_settings()
+    vectors = random_vectors(30)
+    parsed_hashes = [f"doc{i // 10}" for i in range(30)]  # 3 documents of 10 chunks
+    source = await chunk_table(tmp_path, vectors, settings, parsed_hashes, "source")
+    target = await chunk_table(tmp_path, vectors[10:20], settings, parsed_hashes[10:20], "target")
+    progress: list[int] = []
+
+    # batches smaller than documents: documents are still appended whole
+    nb_copied = await copy_missing_documents(source, target, 4, lambda _, nb_read, __: progress.append(nb_read))
+
+    assert nb_copied == 20
+    assert progress[-1] == 30
+    for parsed_hash in ["doc0", "doc1", "doc2"]:
+        assert await target.count_rows(f"{row_parsed_content_hash} = '{parsed_hash}'") == 10
+    assert await copy_missing_documents(source, target, 4, lambda *_: None) == 0
+
+
+@pytest.mark.anyio
+async def test_copy_resumed_with_interleaved_documents(tmp_path: pathlib.Path) -> None:
+    settings = lance_db_settings()
+    vectors = random_vectors(30)
+    parsed_hashes = [f"doc{i % 3}" for i in range(30)]  # rows of the 3 documents interleaved
+    source = await chunk_table(tmp_path, vectors, settings, parsed_hashes, "source")
+    # interrupted copy: 4 of the 10 rows of doc0 were copied
+    target = await chunk_table(tmp_path, vectors[0:12:3], settings, parsed_hashes[0:12:3], "target")
+
+    assert await copy_missing_documents(source, target, 4, lambda *_: None) == 30
+    for parsed_hash in ["doc0", "doc1", "doc2"]:
+        assert await target.count_rows(f"{row_parsed_content_hash} = '{parsed_hash}'") == 10
+    assert await copy_missing_documents(source, target, 4, lambda *_: None) == 0
+
+
+@pytest.mark.anyio
+async def test_concurrent_first_calls_connect_once(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    vector_db = VectorDB(LanceDbSettings(local_path=str(tmp_path)), "cosine", 1)
+    connect = vector_db_module.connect
+    nb_connections = 0
+
+    async def counting_connect(settings: LanceDbSettings) -> lancedb.AsyncConnection:
+        nonlocal nb_connections
+        nb_connections += 1
+        return await connect(settings)
+
+    monkeypatch.setattr(vector_db_module, "connect", counting_connect)
+    await asyncio.gather(*[vector_db.warm_up() for _ in range(5)])
+    assert nb_connections == 1
+
+
+async def nb_unindexed_rows(table: lancedb.AsyncTable) -> int:
+    (index,) = await table.list_indices()
+    stats = await table.index_stats(index.name)
+    assert stats is not None
+    return stats.num_unindexed_rows
+
+
+@pytest.mark.anyio
+async def test_vector_index_updated_by_optimize(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    settings = LanceDbSettings(
+        local_path=str(tmp_path),
+        read_consistency_interval=0,
+        quantization="int8",
+        min_rows_for_vector_index=300,
+    )
+    vector_db = VectorDB(settings, "cosine", 1)
+    await vector_db.connect_if_needed()
+    chunk_table = vector_db._chunk_table  # noqa: SLF001
+    count_rows = chunk_table.count_rows
+    nb_counts = 0
+
+    async def counting_count_rows(filter: str | None = None) -> int:  # noqa: A002
+        nonlocal nb_counts
+        nb_counts += filter is None
+        return await count_rows(filter)
+
+    monkeypatch.setattr(chunk_table, "count_rows", counting_count_rows)
+    vectors = random_vectors(400)
+    for doc in range(4):
+        chunks = [
+            EmbeddedChunk(
+                chunk=Chunk(start_index_in_doc=i, end_index_in_doc=i + 1),
+                embedding=Embedding(embedding=vectors[doc * 100 + i].tolist()),
+            )
+            for i in range(100)
+        ]
+        await vector_db.index(ParsedDocument(hash=f"doc{doc}", markdown_content="x" * 100), chunks)
+    # rows counted once, the index is created with the third document
+    assert nb_counts == 1
+    assert await nb_unindexed_rows(chunk_table) == 100
+
+    # rebuilt once more than 10% of the chunks are not indexed
+    await vector_db.optimize()
+    assert await nb_unindexed_rows(chunk_table) == 0
@@ -54,8 +54,20 @@ export const postToApi = async <TInput, TOutput>(
   return (await response.json()) as TOutput
 }
 
-export const get_explorer = (): Promise<ApiExplorer> =>
-  fetchApi<ApiExplorer>('explorer')
+// load all explorer pages (keyset pagination on uri)
+export const get_explorer = async (): Promise<ApiExplorer> => {
+  const firstPage = await fetchApi<ApiExplorer>('explorer')
+  const documents = [...firstPage.documents]
+  let nextAfter = firstPage.next_after
+  while (nextAfter !== null) {
+    const page = await fetchApi<ApiExplorer>(
+      `explorer?after=${encodeURIComponent(nextAfter)}`,
+    )
+    documents.push(...page.documents)
+    nextAfter = page.next_after
+  }
+  return { ...firstPage, documents, next_after: null }
+}
 
 export const getParsedDocument = (
   encoded_uri: string,
@@ -86,6 +98,7 @@ export const subscribeToDocumentEvents = async (
   abortController: AbortController,
   onUpdate: (update: ApiDocumentSnippet) => void,
   onDelete: (update: ApiDocumentDelete) => void,
+  onResync: () => void,
 ): Promise<void> => {
   await fetchEventSource(`${apiUrl}/document_events`, {
     method: 'GET',
@@ -100,6 +113,9 @@ export const subscribeToDocumentEvents = async (
       } else if (event.event === 'update') {
         const documentSnippet: ApiDocumentSnippet = JSON.parse(event.data)
         onUpdate(documentSnippet)
+      } else if (event.event === 'resync') {
+        // events were dropped server side because we were too slow, reload the snapshot
+        onResync()
       }
     },
   })
@@ -11,6 +11,10 @@ export interface ApiDocumentDelete {
 
 export interface ApiExplorer {
   documents: Array<ApiDocumentSnippet>
+  seq: number
+  next_after: string | null
+  deleted_uris: Array<string>
+  next_since: number | null
 }
 
 export interface ApiSearchResultChunk {
@@ -144,12 +144,15 @@ export const userConvStore = create<
     },
 
     listenToDocumentEvents: async () => {
-      const explorer = await get_explorer()
-      set((state) => {
-        state.documents = Object.fromEntries(
-          explorer.documents.map((doc) => [doc.uri, doc]),
-        )
-      })
+      const loadExplorer = async () => {
+        const explorer = await get_explorer()
+        set((state) => {
+          state.documents = Object.fromEntries(
+            explorer.documents.map((doc) => [doc.uri, doc]),
+          )
+        })
+      }
+      await loadExplorer()
 
       // Subscribe to document events
       const abortController = new AbortController()
@@ -165,6 +168,9 @@ export const userConvStore = create<
             delete state.documents[deleted.uri]
           })
         },
+        () => {
+          loadExplorer()
+        },
       )
 
       return true